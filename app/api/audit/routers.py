@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
+
+from app.api.audit.schemas import AuditLogPage, AuditLogQuery
+from app.api.audit.services import audit_service
+from app.core.database import get_read_session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.httpbearer import get_current_user
+
+router = APIRouter()
+
+
+@router.get("", response_model=AuditLogPage)
+async def get_audit_logs(params: AuditLogQuery = Depends(), db: AsyncSession = Depends(get_read_session),
+                         current_user=Depends(get_current_user)):
+    result = await audit_service(db).list_audit_logs(current_user, params)
+    # Rows are already shaped like `AuditLogPage`, skip re-validating every item
+    return ORJSONResponse(result)
@@ -0,0 +1,26 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class AuditLogQuery(BaseModel):
+    cursor: Optional[str] = None
+    limit: int = Field(100, ge=1, le=1000)
+    actor: Optional[str] = None
+    action: Optional[str] = None
+    target: Optional[str] = None  # target prefix
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+
+
+class AuditLogItem(BaseModel):
+    id: str
+    timestamp: datetime
+    admin_username: Optional[str] = None
+    action: Optional[str] = None
+    target: Optional[str] = None
+
+
+class AuditLogPage(BaseModel):
+    items: List[AuditLogItem]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,57 @@
+from datetime import timezone
+
+from fastapi import HTTPException
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.users.models import AuditLog
+from app.utils.authz import require_admin
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def naive_utc(moment):
+    # audit_logs.timestamp is stored as naive UTC
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class audit_service:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def list_audit_logs(self, current_user, params):
+        """
+        Newest-first keyset pagination on (timestamp, id). A time range lets
+        Postgres prune to the matching monthly partitions.
+        """
+        await require_admin(current_user)
+
+        since, until = naive_utc(params.since), naive_utc(params.until)
+        if since and until and since >= until:
+            raise HTTPException(status_code=400, detail="'since' must be before 'until'")
+
+        query = select(AuditLog.id, AuditLog.timestamp, AuditLog.admin_username, AuditLog.action, AuditLog.target)
+        if params.actor:
+            query = query.where(AuditLog.admin_username == params.actor)
+        if params.action:
+            query = query.where(AuditLog.action == params.action)
+        if params.target:
+            query = query.where(AuditLog.target.startswith(params.target, autoescape=True))
+        if since:
+            query = query.where(AuditLog.timestamp >= since)
+        if until:
+            query = query.where(AuditLog.timestamp < until)
+        if params.cursor:
+            timestamp, row_id = decode_cursor(params.cursor)
+            query = query.where(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(timestamp, row_id))
+
+        result = await self.db.execute(
+            query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(params.limit + 1))
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > params.limit:
+            last = rows[params.limit - 1]
+            next_cursor = encode_cursor(last.timestamp, last.id)
+        return {"items": [row._asdict() for row in rows[:params.limit]], "next_cursor": next_cursor}
@@ -1,7 +1,7 @@
 from functools import partial
 import os
 from httpx import get
-from sqlalchemy import Boolean, Column, ForeignKey, String,event   
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, LargeBinary, String, UniqueConstraint,event   
 from sqlalchemy.orm import relationship
 from app.core.database import Base, get_session
 from app.utils.ip_pool import populate_ip_pool
@@ -21,11 +21,46 @@ class WireGuardPeer(Base):
     wg_server = relationship("WGServerConfig", back_populates="peers")
 
 
-class WireGuardIPPool(Base):
-    __tablename__ = "wireguard_ip_pool"
+class WireGuardIPAllocation(Base):
+    """Address pool of one subnet stored as a bitmap, see `app.utils.ip_pool.IPAllocator`."""
+    __tablename__ = "wireguard_ip_allocations"
 
-    ip_address = Column(String, index=True)
-    is_assigned = Column(Boolean, default=False)
+    subnet = Column(String, unique=True, nullable=False)
+    bitmap = Column(LargeBinary, nullable=False)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class PeerUsageBucket(Base):
+    """Traffic of one peer over one minute/hour/day, see `app.utils.peer_usage`."""
+    __tablename__ = "peer_usage_buckets"
+
+    peer_id = Column(String, nullable=False)
+    resolution = Column(String(8), nullable=False)  # minute | hour | day
+    bucket_start = Column(DateTime, nullable=False)
+    rx_bytes = Column(BigInteger, nullable=False, default=0)
+    tx_bytes = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("peer_id", "resolution", "bucket_start", name="uq_peer_usage_bucket"),
+        Index("ix_peer_usage_resolution_start", "resolution", "bucket_start"),
+    )
+
+
+class PeerAccount(Base):
+    """Monotonic traffic totals and monthly quota of a peer, see `app.utils.peer_accounting`."""
+    __tablename__ = "peer_accounts"
+
+    peer_id = Column(String, ForeignKey("wireguard_peers.id", ondelete="CASCADE"), unique=True, nullable=False)
+    # Raw interface counters at the last flush, used to detect resets across restarts
+    last_rx = Column(BigInteger, nullable=False, default=0)
+    last_tx = Column(BigInteger, nullable=False, default=0)
+    total_rx_bytes = Column(BigInteger, nullable=False, default=0)
+    total_tx_bytes = Column(BigInteger, nullable=False, default=0)
+    period_start = Column(DateTime, nullable=False)
+    period_rx_bytes = Column(BigInteger, nullable=False, default=0)
+    period_tx_bytes = Column(BigInteger, nullable=False, default=0)
+    monthly_quota_bytes = Column(BigInteger, nullable=True)
+    disabled_at = Column(DateTime, nullable=True)
 
 
 
@@ -37,7 +72,7 @@ async def async_populate_ip_pool(subnet: str):
 
 
 def after_create(target, connection, **kw):
-    """Run `populate_ip_pool()` after `wireguard_ip_pool` is created."""
+    """Run `populate_ip_pool()` after `wireguard_ip_allocations` is created."""
     subnet = os.getenv("ALLOWED_IPS")
     if not subnet:
         raise ValueError("ALLOWED_IPS environment variable is not set")
@@ -49,4 +84,4 @@ def after_create(target, connection, **kw):
 
 
 # # Register the event listener to populate IP pool after table creation
-# event.listen(WireGuardIPPool.__table__, "after_create", after_create)
\ No newline at end of file
+# event.listen(WireGuardIPAllocation.__table__, "after_create", after_create)
\ No newline at end of file
@@ -1,35 +1,77 @@
 
 
-from typing import List
-from fastapi import APIRouter, Depends
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
-from app.api.peers.schemas import AddPeerRequest, DeletePeer, EditPeer, TransferData
+from app.api.peers.schemas import AddPeerRequest, BulkAddPeerRequest, BulkDeletePeerRequest, DeletePeer, EditPeer, PeerListQuery, PeerPage, PeerQuota, PeerResponse, TransferData, TransferDataResponse
 from .services import peer_service
-from app.core.database import get_session
-from app.utils.httpbearer import get_current_user
+from app.core.database import get_read_session, get_session
+from app.utils.httpbearer import get_current_user, get_websocket_user
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
 
-@router.get("")
-async def get_peers(db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    result = await peer_service(db).get_all_peers(current_user)
+# Listings return the response directly: rows are already shaped like `PeerPage`,
+# so FastAPI skips re-validating every item and orjson encodes the dicts as they are
+@router.get("", response_model=PeerPage)
+async def get_peers(params: PeerListQuery = Depends(), db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).get_all_peers(current_user, params)
+    return ORJSONResponse(result)
+
+@router.get("/users/{user_id}", response_model=PeerPage)
+async def get_peers(user_id: str, params: PeerListQuery = Depends(), db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).get_all_peers_by_id(user_id, params)
+    return ORJSONResponse(result)
+
+@router.get("/users/{user_id}/configs.zip")
+async def export_user_configs(user_id: str, db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).export_user_configs(user_id, current_user)
     return result
 
-@router.get("/users/{user_id}")
-async def get_peers(user_id: str, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
-    result = await peer_service(db).get_all_peers_by_id(user_id)
+@router.get("/users/{user_id}/usage-totals")
+async def get_user_usage_totals(user_id: str, db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).get_user_usage_totals(user_id, current_user)
     return result
 
 
-@router.get("/{peer_id}")
-async def get_single_peer(peer_id: str, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+@router.websocket("/stats/ws")
+async def peer_stats_ws(websocket: WebSocket):
+    try:
+        current_user = await get_websocket_user(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await peer_service.stream_stats_ws(websocket, current_user)
+
+
+@router.get("/stats/stream")
+async def peer_stats_stream(db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+    events = await peer_service(db).stream_stats_sse(current_user)
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/{peer_id}", response_model=PeerResponse)
+async def get_single_peer(peer_id: str, db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
     result = await peer_service(db).get_peer(peer_id)
     return result
 
 
+@router.post("/bulk")
+async def add_peers_bulk(data: BulkAddPeerRequest, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    result = await peer_service(db).add_peers_bulk(data, current_user)
+    return result
+
+
+@router.post("/bulk-delete")
+async def remove_peers_bulk(data: BulkDeletePeerRequest, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    result = await peer_service(db).remove_peers_bulk(data, current_user)
+    return result
+
+
 @router.post("/{user_id}")
 async def add_peers(user_id: str, data: AddPeerRequest, current_user=Depends(get_current_user), db: AsyncSession = Depends(get_session)):
     result = await peer_service(db).add_peer(user_id, data, current_user)
@@ -53,7 +95,28 @@ async def generate_peer_config(peer_id: str,  db: AsyncSession = Depends(get_ses
     result = await peer_service(db).generate_peer_config(peer_id, current_user)
     return result
 
-@router.get("/transfer-data/{peer_id}")
-async def get_transfer_data(peer_id: str, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+@router.get("/{peer_id}/config")
+async def get_peer_config(peer_id: str, format: Literal["conf", "qr"] = "conf",
+                          image: Literal["png", "svg"] = "png",
+                          db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).get_peer_config(peer_id, format, image, current_user)
+    return result
+
+@router.get("/{peer_id}/usage")
+async def get_peer_usage(peer_id: str,
+                         start: Optional[datetime] = Query(None, alias="from"),
+                         end: Optional[datetime] = Query(None, alias="to"),
+                         step: Optional[Literal["raw", "minute", "hour", "day"]] = None,
+                         db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).get_peer_usage(peer_id, start, end, step, current_user)
+    return result
+
+@router.put("/{peer_id}/quota")
+async def set_peer_quota(peer_id: str, data: PeerQuota, db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+    result = await peer_service(db).set_peer_quota(peer_id, data, current_user)
+    return result
+
+@router.get("/transfer-data/{peer_id}", response_model=TransferDataResponse)
+async def get_transfer_data(peer_id: str, db: AsyncSession = Depends(get_read_session), current_user=Depends(get_current_user)):
     result = await peer_service(db).get_peer_transfer_data(peer_id)
     return result
\ No newline at end of file
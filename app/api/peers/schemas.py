@@ -1,12 +1,34 @@
+from datetime import datetime
 from http import server
-from typing import Optional
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, Field, model_validator
 
 class AddPeerRequest(BaseModel):
     ip: Optional[str] = None  # ✅ ip is now optional
     peer_name: str
     
     
+class BulkPeerItem(BaseModel):
+    user_id: str
+    peer_name: str
+    ip: Optional[str] = None
+
+
+class BulkAddPeerRequest(BaseModel):
+    peers: List[BulkPeerItem] = Field(..., min_length=1, max_length=5000)
+
+
+class BulkDeletePeerRequest(BaseModel):
+    peer_ids: Optional[List[str]] = Field(None, max_length=10000)
+    user_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if not self.peer_ids and not self.user_id:
+            raise ValueError("Either peer_ids or user_id is required")
+        return self
+
+
 class DeletePeer(BaseModel):
     peer_id : str
     
@@ -15,6 +37,48 @@ class EditPeer(BaseModel):
     ip : Optional[str] = None
     peer_name : Optional[str] = None
 
+class PeerQuota(BaseModel):
+    monthly_quota_bytes: Optional[int] = Field(None, ge=0)  # None removes the quota
+
 class TransferData(BaseModel):
     rx : int
-    tx : int
\ No newline at end of file
+    tx : int
+
+
+class PeerListQuery(BaseModel):
+    cursor: Optional[str] = None
+    limit: int = Field(100, ge=1, le=1000)
+    name: Optional[str] = None  # peer_name prefix
+    server_id: Optional[str] = None
+    status: Optional[Literal["online", "offline"]] = None
+    ip_range: Optional[str] = None  # CIDR, e.g. 10.8.0.0/28
+    fields: Optional[str] = None  # comma separated, e.g. peer_name,assigned_ip
+
+
+class TransferDataResponse(BaseModel):
+    rx: int = 0
+    tx: int = 0
+    latest_handshake: Union[int, str] = "Never"
+    endpoint: str = "Unknown"
+    sampled_at: Optional[datetime] = None
+    sample_age: Optional[float] = None
+
+
+class PeerResponse(TransferDataResponse):
+    # Everything is optional so sparse `?fields=` listings validate against the same model
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    server_id: Optional[str] = None
+    peer_name: Optional[str] = None
+    public_key: Optional[str] = None
+    private_key: Optional[str] = None
+    assigned_ip: Optional[str] = None
+    created_at: Optional[datetime] = None
+    created_by: Optional[str] = None
+    updated_at: Optional[datetime] = None
+    updated_by: Optional[str] = None
+
+
+class PeerPage(BaseModel):
+    items: List[PeerResponse]
+    next_cursor: Optional[str] = None
@@ -1,144 +1,162 @@
 import asyncio
+import orjson
 from ipaddress import IPv4Network
 import os
-import re
 import stat
-import subprocess
 import time
-from typing import Tuple
+from datetime import datetime, timedelta, timezone
 import aiofiles
-from fastapi import HTTPException
+from fastapi import HTTPException, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from httpx import get
-from sqlalchemy import select
+from sqlalchemy import cast, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import CIDR, INET
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from app.api.peers.models import WireGuardIPPool, WireGuardPeer
-from app.api.users.models import AuditLog
+from app.api.peers.models import PeerAccount, WireGuardPeer
 from app.api.wg_server.models import WGServerConfig
-from app.utils.ip_pool import get_next_available_ip
+from app.core.database import get_session, is_replica_session
+from app.logs.logging import logger
+from app.utils.audit import audit_writer
+from app.utils.authz import has_admin_role
+from app.utils.peer_stream import peer_stats_broadcaster
+from app.utils.peer_usage import default_step, query_usage, usage_recorder
+from app.utils.peer_accounting import month_start
+from app.utils.peer_configs import QR_MEDIA_TYPES, config_cache, config_filename, stream_config_zip
+from app.utils.pagination import keyset_paginate, page, parse_fields, pick_fields
+from app.utils.ip_pool import allocate_ips, invalidate_allocator, release_ips
+from app.utils.wg_driver import get_wg_driver
+from app.utils.wg_keys import key_pool
+from app.utils.wg_persist import config_writer
+from app.utils.wg_telemetry import empty_transfer_data, telemetry_cache
 from app.core.config import settings
 
 
+TELEMETRY_FIELDS = {"rx", "tx", "latest_handshake", "endpoint", "sampled_at", "sample_age"}
+PEER_COLUMNS = (
+    WireGuardPeer.id, WireGuardPeer.user_id, WireGuardPeer.server_id, WireGuardPeer.peer_name,
+    WireGuardPeer.public_key, WireGuardPeer.private_key, WireGuardPeer.assigned_ip,
+    WireGuardPeer.created_at, WireGuardPeer.created_by, WireGuardPeer.updated_at, WireGuardPeer.updated_by
+)
+PEER_FIELDS = {column.key for column in PEER_COLUMNS} | TELEMETRY_FIELDS
+CONFIG_COLUMNS = (
+    WireGuardPeer.id, WireGuardPeer.user_id, WireGuardPeer.server_id, WireGuardPeer.peer_name,
+    WireGuardPeer.private_key, WireGuardPeer.assigned_ip,
+    WGServerConfig.public_key.label("server_public_key"), WGServerConfig.server_ips
+)
+
+
 class peer_service:
     def __init__(self, db: AsyncSession):
         self.db = db
 
     @staticmethod
-    async def log_action(admin_username, action, target, db: AsyncSession):
-        log_entry = AuditLog(admin_username=admin_username,
-                             action=action, target=target)
-        db.add(log_entry)
-        await db.commit()
+    def peer_rows_to_dicts(rows, with_telemetry: bool = True) -> list:
+        """
+        Merge `PEER_COLUMNS` rows with the collector's in-memory snapshot, no
+        `wg` call on the request path. Each item is one dict merge of the row
+        mapping and the per-sample transfer view, not a per-field rebuild.
+        """
+        if not with_telemetry:
+            blank = {**empty_transfer_data(), "sampled_at": None, "sample_age": None}
+            return [{**row._mapping, **blank} for row in rows]
+
+        view = telemetry_cache.view
+        sample = telemetry_cache.sample_info()
+        return [{**row._mapping, **view(row.public_key), **sample} for row in rows]
+
+    async def list_peers(self, condition, params):
+        """Keyset-paginated, filtered peer listing with an optional sparse fieldset."""
+        fields = parse_fields(params.fields, PEER_FIELDS)
+
+        query = select(*PEER_COLUMNS).where(condition)
+        if params.name:
+            query = query.where(WireGuardPeer.peer_name.startswith(params.name, autoescape=True))
+        if params.server_id:
+            query = query.where(WireGuardPeer.server_id == params.server_id)
+        if params.ip_range:
+            try:
+                network = IPv4Network(params.ip_range, strict=False)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid ip_range")
+            query = query.where(
+                cast(WireGuardPeer.assigned_ip, INET).op("<<=")(cast(str(network), CIDR)))
+        if params.status:
+            online = telemetry_cache.online_public_keys(settings.peer_online_window)
+            if params.status == "online":
+                query = query.where(WireGuardPeer.public_key.in_(online))
+            else:
+                query = query.where(WireGuardPeer.public_key.not_in(online))
+
+        query = await self.db.execute(
+            keyset_paginate(query, WireGuardPeer, params.cursor, params.limit))
+        rows = query.all()
+
+        with_telemetry = fields is None or bool(fields & TELEMETRY_FIELDS)
+        items = self.peer_rows_to_dicts(rows[:params.limit], with_telemetry)
+        if fields is not None:
+            items = [pick_fields(item, fields) for item in items]
+        return page(items, rows, params.limit)
+
+    async def get_all_peers(self, current_user, params):
+        # Peers of the current user
+        return await self.list_peers(WireGuardPeer.user_id == current_user.id, params)
+
+    async def get_all_peers_by_id(self, user_id, params):
+        # Peers of the given user
+        return await self.list_peers(WireGuardPeer.user_id == user_id, params)
+
+    async def visible_peer_ids(self, current_user) -> dict:
+        """public_key -> peer ID for every peer the user may watch: all of them for admins, else their own."""
+        query = select(WireGuardPeer.public_key, WireGuardPeer.id)
+        if not await has_admin_role(current_user):
+            query = query.where(WireGuardPeer.user_id == current_user.id)
+        result = await self.db.execute(query)
+        return {public_key: peer_id for public_key, peer_id in result.all()}
 
     @staticmethod
-    def generate_wg_key_pair() -> Tuple[str, str]:
-        """Generates a WireGuard key pair (private key & public key)"""
+    async def stream_stats_ws(websocket: WebSocket, current_user):
+        """Push per-peer deltas from the shared sampler until the client goes away."""
+        async for session in get_session():
+            peer_ids = await peer_service(session).visible_peer_ids(current_user)
 
+        await websocket.accept()
+        subscriber = peer_stats_broadcaster.subscribe(peer_ids)
         try:
-            # Generate private key
-            private_key = subprocess.check_output(
-                "wg genkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-
-            # Generate public key from private key
-            public_key = subprocess.check_output(
-                f"echo {private_key} | wg pubkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-
-            return private_key, public_key
-
-        except subprocess.CalledProcessError as e:
-            # Handle subprocess errors (e.g., if WireGuard tools are missing)
-            raise RuntimeError(
-                f"Error generating WireGuard keys: {e.stderr.decode().strip()}")
-
-    async def get_all_peers(self, current_user):
-        # Fetch peers from the database for the current user
-        query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.user_id == current_user.id))
-        peers = query.scalars().all()
-
-        all_peers_data = []
-        for peer in peers:
-            transfer_data = await self.get_peer_transfer_data(peer.id)
-            peer_data = {
-                "private_key": peer.private_key,
-                "user_id": peer.user_id,
-                "server_id": peer.server_id,
-                "created_at": peer.created_at,
-                "created_by": peer.created_by,
-                "peer_name": peer.peer_name,
-                "public_key": peer.public_key,
-                "assigned_ip": peer.assigned_ip,
-                "id": peer.id,
-                "updated_at": peer.updated_at,
-                "updated_by": peer.updated_by,
-                "rx": transfer_data.get("rx", str(0)),
-                "tx": transfer_data.get("tx", str(0)),
-                "latest_handshake": transfer_data.get("latest_handshake", "Never"),
-                "endpoint": transfer_data.get("endpoint", "Unknown")
-            }
-            all_peers_data.append(peer_data)
-
-        return all_peers_data
-    
-    async def get_all_peers_by_id(self, user_id):
-        # Fetch peers from the database for the current user
-        query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.user_id == user_id))
-        peers = query.scalars().all()
-
-        all_peers_data = []
-        for peer in peers:
-            transfer_data = await self.get_peer_transfer_data(peer.id)
-            peer_data = {
-                "private_key": peer.private_key,
-                "user_id": peer.user_id,
-                "server_id": peer.server_id,
-                "created_at": peer.created_at,
-                "created_by": peer.created_by,
-                "peer_name": peer.peer_name,
-                "public_key": peer.public_key,
-                "assigned_ip": peer.assigned_ip,
-                "id": peer.id,
-                "updated_at": peer.updated_at,
-                "updated_by": peer.updated_by,
-                "rx": transfer_data.get("rx", 0),
-                "tx": transfer_data.get("tx", 0),
-                "latest_handshake": transfer_data.get("latest_handshake", "Never"),
-                "endpoint": transfer_data.get("endpoint", "Unknown")
-            }
-            all_peers_data.append(peer_data)
-
-        return all_peers_data
+            while True:
+                await websocket.send_json(await subscriber.queue.get())
+        except (WebSocketDisconnect, OSError):
+            # A send to a client that already dropped raises uvicorn's ClientDisconnected (an OSError)
+            pass
+        finally:
+            peer_stats_broadcaster.unsubscribe(subscriber)
+
+    async def stream_stats_sse(self, current_user):
+        """Server-Sent Events flavour of `stream_stats_ws`; visibility is resolved before streaming starts."""
+        peer_ids = await self.visible_peer_ids(current_user)
+        return self.sse_events(peer_ids)
 
+    @staticmethod
+    async def sse_events(peer_ids: dict):
+        subscriber = peer_stats_broadcaster.subscribe(peer_ids)
+        try:
+            while True:
+                message = await subscriber.queue.get()
+                yield f"data: {orjson.dumps(message).decode()}\n\n"
+        finally:
+            peer_stats_broadcaster.unsubscribe(subscriber)
 
     async def get_peer(self, peer_id):
         """Fetch a specific peer by ID."""
-        query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id))
-        peer = query.scalars().first()
-        if not peer:
+        query = await self.db.execute(select(*PEER_COLUMNS).where(WireGuardPeer.id == peer_id))
+        row = query.first()
+        if not row:
             raise HTTPException(status_code=404, detail="Peer not found")
-        transfer_data = await self.get_peer_transfer_data(peer.id)
-        peer_data = {
-            "private_key": peer.private_key,
-            "user_id": peer.user_id,
-            "server_id": peer.server_id,
-            "created_at": peer.created_at,
-            "created_by": peer.created_by,
-            "peer_name": peer.peer_name,
-            "public_key": peer.public_key,
-            "assigned_ip": peer.assigned_ip,
-            "id": peer.id,
-            "updated_at": peer.updated_at,
-            "updated_by": peer.updated_by,
-            "rx": transfer_data.get("rx", 0),
-            "tx": transfer_data.get("tx", 0),
-            "latest_handshake": transfer_data.get("latest_handshake", "Never")
-        }
-        return peer_data
 
-    async def add_peer(self, user_id, data, current_user):
-        assigned_ip = await get_next_available_ip(self.db, data.ip)
-        private_key, public_key = self.generate_wg_key_pair()
+        return self.peer_rows_to_dicts([row])[0]
 
+    async def add_peer(self, user_id, data, current_user):
         server = await self.db.execute(select(WGServerConfig))
         server = server.scalars().first()
 
@@ -146,35 +164,129 @@ class peer_service:
             raise HTTPException(
                 status_code=404, detail="WireGuard server config not found")
 
-        print(server.interface_name)
+        # Read before the try: a rollback expires the row and it cannot lazy load here
+        interface_name = server.interface_name
+        private_key, public_key = key_pool.get()
+        driver = get_wg_driver()
+        applied = False
+        # Address, row and interface change are committed together or not at all
+        try:
+            [assigned_ip] = await allocate_ips(self.db, [data.ip])
+            if isinstance(assigned_ip, HTTPException):
+                raise assigned_ip
+
+            new_peer = WireGuardPeer(
+                user_id=user_id,
+                peer_name=data.peer_name,
+                public_key=public_key,
+                private_key=private_key,
+                assigned_ip=assigned_ip,
+                server_id=server.id
+            )
+            self.db.add(new_peer)
+            await self.db.flush()
+
+            await driver.set_peers(interface_name, [(public_key, f"{assigned_ip}/32")])
+            applied = True
+            await self.db.commit()
+        except BaseException:
+            invalidate_allocator()
+            await self.db.rollback()
+            if applied:
+                await self.undo_on_interface(driver.remove_peers, interface_name, [public_key])
+            raise
+
+        config_writer.schedule(interface_name)
+        audit_writer.record(current_user.username, "Added peer", data.peer_name)
 
-        new_peer = WireGuardPeer(
-            user_id=user_id,
-            peer_name=data.peer_name,
-            public_key=public_key,
-            private_key=private_key,
-            assigned_ip=assigned_ip,
-            server_id=server.id
-        )
+        return {"message": "Peer Created Successfully"}
+
+    @staticmethod
+    async def undo_on_interface(action, interface_name, entries):
+        """Revert an interface change after the database rolled back; failures are logged, not raised."""
+        try:
+            await action(interface_name, entries)
+        except Exception as e:
+            logger.error(f"Could not revert WireGuard change on {interface_name}, reconcile will: {e}")
 
+    async def add_peers_bulk(self, data, current_user):
+        """Provision many peers with one allocation, one interface call, one commit and one config save."""
+        from app.api.users.models import User
+        from app.api.users.services import user_service
+
+        await user_service.is_admin(current_user)
+
+        server = await self.db.execute(select(WGServerConfig))
+        server = server.scalars().first()
         if server is None:
             raise HTTPException(
                 status_code=404, detail="WireGuard server config not found")
 
-        # Log action in the database
-        command = f"wg set {server.interface_name} peer {public_key} allowed-ips {assigned_ip}/32"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        command = f"wg-quick save {server.interface_name}"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()
+        items = data.peers
+        results = [{"index": i, "peer_name": item.peer_name, "user_id": item.user_id}
+                   for i, item in enumerate(items)]
+
+        user_ids = {item.user_id for item in items}
+        query = await self.db.execute(select(User.id).where(User.id.in_(user_ids)))
+        known_users = set(query.scalars().all())
+
+        pending = [i for i, item in enumerate(items) if item.user_id in known_users]
+        for i in set(range(len(items))) - set(pending):
+            results[i].update(status="failed", error="User not found")
+
+        keys = await asyncio.to_thread(key_pool.get_many, len(pending))
+        assigned = await allocate_ips(self.db, [items[i].ip for i in pending])
+
+        new_peers = []
+        for i, ip, (private_key, public_key) in zip(pending, assigned, keys):
+            if isinstance(ip, HTTPException):
+                results[i].update(status="failed", error=ip.detail)
+                continue
+            peer = WireGuardPeer(
+                user_id=items[i].user_id,
+                peer_name=items[i].peer_name,
+                public_key=public_key,
+                private_key=private_key,
+                assigned_ip=ip,
+                server_id=server.id,
+                created_by=current_user.username
+            )
+            new_peers.append((i, peer))
 
-        self.db.add(new_peer)
-        await self.db.commit()  # Ensure commit is awaited
-        await self.log_action(current_user.username, "Added peer", data.peer_name, self.db)
+        self.db.add_all([peer for _, peer in new_peers])
 
-        return {"message": "Peer Created Successfully"}
+        driver = get_wg_driver()
+        interface_name = server.interface_name
+        public_keys = [peer.public_key for _, peer in new_peers]
+        applied = False
+        try:
+            await self.db.flush()
+            applied = True
+            await driver.set_peers(
+                interface_name,
+                [(peer.public_key, f"{peer.assigned_ip}/32") for _, peer in new_peers])
+            await self.db.commit()
+        except BaseException:
+            # The in-memory bitmap holds addresses the database never got
+            invalidate_allocator()
+            await self.db.rollback()
+            # and the interface may hold peers it never got either
+            if applied and public_keys:
+                await self.undo_on_interface(driver.remove_peers, interface_name, public_keys)
+            raise
+
+        if new_peers:
+            config_writer.schedule(interface_name)
+        audit_writer.record_many(current_user.username, "Added peer", [peer.peer_name for _, peer in new_peers])
+
+        for i, peer in new_peers:
+            results[i].update(status="created", id=peer.id, assigned_ip=peer.assigned_ip)
+
+        return {
+            "created": len(new_peers),
+            "failed": len(items) - len(new_peers),
+            "results": results
+        }
 
     async def remove_peer(self, peer_id, current_user):
         peer = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id).options(joinedload(WireGuardPeer.wg_server)))
@@ -186,31 +298,113 @@ class peer_service:
                 status_code=404
             )
 
-        command = f"wg set {result.wg_server.interface_name} peer {result.public_key} remove"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        command = f"wg-quick save {result.wg_server.interface_name}"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
+        # Same path as the bulk removal: IP released and row deleted in one transaction
+        removed = None
+        try:
+            removed = await self.teardown_peers([result])
+            await self.db.commit()
+        except BaseException:
+            invalidate_allocator()
+            await self.db.rollback()
+            if removed:
+                await self.restore_peers(removed)
+            raise
+        audit_writer.record(current_user.username, "Removed peer", result.peer_name)
+        return {"message": f"Peer {result.peer_name} removed successfully"}
 
-        # Mark the assigned IP as available in the WireGuardIPPool table
-        ip_entry = await self.db.execute(
-            select(WireGuardIPPool).where(
-                WireGuardIPPool.ip_address == result.assigned_ip)
-        )
-        ip_result = ip_entry.scalars().first()
+    async def teardown_peers(self, peers) -> dict:
+        """
+        Remove peers from their interfaces with one driver call per interface,
+        release their IPs in one pool write and delete the rows (and their usage
+        history) in one statement each. Returns the interface entries that were
+        removed. The caller commits and records the audit events once the commit
+        succeeded, or calls `invalidate_allocator` and `restore_peers` with that
+        result when it rolls back.
+        """
+        from app.api.peers.models import PeerUsageBucket
+
+        peer_ids = [peer.id for peer in peers]
+        query = await self.db.execute(
+            select(PeerAccount.peer_id).where(
+                PeerAccount.peer_id.in_(peer_ids), PeerAccount.disabled_at.is_not(None)))
+        disabled = set(query.scalars().all())
+
+        # Only peers that were live go back on the interface if the caller rolls back
+        public_keys, removed = {}, {}
+        for peer in peers:
+            public_keys.setdefault(peer.wg_server.interface_name, []).append(peer.public_key)
+            entries = removed.setdefault(peer.wg_server.interface_name, [])
+            if peer.id not in disabled and peer.assigned_ip:
+                entries.append((peer.public_key, f"{peer.assigned_ip}/32"))
+
+        await release_ips(self.db, [peer.assigned_ip for peer in peers if peer.assigned_ip])
+        config_cache.invalidate(*peer_ids)
+        await self.db.execute(delete(PeerUsageBucket).where(PeerUsageBucket.peer_id.in_(peer_ids)))
+        await self.db.execute(delete(WireGuardPeer).where(WireGuardPeer.id.in_(peer_ids)))
+        await self.db.flush()
+
+        driver = get_wg_driver()
+        done = {}
+        try:
+            for interface_name, keys in public_keys.items():
+                # Recorded first, a failing batch may have removed part of its peers
+                done[interface_name] = removed[interface_name]
+                await driver.remove_peers(interface_name, keys)
+                config_writer.schedule(interface_name)
+        except BaseException:
+            await self.restore_peers(done)
+            raise
+        return removed
+
+    async def restore_peers(self, removed: dict):
+        """Put peers taken off by `teardown_peers` back after the database rolled back."""
+        driver = get_wg_driver()
+        for interface_name, entries in removed.items():
+            if entries:
+                await self.undo_on_interface(driver.set_peers, interface_name, entries)
+                config_writer.schedule(interface_name)
+
+    async def remove_peers_bulk(self, data, current_user):
+        """Offboard many peers, by ID and/or all peers of a user, in one batch."""
+        from app.api.users.services import user_service
+
+        await user_service.is_admin(current_user)
+
+        conditions = []
+        if data.peer_ids:
+            conditions.append(WireGuardPeer.id.in_(data.peer_ids))
+        if data.user_id:
+            conditions.append(WireGuardPeer.user_id == data.user_id)
+
+        query = await self.db.execute(
+            select(WireGuardPeer).where(or_(*conditions)).options(joinedload(WireGuardPeer.wg_server)))
+        peers = query.scalars().all()
 
-        if ip_result:
-            ip_result.is_assigned = False
-            self.db.add(ip_result)  # Mark as available
+        if not peers:
+            raise HTTPException(detail="Peer Not Found", status_code=404)
 
-        await self.db.delete(result)
-        await self.log_action(current_user.username, "Removed peer", result.peer_name, self.db)
-        return {"message": f"Peer {result.peer_name} removed successfully"}
+        removed = None
+        try:
+            removed = await self.teardown_peers(peers)
+            await self.db.commit()
+        except BaseException:
+            # The in-memory bitmap already shows the addresses as free
+            invalidate_allocator()
+            await self.db.rollback()
+            if removed:
+                await self.restore_peers(removed)
+            raise
+        audit_writer.record_many(current_user.username, "Removed peer", [peer.peer_name for peer in peers])
+
+        removed = {peer.id for peer in peers}
+        return {
+            "removed": len(removed),
+            "peer_ids": sorted(removed),
+            "not_found": sorted(set(data.peer_ids or []) - removed)
+        }
 
     async def update_peer(self, peer_id, data, current_user):
-        private_key, public_key = self.generate_wg_key_pair()
+        private_key, public_key = key_pool.get()
         peer = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id).options(joinedload(WireGuardPeer.wg_server)))
         result = peer.scalars().first()
         if result is None:
@@ -218,70 +412,223 @@ class peer_service:
                 detail="Peer Not Found",
                 status_code=404
             )
-        if data.peer_name:
-            result.peer_name = data.peer_name
-        if data.ip:
-            result.assigned_ip = data.ip
-
-        command = f"wg set {result.wg_server.interface_name} peer {result.public_key} remove"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        command = f"wg-quick save {result.wg_server.interface_name}"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        # Log action in the database
-        command = f"wg set {result.wg_server.interface_name} peer {public_key} allowed-ips {data.ip}/32"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        command = f"wg-quick save {result.wg_server.interface_name}"
-        process = await asyncio.create_subprocess_shell(command)
-        await process.communicate()  # Ensure command execution completes
-
-        # Mark the assigned IP as available in the WireGuardIPPool table
-        ip_entry = await self.db.execute(
-            select(WireGuardIPPool).where(
-                WireGuardIPPool.ip_address == result.assigned_ip)
-        )
-        ip_result = ip_entry.scalars().first()
-
-        if ip_result:
-            ip_result.is_assigned = False
-            self.db.add(ip_result)  # Mark as available
 
-        await self.db.commit()
-        await self.log_action(current_user.username, "Updated peer", result.peer_name, self.db)
+        # A disabled peer stays off the interface
+        disabled = await self.db.scalar(
+            select(PeerAccount.disabled_at).where(PeerAccount.peer_id == result.id))
+        driver = get_wg_driver()
+        interface_name = result.wg_server.interface_name
+        previous_ip, previous_key = result.assigned_ip, result.public_key
+        applied = False
+        try:
+            if data.peer_name:
+                result.peer_name = data.peer_name
+            if data.ip and data.ip != previous_ip:
+                [assigned_ip] = await allocate_ips(self.db, [data.ip])
+                if isinstance(assigned_ip, HTTPException):
+                    raise assigned_ip
+                # Return the IP the peer moves away from to the pool
+                if previous_ip:
+                    await release_ips(self.db, [previous_ip])
+                result.assigned_ip = assigned_ip
+            result.public_key = public_key
+            result.private_key = private_key
+            await self.db.flush()
+
+            # Swap the old key for the new one on the interface
+            applied = True
+            await driver.remove_peers(interface_name, [previous_key])
+            if disabled is None:
+                await driver.set_peers(interface_name, [(public_key, f"{result.assigned_ip}/32")])
+            await self.db.commit()
+        except BaseException:
+            invalidate_allocator()
+            await self.db.rollback()
+            if applied:
+                await self.undo_on_interface(driver.remove_peers, interface_name, [public_key])
+                if disabled is None:
+                    await self.undo_on_interface(
+                        driver.set_peers, interface_name, [(previous_key, f"{previous_ip}/32")])
+            raise
+
+        config_writer.schedule(interface_name)
+        config_cache.invalidate(result.id)
+        audit_writer.record(current_user.username, "Updated peer", result.peer_name)
 
         return {"message": f"Peer {result.peer_name} updated successfully"}
 
+    async def set_peers_enabled(self, peer_ids, enabled: bool, reason: str):
+        """
+        Take peers off their interfaces, or put them back, without deleting
+        them. Used by the accounting engine to enforce monthly quotas.
+        """
+        query = await self.db.execute(
+            select(WireGuardPeer).where(WireGuardPeer.id.in_(peer_ids)).options(joinedload(WireGuardPeer.wg_server)))
+        peers = query.scalars().all()
+        if not peers:
+            return
+
+        by_interface = {}
+        for peer in peers:
+            by_interface.setdefault(peer.wg_server.interface_name, []).append(peer)
+
+        driver = get_wg_driver()
+        for interface_name, interface_peers in by_interface.items():
+            if enabled:
+                await driver.set_peers(
+                    interface_name, [(peer.public_key, f"{peer.assigned_ip}/32") for peer in interface_peers])
+            else:
+                await driver.remove_peers(interface_name, [peer.public_key for peer in interface_peers])
+            config_writer.schedule(interface_name)
+
+        await self.db.execute(
+            update(PeerAccount)
+            .where(PeerAccount.peer_id.in_([peer.id for peer in peers]))
+            .values(disabled_at=None if enabled else datetime.utcnow()))
+        await self.db.commit()
+        audit_writer.record_many("system", "Enabled peer" if enabled else "Disabled peer",
+                                 [f"{peer.peer_name}: {reason}" for peer in peers])
+
+    @staticmethod
+    def account_to_dict(account: PeerAccount) -> dict:
+        period_bytes = account.period_rx_bytes + account.period_tx_bytes
+        return {
+            "peer_id": account.peer_id,
+            "total_rx_bytes": account.total_rx_bytes,
+            "total_tx_bytes": account.total_tx_bytes,
+            "period_start": account.period_start,
+            "period_rx_bytes": account.period_rx_bytes,
+            "period_tx_bytes": account.period_tx_bytes,
+            "monthly_quota_bytes": account.monthly_quota_bytes,
+            "quota_remaining": max(account.monthly_quota_bytes - period_bytes, 0)
+            if account.monthly_quota_bytes is not None else None,
+            "disabled": account.disabled_at is not None,
+            "disabled_at": account.disabled_at
+        }
+
+    async def set_peer_quota(self, peer_id, data, current_user):
+        from app.api.users.services import user_service
+
+        await user_service.is_admin(current_user)
+
+        peer = await self.db.scalar(select(WireGuardPeer.id).where(WireGuardPeer.id == peer_id))
+        if peer is None:
+            raise HTTPException(status_code=404, detail="Peer not found")
+
+        account = await self.db.scalar(select(PeerAccount).where(PeerAccount.peer_id == peer_id))
+        if account is None:
+            account = PeerAccount(peer_id=peer_id, period_start=month_start(datetime.utcnow()),
+                                  last_rx=0, last_tx=0, total_rx_bytes=0, total_tx_bytes=0,
+                                  period_rx_bytes=0, period_tx_bytes=0)
+            self.db.add(account)
+        account.monthly_quota_bytes = data.monthly_quota_bytes
+        await self.db.commit()
+        audit_writer.record(current_user.username, "Set peer quota", f"{peer_id}: {data.monthly_quota_bytes}")
+
+        # Raising or clearing the quota lets a disabled peer back on straight away
+        period_bytes = account.period_rx_bytes + account.period_tx_bytes
+        if account.disabled_at is not None and (
+                account.monthly_quota_bytes is None or period_bytes < account.monthly_quota_bytes):
+            await self.set_peers_enabled([peer_id], True, "Quota raised")
+            await self.db.refresh(account)
+
+        return self.account_to_dict(account)
+
+    async def get_user_usage_totals(self, user_id, current_user):
+        """Lifetime and current-month traffic of every peer of a user, plus the user's sums."""
+        if user_id != current_user.id and not await has_admin_role(current_user):
+            raise HTTPException(status_code=403, detail="Not allowed to view this user")
+
+        query = await self.db.execute(
+            select(PeerAccount)
+            .join(WireGuardPeer, WireGuardPeer.id == PeerAccount.peer_id)
+            .where(WireGuardPeer.user_id == user_id)
+            .order_by(PeerAccount.peer_id))
+        accounts = query.scalars().all()
+
+        period = month_start(datetime.utcnow())
+        current = [account for account in accounts if account.period_start == period]
+        return {
+            "user_id": user_id,
+            "total_rx_bytes": sum(account.total_rx_bytes for account in accounts),
+            "total_tx_bytes": sum(account.total_tx_bytes for account in accounts),
+            "period_start": period,
+            "period_rx_bytes": sum(account.period_rx_bytes for account in current),
+            "period_tx_bytes": sum(account.period_tx_bytes for account in current),
+            "peers": [self.account_to_dict(account) for account in accounts]
+        }
+
+    async def peer_config_entry(self, peer_id, current_user):
+        """Rendered config of a peer the user may download, from the cache when possible."""
+        entry = config_cache.get(peer_id)
+        if entry is None:
+            query = await self.db.execute(
+                select(*CONFIG_COLUMNS)
+                .join(WGServerConfig, WGServerConfig.id == WireGuardPeer.server_id)
+                .where(WireGuardPeer.id == peer_id))
+            row = query.first()
+            if not row:
+                raise HTTPException(status_code=404, detail="Peer not found")
+            # A replica row may predate an update this worker just invalidated
+            entry = config_cache.render(row) if is_replica_session(self.db) else config_cache.put(row)
+
+        if entry.user_id != current_user.id and not await has_admin_role(current_user):
+            raise HTTPException(status_code=403, detail="Not allowed to download this peer's config")
+        return entry
+
     async def generate_peer_config(self, peer_id, current_user):
-        query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id).options(joinedload(WireGuardPeer.wg_server)))
+        entry = await self.peer_config_entry(peer_id, current_user)
+        return entry.config
+
+    async def get_peer_config(self, peer_id, format, image, current_user):
+        entry = await self.peer_config_entry(peer_id, current_user)
+        filename = config_filename(entry.peer_name, peer_id)
+        if format == "conf":
+            return Response(entry.config, media_type="text/plain",
+                            headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+        return Response(await config_cache.qr(entry, image), media_type=QR_MEDIA_TYPES[image])
+
+    async def export_user_configs(self, user_id, current_user):
+        """Zip of every config of a user. Rows are loaded up front, the archive is rendered while streaming."""
+        if user_id != current_user.id and not await has_admin_role(current_user):
+            raise HTTPException(status_code=403, detail="Not allowed to export this user's configs")
+
+        query = await self.db.execute(
+            select(*CONFIG_COLUMNS)
+            .join(WGServerConfig, WGServerConfig.id == WireGuardPeer.server_id)
+            .where(WireGuardPeer.user_id == user_id)
+            .order_by(WireGuardPeer.created_at, WireGuardPeer.id))
+        rows = query.all()
+        if not rows:
+            raise HTTPException(status_code=404, detail="No peers found")
+
+        return StreamingResponse(
+            stream_config_zip(rows, cache=not is_replica_session(self.db)), media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{user_id}-configs.zip"'})
+
+    async def get_peer_usage(self, peer_id, start, end, step, current_user):
+        query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id))
         peer = query.scalars().first()
         if not peer:
             raise HTTPException(status_code=404, detail="Peer not found")
+        if peer.user_id != current_user.id and not await has_admin_role(current_user):
+            raise HTTPException(status_code=403, detail="Not allowed to view this peer")
 
-        peer_subnet = re.search(r"/(\d+)", peer.wg_server.server_ips).group(1)
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(hours=24)
+        # Treat naive timestamps as UTC
+        end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+        start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        if start >= end:
+            raise HTTPException(status_code=400, detail="'from' must be before 'to'")
 
-        config = f"""
-[Interface]
-PrivateKey = {peer.private_key}
-Address = {peer.assigned_ip}/{peer_subnet}
+        step = step or default_step(start, end)
+        if step == "raw":
+            points = usage_recorder.recent(peer.public_key, start, end)
+        else:
+            points = await query_usage(self.db, peer.id, start, end, step)
 
-[Peer]
-PublicKey = {peer.wg_server.public_key}
-Endpoint = {settings.endpoint}
-AllowedIPs = {settings.allowed_ips}
-PersistentKeepalive = 30
-"""
-        # CONFIG_DIR = "/home"  # Define your config directory path
-        # filename = f"{CONFIG_DIR}/{current_user.username}.conf"
-        # os.makedirs(CONFIG_DIR, exist_ok=True)
-        # async with aiofiles.open(filename, "w") as f:
-        #     await f.write(config)
-
-        return config
+        return {"peer_id": peer.id, "from": start, "to": end, "step": step, "points": points}
 
     async def get_peer_transfer_data(self, peer_id):
         query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.id == peer_id))
@@ -289,44 +636,4 @@ PersistentKeepalive = 30
         if not peer:
             raise HTTPException(status_code=404, detail="Peer not found")
 
-        public_key = peer.public_key
-
-        try:
-            output = subprocess.check_output(
-                ["wg", "show", settings.interface_name, "transfer"], text=True)
-            handshake_output = subprocess.check_output(
-                ["wg", "show", settings.interface_name, "latest-handshakes"], text=True)
-            endpoints_output = subprocess.check_output(
-                ["wg", "show", settings.interface_name, "endpoints"], text=True)
-
-            rx, tx, latest_handshake, endpoint = 0, 0, "Never", "Unknown"
-
-            for line in output.splitlines():
-                parts = line.split()
-                if len(parts) >= 3 and parts[0] == public_key:
-                    rx = int(parts[1])  # ✅ Convert to integer
-                    tx = int(parts[2])  # ✅ Convert to integer
-                    break
-
-            for line in handshake_output.splitlines():
-                parts = line.split()
-                if len(parts) >= 2 and parts[0] == public_key:
-                    latest_handshake = int(parts[1]) if parts[1].isdigit() else "Never"  # ✅ Convert to integer safely
-                    break
-
-            for line in endpoints_output.splitlines():
-                parts = line.split()
-                if len(parts) >= 2 and parts[0] == public_key:
-                    endpoint = parts[1]
-                    break
-
-            return {  # ✅ Always return a dictionary
-                "rx": rx,
-                "tx": tx,
-                "latest_handshake": latest_handshake,
-                "endpoint": endpoint
-            }
-
-        except subprocess.CalledProcessError as e:
-            raise HTTPException(
-                status_code=500, detail="Error fetching transfer data")
+        return telemetry_cache.get(peer.public_key)
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends
 
 from app.api.roles.schemas import AddRole, UpdateRole
 from app.api.roles.services import role_services
-from app.core.database import get_session
+from app.core.database import get_read_session, get_session
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -12,7 +12,7 @@ router = APIRouter()
 
 
 @router.get("")
-async def read_roles(db: AsyncSession = Depends(get_session),current_user = Depends(get_current_user)):
+async def read_roles(db: AsyncSession = Depends(get_read_session),current_user = Depends(get_current_user)):
     result = await role_services(db).get_roles(current_user)
     return result
 
@@ -5,10 +5,10 @@ from httpx import delete
 from sqlalchemy import select
 
 from app.api.roles.models import Role
-from app.api.users.models import AuditLog, User
-from app.core.database import get_session
+from app.api.users.models import User
+from app.utils.audit import audit_writer
+from app.utils.authz import require_admin, role_cache
 from .schemas import AddRole, UpdateRole
-from sqlalchemy.ext.asyncio import AsyncSession
 
 class role_services:
     def __init__(self, db):
@@ -16,31 +16,7 @@ class role_services:
 
     @staticmethod
     async def is_admin(user: User):
-        if not hasattr(user, "role_id"):  # ✅ Ensure role_id exists in User model
-            raise HTTPException(status_code=500, detail="User model does not have role_id")
-
-        async for session in get_session():
-            from app.api.roles.models import Role, RoleEnum
-            
-            # ✅ Fetch the Role ID for "admin"
-            admin_role = await session.execute(select(Role.id).where(Role.role == RoleEnum.admin.value))
-            admin_role_id = admin_role.scalar_one_or_none()
-
-            if not admin_role_id:
-                raise HTTPException(status_code=500, detail="Admin role not found in database")
-
-            # ✅ Compare user's role ID with the admin role ID
-            if user.role_id != admin_role_id:
-                raise HTTPException(status_code=403, detail="Admin access required")
-
-            break  # ✅ Exit after checking
-
-    @staticmethod
-    async def log_action(admin_username, action, target, db: AsyncSession):
-        log_entry = AuditLog(admin_username=admin_username,
-                             action=action, target=target)
-        db.add(log_entry)
-        await db.commit()
+        await require_admin(user)
 
     async def get_roles(self,current_user):
         await self.is_admin(current_user)
@@ -54,7 +30,8 @@ class role_services:
         role = Role(**data.model_dump())
         self.db.add(role)
         await self.db.commit()
-        await self.log_action(current_user.username, "Added Role", role.role, self.db)
+        await role_cache.load(self.db)
+        audit_writer.record(current_user.username, "Added Role", role.role)
         return {"message":"Role added successfully"}
 
     async def update_role(self, role_id, data,current_user):
@@ -67,7 +44,8 @@ class role_services:
         for key, value in data.model_dump().items():
             setattr(role, key, value)
         await self.db.commit()
-        await self.log_action(current_user.username, "Updated Role", role.role, self.db)
+        await role_cache.load(self.db)
+        audit_writer.record(current_user.username, "Updated Role", role.role)
         return {"message":"Role updated successfully"}
     
     async def delete_role(self, role_id,current_user):
@@ -78,5 +56,6 @@ class role_services:
             raise HTTPException(status_code=404, detail="Role not found")
         await self.db.delete(role)
         await self.db.commit()
-        await self.log_action(current_user.username, "Deleted Role", role.role, self.db)
+        await role_cache.load(self.db)
+        audit_writer.record(current_user.username, "Deleted Role", role.role)
         return {"message":"Role deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from app.api.system.services import system_service
+from app.core.database import get_session
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.utils.httpbearer import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics(db: AsyncSession = Depends(get_session), current_user=Depends(get_current_user)):
+    result = await system_service(db).get_metrics(current_user)
+    return result
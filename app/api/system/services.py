@@ -0,0 +1,31 @@
+from app.api.users.services import user_service
+from app.core.config import settings
+from app.core.database import master_db_engine, pool_stats, read_router
+from app.utils.audit import audit_writer
+from app.utils.password_utils import password_hash_stats
+from app.utils.wg_telemetry import telemetry_cache
+
+
+class system_service:
+    def __init__(self, db):
+        self.db = db
+
+    async def get_metrics(self, current_user):
+        await user_service.is_admin(current_user)
+        return {
+            "password_hashing": password_hash_stats(),
+            "audit": audit_writer.stats(),
+            "database_pool": pool_stats(master_db_engine),
+            "replica": {
+                "pool": pool_stats(read_router.engine),
+                "lag": read_router.lag,
+                "max_lag": read_router.max_lag,
+                "pinned_reads": read_router.pinned_reads
+            } if read_router.engine is not None else None,
+            "telemetry": {
+                "interface": settings.interface_name,
+                "peers": len(telemetry_cache.peers),
+                "sampled_at": telemetry_cache.sampled_at,
+                "sample_age": telemetry_cache.sample_age()
+            }
+        }
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import TIMESTAMP, Column, ForeignKey, Insert, Integer, String,event, insert, select
+from sqlalchemy import TIMESTAMP, Column, DateTime, ForeignKey, Index, Insert, String,event, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import Base, get_session,master_db_engine
 from app.utils.password_utils import get_password_hash
@@ -15,12 +15,27 @@ class User(Base):
     
 
 class AuditLog(Base):
+    """
+    Range-partitioned by month on `timestamp`, see `app.utils.audit` for the
+    partition and retention helpers. Postgres requires the partition key in
+    the primary key, hence the composite (id, timestamp).
+    """
     __tablename__ = "audit_logs"
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        Index("ix_audit_logs_timestamp_admin_username", "timestamp", "admin_username"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+    timestamp = Column(TIMESTAMP, primary_key=True, nullable=False, default=datetime.utcnow)
     admin_username = Column(String, index=True)
     action = Column(String)
     target = Column(String)
-    timestamp = Column(TIMESTAMP, default=datetime.utcnow)
+
+
+class RevokedToken(Base):
+    """Revoked access tokens by JTI, shared by every worker. See `app.utils.token_blacklist`."""
+    __tablename__ = "revoked_tokens"
+    jti = Column(String(64), unique=True, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
     
 
 # def create_default_user(target, connection, **kwargs):
@@ -40,7 +55,6 @@ class AuditLog(Base):
 async def create_default_user():
     async for session in get_session():
         from app.api.roles.models import Role, RoleEnum
-        from app.api.peers.models import WireGuardIPPool
 
         # Check if roles exist
         result = await session.execute(select(Role.role).where(Role.role == RoleEnum.admin.value))
@@ -1,14 +1,16 @@
 from unittest import result
 from fastapi import APIRouter, Depends
+from fastapi.responses import ORJSONResponse
 
 from app.api.peers.services import peer_service
 from app.api.users.models import User
-from app.api.users.schemas import CreateUserRequest, EditUserRequest, UserLoginSchema, UserResponse
+from app.api.users.schemas import CreateUserRequest, EditUserRequest, UserDetailResponse, UserListQuery, UserLoginSchema, UserPage, UserResponse
 from app.api.users.services import user_service
-from app.core.database import get_session
+from app.core.database import get_read_session, get_session
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.utils.httpbearer import get_current_user
+from fastapi.security import HTTPAuthorizationCredentials
+from app.utils.httpbearer import get_current_user, http_bearer
 from app.utils.security import authenticate_user
 
 router = APIRouter()
@@ -19,6 +21,13 @@ async def user_login(data: UserLoginSchema, db: AsyncSession = Depends(get_sessi
     result = await user_service(db).user_login(data)
     return result
 
+@router.post("/logout")
+async def user_logout(credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
+                      db: AsyncSession = Depends(get_session),
+                      current_user=Depends(get_current_user)):
+    result = await user_service(db).user_logout(credentials.credentials)
+    return result
+
 @router.get("/admin-check")
 async def admin_check(db: AsyncSession = Depends(get_session),
                     current_user=Depends(get_current_user)):
@@ -26,19 +35,21 @@ async def admin_check(db: AsyncSession = Depends(get_session),
     return result
 
 
-@router.get("")
-async def get_users(db: AsyncSession = Depends(get_session),
+@router.get("", response_model=UserPage)
+async def get_users(params: UserListQuery = Depends(),
+                    db: AsyncSession = Depends(get_read_session),
                     current_user=Depends(get_current_user)):
-    result = await user_service(db).get_all_users(current_user)
-    return result
+    result = await user_service(db).get_all_users(current_user, params)
+    # Rows are already shaped like `UserPage`, skip re-validating every item
+    return ORJSONResponse(result)
 
-@router.get("/me")
-async def get_me(db : AsyncSession = Depends(get_session),current_user = Depends(get_current_user)):
+@router.get("/me", response_model=UserDetailResponse)
+async def get_me(db : AsyncSession = Depends(get_read_session),current_user = Depends(get_current_user)):
     result = await user_service(db).get_user(current_user)
     return result
 
-@router.get("/{user_id}")
-async def get_user_by_id(user_id: str, db: AsyncSession = Depends(get_session),
+@router.get("/{user_id}", response_model=UserDetailResponse)
+async def get_user_by_id(user_id: str, db: AsyncSession = Depends(get_read_session),
                          current_user=Depends(get_current_user)):
     result = await user_service(db).get_user_by_id(user_id, current_user)
     return result
@@ -1,10 +1,10 @@
 from datetime import date
 import datetime
 from turtle import update
-from typing import Optional
+from typing import List, Optional
 from venv import create
 from click import Option
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class UserLoginSchema(BaseModel):
@@ -29,7 +29,42 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class RoleSummary(BaseModel):
+    id: str
+    role: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class UserDetailResponse(UserResponse):
+    role: Optional[RoleSummary] = None
+    peer_count: Optional[int] = None
+
+class UserListItem(BaseModel):
+    # Everything is optional so sparse `?fields=` listings validate against the same model
+    id: Optional[str] = None
+    username: Optional[str] = None
+    role_id: Optional[str] = None
+    role: Optional[str] = None
+    peer_count: Optional[int] = None
+    created_at: Optional[datetime.datetime] = None
+    created_by: Optional[str] = None
+    updated_at: Optional[datetime.datetime] = None
+    updated_by: Optional[str] = None
+
+class UserPage(BaseModel):
+    items: List[UserListItem]
+    next_cursor: Optional[str] = None
+
 class EditUserRequest(BaseModel):
     username: Optional[str] = None
     password : Optional[str] = None
     role_id: Optional[str] = None
+
+
+class UserListQuery(BaseModel):
+    cursor: Optional[str] = None
+    limit: int = Field(100, ge=1, le=1000)
+    username: Optional[str] = None  # username prefix
+    role_id: Optional[str] = None
+    fields: Optional[str] = None  # comma separated, e.g. id,username
@@ -4,49 +4,37 @@ from datetime import timedelta
 import re
 from unittest import result
 from fastapi import HTTPException
-from sqlalchemy import select
+from sqlalchemy import func, select
 from app.api.peers.models import WireGuardPeer
-from app.api.users.models import AuditLog, User
+from app.api.roles.models import Role
+from app.api.users.models import User
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api.wg_server.models import WGServerConfig
-from app.core.database import get_session
-from app.utils.password_utils import get_password_hash, verify_password
+from app.utils.audit import audit_writer
+from app.utils.authz import require_admin
+from app.utils.ip_pool import invalidate_allocator
+from app.utils.pagination import keyset_paginate, page, parse_fields, pick_fields
+from app.utils.password_utils import get_password_hash_async, login_slot, verify_password_async
+from app.utils.principal_cache import principal_cache
+from app.utils.token_blacklist import add_token_to_blacklist
 from app.utils.security import TOKEN_EXPIRE_MINUTES, create_access_token
 from sqlalchemy.orm import joinedload
 
+USER_FIELDS = {
+    "id", "username", "role_id", "role", "peer_count",
+    "created_at", "created_by", "updated_at", "updated_by"
+}
+
+
 class user_service:
     def __init__(self, db: AsyncSession):
         self.db = db
 
-    @staticmethod
-    async def log_action(admin_username, action, target, db: AsyncSession):
-        log_entry = AuditLog(admin_username=admin_username,
-                             action=action, target=target)
-        db.add(log_entry)
-        await db.commit()
-
     @staticmethod
     async def is_admin(user: User):
-        if not hasattr(user, "role_id"):  # ✅ Ensure role_id exists in User model
-            raise HTTPException(status_code=500, detail="User model does not have role_id")
-
-        async for session in get_session():
-            from app.api.roles.models import Role, RoleEnum
-            
-            # ✅ Fetch the Role ID for "admin"
-            admin_role = await session.execute(select(Role.id).where(Role.role == RoleEnum.admin.value))
-            admin_role_id = admin_role.scalar_one_or_none()
-
-            if not admin_role_id:
-                raise HTTPException(status_code=500, detail="Admin role not found in database")
+        await require_admin(user)
 
-            # ✅ Compare user's role ID with the admin role ID
-            if user.role_id != admin_role_id:
-                raise HTTPException(status_code=403, detail="Admin access required")
-
-            break  # ✅ Exit after checking
-                    
     @staticmethod
     async def authenticate_user(username: str, db: AsyncSession):
         result = await db.execute(select(User).filter_by(username=username))
@@ -64,13 +52,18 @@ class user_service:
         )
         user = result.scalars().first()
 
-        if not user or not verify_password(data.password, user.password):
-            raise HTTPException(status_code=401, detail="Invalid credentials")
+        async with login_slot():
+            if not user or not await verify_password_async(data.password, user.password):
+                raise HTTPException(status_code=401, detail="Invalid credentials")
 
         access_token = create_access_token(
             data={"username": user.username, "role": user.role_id}, expires_delta=timedelta(minutes=TOKEN_EXPIRE_MINUTES))
         return {"access_token": access_token, "token_type": "bearer", "user_id": user.id}
 
+    async def user_logout(self, token: str):
+        await add_token_to_blacklist(token, self.db)
+        return {"message": "Logged out successfully"}
+
     async def create_user(self, data, current_user: User):
         """ Ensure only admins can create users without nested transactions """
 
@@ -83,29 +76,46 @@ class user_service:
         if existing_user:
             raise HTTPException(status_code=400, detail="User already exists")
         # Hash the password (ensure it's sync-safe)
-        hashed_password = get_password_hash(data.password)
+        hashed_password = await get_password_hash_async(data.password)
         # Create a new user
         new_user = User(username=data.username,
                         password=hashed_password, role_id=data.role_id)
         self.db.add(new_user)
-        
-        # Logging action AFTER commit to prevent nested transactions
-        await self.log_action(current_user.username, "Created user", data.username, self.db)
+        await self.db.commit()
+        audit_writer.record(current_user.username, "Created user", data.username)
         return {"message": f"User {data.username} created successfully"}
     
-    async def get_all_users(self, current_user):
+    async def get_all_users(self, current_user, params):
         await self.is_admin(current_user)
-        query = await self.db.execute(select(User).options(joinedload(User.role)))
-        users = query.scalars().all()
-        if not users:
+        fields = parse_fields(params.fields, USER_FIELDS)
+
+        # One query: user columns, their role name and a GROUP BY peer count,
+        # labelled so each row maps straight onto a `UserListItem`
+        peer_counts = (
+            select(WireGuardPeer.user_id, func.count(WireGuardPeer.id).label("peer_count"))
+            .group_by(WireGuardPeer.user_id)
+            .subquery()
+        )
+        query = (
+            select(User.id, User.username, User.role_id, Role.role.label("role"),
+                   func.coalesce(peer_counts.c.peer_count, 0).label("peer_count"),
+                   User.created_at, User.created_by, User.updated_at, User.updated_by)
+            .outerjoin(Role, Role.id == User.role_id)
+            .outerjoin(peer_counts, peer_counts.c.user_id == User.id)
+        )
+        if params.username:
+            query = query.where(User.username.startswith(params.username, autoescape=True))
+        if params.role_id:
+            query = query.where(User.role_id == params.role_id)
+
+        result = await self.db.execute(
+            keyset_paginate(query, User, params.cursor, params.limit))
+        rows = result.all()
+        if not rows and not params.cursor:
             raise HTTPException(status_code=404, detail="No users found")
-        
-        for user in users:
-            peer_count_query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.user_id == user.id))
-            peer_count = len(peer_count_query.scalars().all())
-            user.peer_count = peer_count
-        
-        return users
+
+        items = [pick_fields(row._asdict(), fields) for row in rows[:params.limit]]
+        return page(items, rows, params.limit)
         
     async def get_user(self, current_user):
         print("Username",current_user.username)
@@ -115,14 +125,14 @@ class user_service:
         
     async def get_user_by_id(self, user_id, current_user):
         await self.is_admin(current_user)
-        query = await self.db.execute(select(User).where(User.id == user_id))
+        query = await self.db.execute(
+            select(User).where(User.id == user_id).options(joinedload(User.role)))
         result = query.scalars().first()
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         # Calculate peer count for the user
-        peer_count_query = await self.db.execute(select(WireGuardPeer).where(WireGuardPeer.user_id == result.id))
-        peer_count = len(peer_count_query.scalars().all())
-        result.peer_count = peer_count
+        result.peer_count = await self.db.scalar(
+            select(func.count(WireGuardPeer.id)).where(WireGuardPeer.user_id == result.id))
         return result
 
     async def delete_user(self,user_id, current_user):
@@ -132,8 +142,29 @@ class user_service:
 
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
-        await self.db.delete(result)
-        await self.log_action(current_user.username, "Deleted user", result.username, self.db)
+
+        # Take the user's peers off the interface and return their IPs in one batch
+        from app.api.peers.services import peer_service
+        peers_query = await self.db.execute(
+            select(WireGuardPeer).where(WireGuardPeer.user_id == user_id).options(joinedload(WireGuardPeer.wg_server)))
+        peers = peers_query.scalars().all()
+        peers_service = peer_service(self.db)
+        removed = None
+        try:
+            if peers:
+                removed = await peers_service.teardown_peers(peers)
+            await self.db.delete(result)
+            await self.db.commit()
+        except BaseException:
+            # The in-memory bitmap already shows the peers' addresses as free
+            invalidate_allocator()
+            await self.db.rollback()
+            if removed:
+                await peers_service.restore_peers(removed)
+            raise
+        audit_writer.record_many(current_user.username, "Removed peer", [peer.peer_name for peer in peers])
+        audit_writer.record(current_user.username, "Deleted user", result.username)
+        principal_cache.invalidate(result.username)
         return {"message": f"User {result.username} deleted successfully"}
     
     async def edit_user(self,user_id, data, current_user):
@@ -143,14 +174,16 @@ class user_service:
 
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
-        
+
+        previous_username = result.username
         if data.username:
             result.username = data.username
         if data.role_id:
             result.role_id = data.role_id
         if data.password:
-            result.password = get_password_hash(data.password)
+            result.password = await get_password_hash_async(data.password)
 
         await self.db.commit()
-        await self.log_action(current_user.username, "Edited user", result.username, self.db)
+        principal_cache.invalidate(previous_username, result.username)
+        audit_writer.record(current_user.username, "Edited user", result.username)
         return {"message": f"User {result.username} edited successfully"}
\ No newline at end of file
@@ -1,30 +1,12 @@
 from asyncio import events
 from operator import add
 import os
-import subprocess
-from typing import Tuple
 from sqlalchemy import CheckConstraint, Column, ForeignKey, Integer, String, event
 from app.core.config import settings
 from app.core.database import Base
 from sqlalchemy.orm import relationship
 from app.logs.logging import logger
-
-
-def generate_wg_key_pair() -> Tuple[str, str]:
-    """Generates a WireGuard key pair (private key & public key)"""
-    try:
-        # Generate private key
-        private_key = subprocess.check_output(
-            "wg genkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-        # Generate public key from private key
-        public_key = subprocess.check_output(
-            f"echo {private_key} | wg pubkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-        return private_key, public_key
-
-    except subprocess.CalledProcessError as e:
-        # Handle subprocess errors (e.g., if WireGuard tools are missing)
-        raise RuntimeError(
-            f"Error generating WireGuard keys: {e.stderr.decode().strip()}")
+from app.utils.wg_keys import generate_key_pair
 
 
 class WGServerConfig(Base):
@@ -46,7 +28,7 @@ class WGServerConfig(Base):
     )
 
 
-private_key, public_key = generate_wg_key_pair()
+private_key, public_key = generate_key_pair()
 
 
 def create_default_server(target, connection, **kwargs):
@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends
 
 from app.api.wg_server.schemas import WGServerResponseSchema, WGServerSchema
 from app.api.wg_server.services import wg_server
-from app.core.database import get_session
+from app.core.database import get_read_session, get_session
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.utils.httpbearer import get_current_user
@@ -12,12 +12,12 @@ from app.utils.httpbearer import get_current_user
 router = APIRouter()
 
 @router.get("/get")
-async def get_servers(current_user = Depends(get_current_user), db: AsyncSession = Depends(get_session)) -> List[WGServerResponseSchema]:
+async def get_servers(current_user = Depends(get_current_user), db: AsyncSession = Depends(get_read_session)) -> List[WGServerResponseSchema]:
     result = await wg_server(db).get_servers()
     return result
 
 @router.get("/get/{server_id}")
-async def get_server(server_id: str, current_user = Depends(get_current_user), db: AsyncSession = Depends(get_session)) -> WGServerResponseSchema:
+async def get_server(server_id: str, current_user = Depends(get_current_user), db: AsyncSession = Depends(get_read_session)) -> WGServerResponseSchema:
     result = await wg_server(db).get_server(server_id)
     return result
 
@@ -29,4 +29,9 @@ async def create_server(data: WGServerSchema, current_user = Depends(get_current
 @router.delete("/delete/{server_id}")
 async def delete_server(server_id: str, current_user = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
     result = await wg_server(db).delete_server(server_id)
-    return result
\ No newline at end of file
+    return result
+
+@router.post("/reconcile")
+async def reconcile_servers(dry_run: bool = False, current_user = Depends(get_current_user), db: AsyncSession = Depends(get_session)):
+    result = await wg_server(db).reconcile(current_user, dry_run)
+    return result
@@ -2,12 +2,13 @@
 
 import asyncio
 import os
-import subprocess
-from typing import Tuple
 
 from sqlalchemy import select
 from app.api.wg_server.models import WGServerConfig
 from app.utils.password_utils import get_password_hash
+from app.utils.peer_configs import config_cache
+from app.utils.wg_keys import generate_key_pair
+from app.utils.wg_reconcile import reconcile_interfaces
 from fastapi import HTTPException
 
 
@@ -15,27 +16,6 @@ class wg_server:
     def __init__(self, db):
         self.db = db
 
-    @staticmethod
-    def generate_wg_key_pair() -> Tuple[str, str]:
-        """Generates a WireGuard key pair (private key & public key)"""
-
-        try:
-            # Generate private key
-            private_key = subprocess.check_output(
-                "wg genkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-
-            # Generate public key from private key
-            public_key = subprocess.check_output(
-                f"echo {private_key} | wg pubkey", shell=True, stderr=subprocess.PIPE).decode().strip()
-
-            return private_key, public_key
-
-        except subprocess.CalledProcessError as e:
-            # Handle subprocess errors (e.g., if WireGuard tools are missing)
-            raise RuntimeError(
-                f"Error generating WireGuard keys: {e.stderr.decode().strip()}"
-            )
-
     @staticmethod
     def add_keys_to_wg0_conf(private_key: str, data) -> None:
         """Adds the generated keys to the wg0.conf file"""
@@ -68,7 +48,7 @@ class wg_server:
         return server
 
     async def create_server(self, data):
-        private_key, public_key = self.generate_wg_key_pair()
+        private_key, public_key = generate_key_pair()
         self.add_keys_to_wg0_conf(private_key, data)
         server = WGServerConfig(
             **data.model_dump(), public_key=public_key, private_key=private_key)
@@ -97,9 +77,16 @@ class wg_server:
         # Delete the server entry from the database
         await self.db.delete(server)
         await self.db.commit()
+        config_cache.invalidate_server(server_id)
 
         command = f"wg syncconf {server.server_name} <(wg-quick strip {server.server_name})"
         process = await asyncio.create_subprocess_shell(command)
         await process.communicate()
 
         return {"message": "Server Deleted Successfully"}
+
+    async def reconcile(self, current_user, dry_run: bool = False):
+        from app.api.users.services import user_service
+
+        await user_service.is_admin(current_user)
+        return await reconcile_interfaces(self.db, dry_run)
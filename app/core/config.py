@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -10,6 +12,17 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int
 
     postgresql_database_url: str
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_cache_size: int = 500  # asyncpg prepared statements per connection, 0 behind pgbouncer
+
+    postgresql_replica_url: Optional[str] = None
+    replica_max_lag: float = 5.0
+    replica_lag_check_interval: float = 2.0
+    read_your_writes_window: float = 10.0
 
     environment: str
 
@@ -20,6 +33,41 @@ class Settings(BaseSettings):
     server_ips : str
     endpoint: str
 
+    telemetry_interval: int = 5
+    peer_online_window: int = 180  # seconds since last handshake to count as online
+    stream_queue_size: int = 10
+    usage_ring_size: int = 60  # raw samples kept in memory per peer
+    usage_flush_interval: int = 60
+    usage_minute_retention_days: int = 7
+    accounting_lock_key: int = 7735001  # pg advisory lock electing the accounting worker
+    accounting_lease_retry: int = 30  # seconds between attempts of a non-holder to take the lock
+    wg_driver: str = "cli"  # cli | netlink | fake
+    key_pool_size: int = 32
+    wg_config_dir: str = "/etc/wireguard"
+    wg_save_delay: float = 1.0
+
+    principal_cache_size: int = 1024
+    principal_cache_ttl: int = 60
+    role_cache_ttl: int = 30  # role changes made by another worker show up within this many seconds
+
+    password_hash_workers: int = 4
+    login_concurrency: int = 8
+    login_queue_timeout: float = 2.0
+
+    revocation_negative_ttl: float = 5.0
+    revocation_negative_cache_size: int = 10000
+
+    config_cache_size: int = 4096
+    config_cache_ttl: int = 300
+
+    audit_queue_size: int = 10000
+    audit_batch_size: int = 500
+    audit_flush_interval: float = 1.0
+    audit_spool_path: str = "app/logs/audit_spool.jsonl"
+    audit_retention_months: int = 12
+    audit_partitions_ahead: int = 2
+    audit_maintenance_interval: int = 21600
+
     class Config:
         env_file = ".env"
 
@@ -1,12 +1,20 @@
+import asyncio
+import time
+from collections import deque
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.core.config import settings
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
+from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import String, DateTime, func
+from sqlalchemy import String, DateTime, func, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import as_declarative
 from sqlalchemy.orm import mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 import uuid
 
+from app.logs.logging import logger
+
 
 @as_declarative()
 class Base:
@@ -23,13 +31,82 @@ class Base:
     updated_by = mapped_column(String, nullable=True)  # Track the updater
 
 
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits = deque(maxlen=1000)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self.recent_waits.append(waited)
+
+    def recreate(self):
+        # Keep the counters when the engine replaces the pool after a disconnect
+        pool = super().recreate()
+        pool.checkouts, pool.timeouts = self.checkouts, self.timeouts
+        pool.total_wait, pool.max_wait = self.total_wait, self.max_wait
+        pool.recent_waits = self.recent_waits
+        return pool
+
+
 def create_engine(url, **kwargs):
-    """Create an asynchronous SQLAlchemy engine."""
+    """Create an asynchronous SQLAlchemy engine with the pool tuned from settings."""
+    kwargs.setdefault("poolclass", TimedQueuePool)
+    kwargs.setdefault("pool_size", settings.db_pool_size)
+    kwargs.setdefault("max_overflow", settings.db_max_overflow)
+    kwargs.setdefault("pool_timeout", settings.db_pool_timeout)
+    kwargs.setdefault("pool_recycle", settings.db_pool_recycle)
+    kwargs.setdefault("pool_pre_ping", settings.db_pool_pre_ping)
+    connect_args = kwargs.setdefault("connect_args", {})
+    connect_args.setdefault("prepared_statement_cache_size", settings.db_statement_cache_size)
     return create_async_engine(url, echo=False, **kwargs)
 
 
+def pool_stats(engine) -> dict:
+    """Occupancy and checkout wait times of an engine's pool, in milliseconds."""
+    pool = engine.sync_engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        waits = sorted(pool.recent_waits)
+        stats.update({
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "wait_avg_ms": round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "wait_p95_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 3) if waits else 0.0,
+            "wait_max_ms": round(pool.max_wait * 1000, 3),
+        })
+    return stats
+
+
 master_db_engine = create_engine(settings.postgresql_database_url)
 
+# Unpooled engine for connections that hold session state such as advisory
+# locks: closing one ends the backend instead of handing it to another caller
+lease_db_engine = create_async_engine(
+    settings.postgresql_database_url, echo=False, poolclass=NullPool,
+    connect_args={"prepared_statement_cache_size": settings.db_statement_cache_size})
+
 # Async session factories
 async_master_session = async_sessionmaker(
     bind=master_db_engine, autocommit=False, expire_on_commit=False, autoflush=False, class_=AsyncSession)
@@ -37,7 +114,138 @@ async_master_session = async_sessionmaker(
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """
-    Dependency to provide a database session.
+    Dependency to provide a database session. FastAPI caches it per request,
+    so the auth dependencies and the handler share one session and at most
+    one pooled connection.
     """
     async with async_master_session() as session:
         yield session
+
+
+'''
+-----------------------------------------------------
+|          Optional read replica routing            |
+-----------------------------------------------------
+'''
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Wall-clock time of a client's last write, handed back on every mutating
+# response so any worker (or host) can tell the client just wrote
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "x-last-write"
+
+# Zero when the replica has replayed everything it received, else the age of the last replayed commit
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")
+
+
+def last_write_at(request: Request) -> Optional[float]:
+    """The last-write timestamp the client sent back, from the header or the cookie."""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+class ReplicaRouter:
+    """
+    Decides per request whether reads may go to the replica. Reads fall back
+    to the primary while the replica lags more than `max_lag` seconds (or
+    cannot be reached) and for `pin_window` seconds after the client's last
+    write, so it always reads its own writes. The time of that write travels
+    with the client (see `ReadYourWritesMiddleware`), not in worker memory.
+    """
+
+    def __init__(self, engine, max_lag: float, check_interval: float, pin_window: float):
+        self.engine = engine
+        self.session_factory = async_sessionmaker(
+            bind=engine, autocommit=False, expire_on_commit=False, autoflush=False,
+            class_=AsyncSession) if engine is not None else None
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.pin_window = pin_window
+        self.lag: Optional[float] = None
+        self.pinned_reads = 0
+        self._checked = 0.0
+        self._lock = asyncio.Lock()
+
+    def is_pinned(self, last_write: Optional[float]) -> bool:
+        return last_write is not None and time.time() - last_write < self.pin_window
+
+    async def replica_lag(self) -> Optional[float]:
+        """Replica lag in seconds, re-measured at most every `check_interval`. None when unreachable."""
+        if time.monotonic() - self._checked < self.check_interval:
+            return self.lag
+        async with self._lock:
+            if time.monotonic() - self._checked >= self.check_interval:
+                try:
+                    async with self.engine.connect() as conn:
+                        self.lag = float(await conn.scalar(REPLICA_LAG_QUERY) or 0.0)
+                except Exception as e:
+                    logger.warning(f'Read replica unavailable, reading from primary: {e}')
+                    self.lag = None
+                self._checked = time.monotonic()
+        return self.lag
+
+    async def use_replica(self, last_write: Optional[float]) -> bool:
+        if self.engine is None:
+            return False
+        if self.is_pinned(last_write):
+            self.pinned_reads += 1
+            return False
+        lag = await self.replica_lag()
+        return lag is not None and lag <= self.max_lag
+
+
+replica_db_engine = create_engine(settings.postgresql_replica_url) if settings.postgresql_replica_url else None
+
+read_router = ReplicaRouter(replica_db_engine, settings.replica_max_lag,
+                            settings.replica_lag_check_interval, settings.read_your_writes_window)
+
+
+def is_replica_session(session: AsyncSession) -> bool:
+    """True for sessions `get_read_session` opened on the replica, whose rows may lag the primary."""
+    return read_router.engine is not None and session.bind is read_router.engine
+
+
+async def get_read_session(request: Request,
+                           primary: AsyncSession = Depends(get_session)) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for read-only routes: a replica session when one is configured,
+    caught up and the client has not just written. Otherwise the request's
+    primary session, the same one `get_current_user` already uses.
+    """
+    if not await read_router.use_replica(last_write_at(request)):
+        yield primary
+        return
+    async with read_router.session_factory() as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """Stamps every mutating response with the time of the write, as a cookie and a header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in READ_METHODS or read_router.engine is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_stamp(message):
+            if message["type"] == "http.response.start":
+                # Taken when the response starts, i.e. after the request's commit
+                stamp = f"{time.time():.3f}".encode()
+                max_age = int(read_router.pin_window) + 1
+                message["headers"] = list(message.get("headers", [])) + [
+                    (LAST_WRITE_HEADER.encode(), stamp),
+                    (b"set-cookie", b"%s=%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax"
+                     % (LAST_WRITE_COOKIE.encode(), stamp, max_age)),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_and_stamp)
@@ -0,0 +1,322 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.database import get_session
+from app.logs.logging import logger
+
+
+class AuditWriter:
+    """
+    Audit events are recorded without touching the request's transaction.
+
+    `record` only puts the event on a bounded in-process queue. A background
+    task drains it and writes batches as one multi-row INSERT, either when
+    `batch_size` events are waiting or `flush_interval` seconds after the
+    first one. Events that cannot reach the database (or do not fit the queue)
+    are appended to a local JSON-lines spool and replayed on the next
+    successful write, so an outage delays audit rows instead of losing them.
+
+    Every worker process spools to its own file (the pid is part of the
+    name), so replays never race. Spools left by processes that are gone are
+    adopted by the next worker that replays.
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, spool_path: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_base = spool_path
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._overflow: List[dict] = []
+        self._write_lock = asyncio.Lock()
+        # Spool appends come from worker threads and, on cancellation, from the loop
+        self._spool_lock = threading.Lock()
+
+    @property
+    def spool_path(self) -> str:
+        # Resolved on use, the writer may be created before the workers fork
+        root, ext = os.path.splitext(self.spool_base)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def record(self, actor: str, action: str, target: Optional[str]):
+        # The id is assigned here so a replayed spool cannot insert the same event twice
+        event = {"id": uuid.uuid4().hex, "admin_username": actor, "action": action, "target": target,
+                 "timestamp": datetime.utcnow()}
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Never block or fail the request over audit backpressure, the
+            # writer task spools the overflow in batches off the event loop
+            self._overflow.append(event)
+
+    def record_many(self, actor: str, action: str, targets: Iterable[Optional[str]]):
+        for target in targets:
+            self.record(actor, action, target)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "overflow": len(self._overflow),
+            "spool_pending": os.path.exists(self.spool_path) or os.path.exists(f"{self.spool_path}.replay")
+        }
+
+    def _drain(self, limit: int) -> List[dict]:
+        events = []
+        while len(events) < limit and not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    async def run(self):
+        """Background writer, one batch per size or time threshold."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                await self._write(batch)
+                await self._spool_overflow()
+            except asyncio.CancelledError:
+                # Shutting down mid-batch, keep the events for the next start
+                self._spool(batch)
+                raise
+            except Exception as e:
+                # Keep the writer alive; event ids make a second insert of the batch a no-op
+                logger.error(f'Audit batch of {len(batch)} events failed, spooling it: {e}')
+                await asyncio.to_thread(self._spool, batch)
+
+    async def flush(self):
+        """Write everything still queued, called on shutdown once `run` has stopped."""
+        await self._spool_overflow()
+        while not self.queue.empty():
+            await self._write(self._drain(self.batch_size))
+
+    async def _spool_overflow(self):
+        if self._overflow:
+            events, self._overflow = self._overflow, []
+            await asyncio.to_thread(self._spool, events)
+
+    async def _write(self, events: List[dict]):
+        from app.api.users.models import AuditLog
+
+        async with self._write_lock:
+            try:
+                async for session in get_session():
+                    await session.execute(insert(AuditLog).values(events).on_conflict_do_nothing())
+                    await session.commit()
+            except Exception as e:
+                logger.error(f'Audit write failed, spooling {len(events)} events: {e}')
+                await asyncio.to_thread(self._spool, events)
+                return
+
+            try:
+                await self._replay_spool()
+            except Exception as e:
+                logger.error(f'Audit spool replay failed: {e}')
+
+    def _spool(self, events: List[dict]):
+        """Append events to this process's spool. Blocking, and never raises."""
+        try:
+            with self._spool_lock, open(self.spool_path, "a") as spool:
+                for event in events:
+                    spool.write(json.dumps({**event, "timestamp": event["timestamp"].isoformat()}) + "\n")
+                spool.flush()
+                os.fsync(spool.fileno())
+        except Exception as e:
+            logger.error(f'Could not spool {len(events)} audit events, they are lost: {e}')
+
+    def _orphaned_spools(self) -> List[str]:
+        """Spool files of worker processes that no longer exist, and the pre-per-process shared spool."""
+        directory = os.path.dirname(self.spool_base) or "."
+        root, ext = os.path.splitext(os.path.basename(self.spool_base))
+        pattern = re.compile(rf"{re.escape(root)}\.(\d+){re.escape(ext)}(\.replay|\.claim)?$")
+        orphans = [self.spool_base, f"{self.spool_base}.replay"]
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        for name in names:
+            match = pattern.match(name)
+            if match and int(match.group(1)) != os.getpid() and not _pid_alive(int(match.group(1))):
+                orphans.append(os.path.join(directory, name))
+        return [path for path in orphans if os.path.exists(path)]
+
+    def _adopt_orphans(self):
+        """Move the events of orphaned spools into this process's spool."""
+        claimed = f"{self.spool_path}.claim"
+        for orphan in self._orphaned_spools():
+            try:
+                os.replace(orphan, claimed)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            with open(claimed) as source, open(self.spool_path, "a") as spool:
+                spool.writelines(line for line in source if line.strip())
+                spool.flush()
+                os.fsync(spool.fileno())
+            os.remove(claimed)
+
+    async def _replay_spool(self):
+        """Move spooled events into the database once it accepts writes again. Runs under `_write_lock`."""
+        from app.api.users.models import AuditLog
+
+        await asyncio.to_thread(self._adopt_orphans)
+        replaying = f"{self.spool_path}.replay"
+        # A leftover replay file means the process died mid-replay, finish that one first
+        if not os.path.exists(replaying):
+            if not os.path.exists(self.spool_path):
+                return
+            os.replace(self.spool_path, replaying)
+        with open(replaying) as spool:
+            events = [json.loads(line) for line in spool if line.strip()]
+        for event in events:
+            event["timestamp"] = datetime.fromisoformat(event["timestamp"])
+
+        try:
+            async for session in get_session():
+                for offset in range(0, len(events), self.batch_size):
+                    await session.execute(
+                        insert(AuditLog).values(events[offset:offset + self.batch_size]).on_conflict_do_nothing())
+                await session.commit()
+        except Exception as e:
+            logger.error(f'Audit spool replay failed, keeping {len(events)} events: {e}')
+            await asyncio.to_thread(self._spool, events)
+        else:
+            logger.info(f'Replayed {len(events)} spooled audit events')
+        os.remove(replaying)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+audit_writer = AuditWriter(settings.audit_queue_size, settings.audit_batch_size,
+                           settings.audit_flush_interval, settings.audit_spool_path)
+
+
+'''
+-----------------------------------------------------
+|     Monthly range partitions of audit_logs        |
+-----------------------------------------------------
+'''
+
+PARTITION_PREFIX = "audit_logs_"
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """First instant of the month `months` away from the month of `moment`."""
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def audit_partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month:%Y_%m}"
+
+
+async def ensure_audit_partitions(conn, start: datetime, end: datetime):
+    """Create the monthly partitions covering `start` up to and including the month of `end`."""
+    month = add_months(start, 0)
+    while month <= end:
+        upper = add_months(month, 1)
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {audit_partition_name(month)} PARTITION OF audit_logs "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"))
+        month = upper
+
+
+async def audit_partitions(conn) -> Dict[str, datetime]:
+    """Partition name -> first day of the month it holds."""
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'audit_logs'"))
+    partitions = {}
+    for (name,) in result.all():
+        try:
+            partitions[name] = datetime.strptime(name[len(PARTITION_PREFIX):], "%Y_%m")
+        except ValueError:
+            continue
+    return partitions
+
+
+async def drop_expired_audit_partitions(conn, retention_months: int) -> List[str]:
+    """Drop whole months older than the retention window instead of DELETEing their rows."""
+    cutoff = add_months(datetime.utcnow(), -retention_months)
+    partitions = await audit_partitions(conn)
+    expired = sorted(name for name, month in partitions.items() if add_months(month, 1) <= cutoff)
+    for name in expired:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+    return expired
+
+
+async def prepare_audit_table(conn):
+    """
+    Run at startup after `create_all`. Moves a pre-partitioning audit_logs
+    table (Integer ids) into the partitioned layout, then makes sure the
+    partitions for the coming months exist.
+    """
+    from app.api.users.models import AuditLog
+
+    now = datetime.utcnow()
+    partitioned = await conn.scalar(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid "
+        "WHERE relname = 'audit_logs')"))
+
+    if not partitioned:
+        logger.info("Converting audit_logs to a partitioned table")
+        result = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = 'audit_logs'"))
+        indexes = result.scalars().all()
+        await conn.execute(text("ALTER TABLE audit_logs RENAME TO audit_logs_legacy"))
+        for index in indexes:
+            await conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+        await conn.run_sync(AuditLog.__table__.create)
+
+        oldest = await conn.scalar(text("SELECT min(coalesce(timestamp, created_at)) FROM audit_logs_legacy"))
+        await ensure_audit_partitions(conn, oldest or now, now)
+        await conn.execute(text(
+            "INSERT INTO audit_logs (id, timestamp, admin_username, action, target, "
+            "created_at, updated_at, created_by, updated_by) "
+            "SELECT md5(random()::text || id::text), coalesce(timestamp, created_at), admin_username, "
+            "action, target, created_at, updated_at, created_by, updated_by FROM audit_logs_legacy"))
+        await conn.execute(text("DROP TABLE audit_logs_legacy"))
+
+    await ensure_audit_partitions(conn, now, add_months(now, settings.audit_partitions_ahead))
+
+
+async def start_audit_maintenance(interval: int):
+    """Keep partitions ahead of the clock and drop the ones past retention."""
+    while True:
+        try:
+            async for session in get_session():
+                now = datetime.utcnow()
+                await ensure_audit_partitions(session, now, add_months(now, settings.audit_partitions_ahead))
+                dropped = await drop_expired_audit_partitions(session, settings.audit_retention_months)
+                await session.commit()
+            if dropped:
+                logger.info(f"Dropped expired audit partitions: {', '.join(dropped)}")
+        except Exception as e:
+            logger.error(f'Audit partition maintenance failed: {e}')
+        await asyncio.sleep(interval)
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_session
+from app.logs.logging import logger
+
+
+class RoleCache:
+    """
+    In-memory role id -> role name map. Loaded at startup, reloaded by the
+    role service whenever a role is added, renamed or deleted, and again
+    once it is `ttl` seconds old, since the other workers' role changes
+    never reach this process otherwise.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.roles: Dict[str, str] = {}
+        self.loaded = False
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def load(self, db: AsyncSession):
+        from app.api.roles.models import Role
+
+        result = await db.execute(select(Role.id, Role.role))
+        self.roles = {role_id: role for role_id, role in result.all()}
+        self.loaded = True
+        self._loaded_at = time.monotonic()
+        logger.info(f"Role cache loaded ({len(self.roles)} roles)")
+
+    def is_fresh(self) -> bool:
+        return self.loaded and time.monotonic() - self._loaded_at < self.ttl
+
+    async def ensure_loaded(self):
+        if self.is_fresh():
+            return
+        async with self._lock:
+            if self.is_fresh():
+                return
+            try:
+                async for session in get_session():
+                    await self.load(session)
+            except Exception as e:
+                if not self.loaded:
+                    raise
+                # Roles rarely change, a stale map beats failing every admin check
+                logger.error(f"Role cache refresh failed, keeping the previous roles: {e}")
+                self._loaded_at = time.monotonic()
+
+    def role_name(self, role_id: Optional[str]) -> Optional[str]:
+        return self.roles.get(role_id)
+
+
+role_cache = RoleCache(settings.role_cache_ttl)
+
+
+async def require_admin(user):
+    """Raise unless the user holds the admin role, answered from memory."""
+    from app.api.roles.models import RoleEnum
+
+    if not hasattr(user, "role_id"):  # ✅ Ensure role_id exists in User model
+        raise HTTPException(status_code=500, detail="User model does not have role_id")
+
+    await role_cache.ensure_loaded()
+
+    if RoleEnum.admin.value not in role_cache.roles.values():
+        raise HTTPException(status_code=500, detail="Admin role not found in database")
+
+    if role_cache.role_name(user.role_id) != RoleEnum.admin.value:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+
+async def has_admin_role(user) -> bool:
+    """Non-raising variant of `require_admin` for code that only narrows what a user sees."""
+    from app.api.roles.models import RoleEnum
+
+    await role_cache.ensure_loaded()
+    return role_cache.role_name(getattr(user, "role_id", None)) == RoleEnum.admin.value
@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -7,6 +7,8 @@ from jose import jwt, ExpiredSignatureError
 from app.utils.security import decode_token
 from app.core.database import get_session
 from app.api.users.models import User
+from app.utils.principal_cache import principal_cache
+from app.utils.token_blacklist import is_token_blacklisted
 
 http_bearer = HTTPBearer(auto_error=False)
 
@@ -17,7 +19,11 @@ async def get_current_user(
     if credentials is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing authentication token")
 
-    token = credentials.credentials
+    return await resolve_user(credentials.credentials, db)
+
+
+async def resolve_user(token: str, db: AsyncSession):
+    """Validate a bearer token and return its user, from the principal cache when possible."""
     try:
         payload = decode_token(token)  # ✅ Ensure `decode_token` correctly extracts the payload
     except ExpiredSignatureError:
@@ -25,15 +31,37 @@ async def get_current_user(
     except jwt.JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
+    if await is_token_blacklisted(token, db, payload):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked")
+
     username: str = payload.get("username")
     if username is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-    async for session in get_session():  # ✅ Use an async context for session
-        query = await session.execute(select(User).where(User.username == username))
-        user = query.scalars().first()
+    user = principal_cache.get(username)
+    if user is not None:
+        return user
+
+    query = await db.execute(select(User).where(User.username == username))
+    user = query.scalars().first()
 
-        if user is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+
+    # Detach so the cached principal is never tied to this request's session
+    db.expunge(user)
+    principal_cache.put(username, user)
+    return user
+
+
+async def get_websocket_user(websocket: WebSocket):
+    """WebSocket variant of `get_current_user`; browsers cannot set headers, so `?token=` is accepted too."""
+    token = websocket.query_params.get("token")
+    auth_header = websocket.headers.get("Authorization")
+    if not token and auth_header and auth_header.lower().startswith("bearer "):
+        token = auth_header[7:]
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing authentication token")
 
-        return user  # ✅ Return user after successful validation
\ No newline at end of file
+    async for session in get_session():
+        return await resolve_user(token, session)
@@ -1,81 +1,263 @@
+import asyncio
+import re
+import secrets
+from ipaddress import IPv4Address, IPv4Network
+from typing import Iterable, List, Optional, Union
+
+from app.core.config import settings
 from app.logs.logging import logger
 from fastapi import HTTPException
-from sqlalchemy import func, select, update
+from sqlalchemy import insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from ipaddress import IPv4Network
 
 
+# First byte of the bitmap that still has a free bit in it
+_FREE_BYTE = re.compile(b"[^\xff]")
 
-async def populate_ip_pool(db: AsyncSession, subnet: str):
-    from app.api.peers.models import WireGuardIPPool
-    """Populate the database with all available IPs from the subnet."""
 
-    # Check if the table already contains the values matching the subnet length
-    existing_ips_count = await db.scalar(select(func.count()).select_from(WireGuardIPPool))
-    subnet_ips_count = len(list(IPv4Network(subnet).hosts())) - 1  # Exclude the first IP
+class IPAllocator:
+    """
+    Address pool for one subnet kept as a bitmap, bit `i` set means
+    `network_address + i` is assigned. A /16 fits in 8 KiB, so the whole
+    pool is persisted in one row and cached in memory.
+    """
 
-    if existing_ips_count >= subnet_ips_count:
-        logger.info("IP Pool already populated")
-        return
-    else:
+    def __init__(self, subnet: str, bitmap: Optional[bytes] = None, version: int = 0):
+        self.network = IPv4Network(subnet, strict=False)
+        self.size = self.network.num_addresses
+        self.bitmap = bytearray(bitmap) if bitmap else bytearray((self.size + 7) // 8)
+        self.version = version
 
-        # Exclude the first IP (e.g., 10.8.0.1) as it's usually the gateway
-        ip_list = [str(ip) for ip in IPv4Network(subnet).hosts()][1:]
+        # Network address, the first host (gateway) and broadcast are never handed out
+        self.first = min(2, self.size - 1)
+        self.last = self.size - 2 if self.size > 2 else self.size - 1
+        self._hint = self.first
 
-        # Insert into database if not already populated
-        for ip in ip_list:
-            result = await db.execute(select(WireGuardIPPool).where(WireGuardIPPool.ip_address == ip))
-            if not result.scalars().first():
-                db.add(WireGuardIPPool(ip_address=ip, is_assigned=False))
+    def _index(self, ip: str) -> int:
+        address = IPv4Address(ip)
+        if address not in self.network:
+            raise HTTPException(status_code=400, detail=f"IP {ip} is outside of {self.network}")
+        return int(address) - int(self.network.network_address)
 
-        logger.info("IP Pool populated")
+    def _address(self, index: int) -> str:
+        return str(self.network.network_address + index)
 
-        await db.commit()
+    def is_assigned(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
 
+    def _set(self, index: int):
+        self.bitmap[index >> 3] |= 1 << (index & 7)
 
-async def get_next_available_ip(db: AsyncSession, ip: str = None) -> str:
-    from app.api.peers.models import WireGuardIPPool
+    def _clear(self, index: int):
+        self.bitmap[index >> 3] &= ~(1 << (index & 7)) & 0xFF
 
-    """Retrieve a specific unassigned IP if provided, otherwise get the next available IP."""
+    def _find_free(self, start: int) -> Optional[int]:
+        match = _FREE_BYTE.search(self.bitmap, start >> 3)
+        while match:
+            byte_index = match.start()
+            for index in range(max(byte_index << 3, start), (byte_index << 3) + 8):
+                if index > self.last:
+                    return None
+                if not self.is_assigned(index):
+                    return index
+            match = _FREE_BYTE.search(self.bitmap, byte_index + 1)
+        return None
 
-    if ip:
-        # Check if the provided IP is available
-        result = await db.execute(
-            select(WireGuardIPPool).where(
-                WireGuardIPPool.ip_address == ip, 
-                WireGuardIPPool.is_assigned == False
-            ).limit(1).with_for_update()
-        )
+    def allocate(self, ip: Optional[str] = None) -> str:
+        """Assign a specific IP if given, otherwise the next free one."""
+        if ip:
+            index = self._index(ip)
+            if index < self.first or index > self.last or self.is_assigned(index):
+                raise HTTPException(
+                    status_code=400, detail="No available IPs left or provided IP is already assigned")
+        else:
+            index = self._find_free(self._hint)
+            if index is None and self._hint > self.first:
+                index = self._find_free(self.first)
+            if index is None:
+                raise HTTPException(
+                    status_code=400, detail="No available IPs left or provided IP is already assigned")
+            self._hint = index + 1
+
+        self._set(index)
+        return self._address(index)
+
+    def release(self, ip: str):
+        index = self._index(ip)
+        self._clear(index)
+        if index < self._hint:
+            self._hint = max(index, self.first)
+
+    def mark_assigned(self, ips: Iterable[str]):
+        for ip in ips:
+            index = self._index(ip)
+            if self.first <= index <= self.last:
+                self._set(index)
+
+
+_allocator: Optional[IPAllocator] = None
+_allocator_lock = asyncio.Lock()
+
+
+async def populate_ip_pool(db: AsyncSession, subnet: str):
+    """
+    Load the pool bitmap for the subnet and make sure every address held by
+    a peer is marked in it. The missing addresses are a single set difference
+    against one SELECT of the peer IPs and are written back in one statement.
+    """
+    from app.api.peers.models import WireGuardIPAllocation, WireGuardPeer
+    global _allocator
+
+    subnet = str(IPv4Network(subnet, strict=False))
+    result = await db.execute(
+        select(WireGuardIPAllocation).where(WireGuardIPAllocation.subnet == subnet))
+    row = result.scalars().first()
+
+    allocator = IPAllocator(subnet, row.bitmap, row.version) if row else IPAllocator(subnet)
+
+    assigned = await db.execute(
+        select(WireGuardPeer.assigned_ip).where(WireGuardPeer.assigned_ip.is_not(None)))
+    peer_ips = {ip for ip in assigned.scalars().all() if IPv4Address(ip) in allocator.network}
+    missing = {ip for ip in peer_ips if not allocator.is_assigned(allocator._index(ip))}
+    allocator.mark_assigned(missing)
+
+    if row is None:
+        await db.execute(insert(WireGuardIPAllocation).values(
+            subnet=subnet, bitmap=bytes(allocator.bitmap), version=allocator.version))
+        await db.commit()
+        logger.info(f"IP Pool populated for {subnet} ({allocator.last - allocator.first + 1} hosts)")
+    elif missing:
+        await _store_allocator(db, allocator)
+        await db.commit()
+        logger.info(f"IP Pool repaired, marked {len(missing)} peer IPs as assigned")
     else:
-        # Select the next available IP
+        logger.info("IP Pool already populated")
+
+    _allocator = allocator
+
+
+async def _lock_allocator(db: AsyncSession) -> IPAllocator:
+    """Row-lock the pool and refresh the cached bitmap if another worker changed it."""
+    from app.api.peers.models import WireGuardIPAllocation
+
+    if _allocator is None:
+        await populate_ip_pool(db, str(settings.allowed_ips))
+
+    result = await db.execute(
+        select(WireGuardIPAllocation.version).where(
+            WireGuardIPAllocation.subnet == str(_allocator.network)
+        ).with_for_update())
+    version = result.scalar_one()
+
+    if version != _allocator.version:
         result = await db.execute(
-            select(WireGuardIPPool).where(
-                WireGuardIPPool.is_assigned == False
-            ).limit(1).with_for_update()
-        )
-    available_ip = result.scalars().first()
-    if not available_ip:
-        raise HTTPException(status_code=400, detail="No available IPs left or provided IP is already assigned")
-    # Mark the IP as assigned
+            select(WireGuardIPAllocation.bitmap).where(
+                WireGuardIPAllocation.subnet == str(_allocator.network)))
+        _allocator.bitmap = bytearray(result.scalar_one())
+        _allocator.version = version
+        _allocator._hint = _allocator.first
+
+    return _allocator
+
+
+def invalidate_allocator():
+    """
+    Force the next pool operation to reload the bitmap from the database.
+    Callers of `allocate_ips`/`release_ips` must call this when they roll back.
+    """
+    if _allocator is not None:
+        _allocator.version = -1
+
+
+async def _store_allocator(db: AsyncSession, allocator: IPAllocator):
+    from app.api.peers.models import WireGuardIPAllocation
+
+    # A random token rather than `+= 1`: a worker whose write was rolled back can
+    # never hold the same version as the one another worker later commits
+    allocator.version = secrets.randbits(31)
     await db.execute(
-        update(WireGuardIPPool)
-        .where(WireGuardIPPool.ip_address == available_ip.ip_address)
-        .values(is_assigned=True)
+        update(WireGuardIPAllocation)
+        .where(WireGuardIPAllocation.subnet == str(allocator.network))
+        .values(bitmap=bytes(allocator.bitmap), version=allocator.version)
     )
 
-    await db.commit()  # Ensure the change is committed
 
-    return available_ip.ip_address
+async def get_next_available_ip(db: AsyncSession, ip: str = None) -> str:
+    """Retrieve a specific unassigned IP if provided, otherwise get the next available IP."""
+    async with _allocator_lock:
+        allocator = await _lock_allocator(db)
+        try:
+            assigned_ip = allocator.allocate(ip)
+            await _store_allocator(db, allocator)
+            await db.commit()  # Ensure the change is committed
+        except BaseException:
+            # Force a reload from the database, the in-memory bitmap may be ahead of it
+            allocator.version = -1
+            await db.rollback()
+            raise
+
+    return assigned_ip
+
 
 async def release_ip(db: AsyncSession, ip: str):
-    from app.api.peers.models import WireGuardIPPool
-
     """Mark an IP as available when a peer is deleted."""
-    result = await db.execute(
-        select(WireGuardIPPool).where(WireGuardIPPool.ip_address == ip)
-    )
+    async with _allocator_lock:
+        allocator = await _lock_allocator(db)
+        try:
+            allocator.release(ip)
+            await _store_allocator(db, allocator)
+            await db.commit()
+        except BaseException:
+            allocator.version = -1
+            await db.rollback()
+            raise
 
-    ip_entry = result.scalars().first()
-    if ip_entry:
-        ip_entry.is_assigned = False
-        await db.commit()
+
+async def allocate_ips(db: AsyncSession, requested: List[Optional[str]]) -> List[Union[str, HTTPException]]:
+    """
+    Allocate one address per entry of `requested` (a specific IP or None) under
+    a single pool lock and a single bitmap write. Entries that cannot be served
+    get the HTTPException instead of an address. Nothing is committed, the
+    caller commits together with the rows that use the addresses and calls
+    `invalidate_allocator` if it rolls back instead.
+    """
+    if not requested:
+        return []
+
+    async with _allocator_lock:
+        allocator = await _lock_allocator(db)
+        # Specific addresses first so the automatic ones cannot take them
+        order = sorted(range(len(requested)), key=lambda i: requested[i] is None)
+        by_index = {}
+        for i in order:
+            try:
+                by_index[i] = allocator.allocate(requested[i])
+            except HTTPException as e:
+                by_index[i] = e
+        results = [by_index[i] for i in range(len(requested))]
+        await _store_allocator(db, allocator)
+
+    return results
+
+
+async def release_ips(db: AsyncSession, ips: List[str]):
+    """
+    Return many addresses to the pool with a single bitmap write, without
+    committing. Callers call `invalidate_allocator` if they roll back.
+    Addresses outside the pool (left from an older subnet) are skipped.
+    """
+    if not ips:
+        return
+
+    async with _allocator_lock:
+        allocator = await _lock_allocator(db)
+        for ip in ips:
+            try:
+                in_pool = IPv4Address(ip) in allocator.network
+            except ValueError:
+                in_pool = False
+            if not in_pool:
+                logger.warning(f"Not releasing {ip}, it is not part of {allocator.network}")
+                continue
+            allocator.release(ip)
+        await _store_allocator(db, allocator)
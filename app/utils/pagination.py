@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+
+
+'''
+-----------------------------------------------------
+|      Keyset pagination on (created_at, id)        |
+-----------------------------------------------------
+'''
+
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_paginate(query: Select, model, cursor: Optional[str], limit: int) -> Select:
+    """Order by (created_at, id), start after the cursor and fetch one extra row to detect a next page."""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.where(tuple_(model.created_at, model.id) > tuple_(created_at, row_id))
+    return query.order_by(model.created_at, model.id).limit(limit + 1)
+
+
+def page(items: List[dict], rows: list, limit: int) -> dict:
+    """Trim the look-ahead row and build the `next_cursor` from the last row returned."""
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return {"items": items[:limit], "next_cursor": next_cursor}
+
+
+'''
+-----------------------------------------------------
+|            Sparse fieldsets (?fields=)            |
+-----------------------------------------------------
+'''
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[Set[str]]:
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def pick_fields(item: dict, fields: Optional[Set[str]]) -> dict:
+    if fields is None:
+        return item
+    return {key: value for key, value in item.items() if key in fields}
@@ -1,5 +1,14 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def verify_password(plain_password, hashed_password):
@@ -7,3 +16,90 @@ def verify_password(plain_password, hashed_password):
 
 def get_password_hash(password):
     return pwd_context.hash(password)
+
+
+'''
+-----------------------------------------------------
+|     bcrypt off the event loop, bounded pool       |
+-----------------------------------------------------
+'''
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+
+_hash_stats = {
+    "queued": 0,
+    "running": 0,
+    "max_queue_depth": 0,
+    "completed": 0,
+    "total_wait_ms": 0.0,
+    "total_run_ms": 0.0,
+    "rejected_logins": 0,
+}
+# Updated from the event loop and from the hash threads, `+=` on a dict item is not atomic
+_hash_stats_lock = threading.Lock()
+
+
+def _timed(func, submitted_at, *args):
+    started = time.perf_counter()
+    with _hash_stats_lock:
+        _hash_stats["queued"] -= 1
+        _hash_stats["running"] += 1
+        _hash_stats["total_wait_ms"] += (started - submitted_at) * 1000
+    try:
+        return func(*args)
+    finally:
+        with _hash_stats_lock:
+            _hash_stats["running"] -= 1
+            _hash_stats["completed"] += 1
+            _hash_stats["total_run_ms"] += (time.perf_counter() - started) * 1000
+
+
+async def _run_in_hash_pool(func, *args):
+    with _hash_stats_lock:
+        _hash_stats["queued"] += 1
+        _hash_stats["max_queue_depth"] = max(_hash_stats["max_queue_depth"], _hash_stats["queued"])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_hash_executor, _timed, func, time.perf_counter(), *args)
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password) -> str:
+    return await _run_in_hash_pool(get_password_hash, password)
+
+
+def password_hash_stats() -> dict:
+    with _hash_stats_lock:
+        stats = dict(_hash_stats)
+    completed = stats["completed"] or 1
+    return {
+        "workers": settings.password_hash_workers,
+        "queue_depth": stats["queued"],
+        "running": stats["running"],
+        "max_queue_depth": stats["max_queue_depth"],
+        "completed": stats["completed"],
+        "avg_wait_ms": round(stats["total_wait_ms"] / completed, 2),
+        "avg_run_ms": round(stats["total_run_ms"] / completed, 2),
+        "rejected_logins": stats["rejected_logins"],
+    }
+
+
+_login_slots = asyncio.Semaphore(settings.login_concurrency)
+
+
+@asynccontextmanager
+async def login_slot():
+    """Cap concurrent logins, waiting briefly before answering 429 so a burst cannot starve the server."""
+    try:
+        await asyncio.wait_for(_login_slots.acquire(), timeout=settings.login_queue_timeout)
+    except asyncio.TimeoutError:
+        with _hash_stats_lock:
+            _hash_stats["rejected_logins"] += 1
+        raise HTTPException(status_code=429, detail="Too many login attempts, please retry shortly")
+    try:
+        yield
+    finally:
+        _login_slots.release()
@@ -0,0 +1,262 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_session, lease_db_engine
+from app.logs.logging import logger
+
+COUNTER_MAX = 2 ** 64 - 1
+# A drop from within this distance of COUNTER_MAX is a wrap, anything else a reset
+WRAP_WINDOW = 2 ** 32
+
+
+def counter_delta(previous: int, current: int) -> int:
+    """Bytes transferred between two readings of a cumulative `wg` counter."""
+    if current >= previous:
+        return current - previous
+    if previous > COUNTER_MAX - WRAP_WINDOW:
+        return COUNTER_MAX - previous + current + 1
+    # Interface bounced or the peer was re-keyed, the counter restarted at zero
+    return current
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class AccountingEngine:
+    """
+    Turns raw counter samples into monotonic per-peer totals.
+
+    Every sample is processed incrementally against the previous reading of
+    each key, so the cost is O(peers) per sample regardless of history.
+    Deltas accumulate in memory and are folded into `peer_accounts` on flush
+    with one upsert, after which monthly quotas are enforced.
+    """
+
+    def __init__(self):
+        self._last: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, List[int]] = {}
+        self._first_sample = True
+
+    async def load(self, db: AsyncSession):
+        """
+        Resume from the counters persisted at the last flush, so a restart or
+        a change of accounting worker neither loses nor double counts.
+        """
+        from app.api.peers.models import PeerAccount, WireGuardPeer
+
+        result = await db.execute(
+            select(WireGuardPeer.public_key, PeerAccount.last_rx, PeerAccount.last_tx)
+            .join(PeerAccount, PeerAccount.peer_id == WireGuardPeer.id))
+        self._last = {public_key: (rx, tx) for public_key, rx, tx in result.all()}
+        self._first_sample = True
+
+    def process(self, peers: Dict[str, dict]) -> Dict[str, Tuple[int, int]]:
+        """Fold one sample in and return the (rx, tx) bytes each peer moved since the previous one."""
+        deltas = {}
+        for public_key, peer in peers.items():
+            rx, tx = peer["rx"], peer["tx"]
+            last = self._last.get(public_key)
+            self._last[public_key] = (rx, tx)
+
+            if last is None:
+                # Keys already on the interface at startup are a baseline; keys that
+                # appear later are new peers whose counters started at zero
+                if self._first_sample:
+                    self._pending.setdefault(public_key, [0, 0])
+                    continue
+                last = (0, 0)
+            if last == (rx, tx):
+                continue
+
+            rx_delta, tx_delta = counter_delta(last[0], rx), counter_delta(last[1], tx)
+            pending = self._pending.setdefault(public_key, [0, 0])
+            pending[0] += rx_delta
+            pending[1] += tx_delta
+            if rx_delta or tx_delta:
+                deltas[public_key] = (rx_delta, tx_delta)
+
+        self._first_sample = False
+        return deltas
+
+    async def flush(self, db: AsyncSession, enforce_quotas: bool = True):
+        from app.api.peers.models import PeerAccount, WireGuardPeer
+
+        if not self._pending:
+            if enforce_quotas:
+                await self.enforce_quotas(db)
+            return
+        pending, self._pending = self._pending, {}
+
+        try:
+            result = await db.execute(
+                select(WireGuardPeer.public_key, WireGuardPeer.id)
+                .where(WireGuardPeer.public_key.in_(list(pending))))
+            peer_ids = dict(result.all())
+            period = month_start(datetime.utcnow())
+
+            rows = [
+                {"id": uuid.uuid4().hex, "peer_id": peer_ids[public_key],
+                 "last_rx": self._last.get(public_key, (0, 0))[0],
+                 "last_tx": self._last.get(public_key, (0, 0))[1],
+                 "total_rx_bytes": rx, "total_tx_bytes": tx, "period_start": period,
+                 "period_rx_bytes": rx, "period_tx_bytes": tx}
+                for public_key, (rx, tx) in pending.items() if public_key in peer_ids
+            ]
+            if rows:
+                statement = insert(PeerAccount)
+                same_period = PeerAccount.period_start == statement.excluded.period_start
+                statement = statement.on_conflict_do_update(
+                    index_elements=[PeerAccount.peer_id],
+                    set_={
+                        "last_rx": statement.excluded.last_rx,
+                        "last_tx": statement.excluded.last_tx,
+                        "total_rx_bytes": PeerAccount.total_rx_bytes + statement.excluded.total_rx_bytes,
+                        "total_tx_bytes": PeerAccount.total_tx_bytes + statement.excluded.total_tx_bytes,
+                        "period_rx_bytes": case(
+                            (same_period, PeerAccount.period_rx_bytes + statement.excluded.period_rx_bytes),
+                            else_=statement.excluded.period_rx_bytes),
+                        "period_tx_bytes": case(
+                            (same_period, PeerAccount.period_tx_bytes + statement.excluded.period_tx_bytes),
+                            else_=statement.excluded.period_tx_bytes),
+                        "period_start": statement.excluded.period_start,
+                    })
+                for offset in range(0, len(rows), 1000):
+                    await db.execute(statement, rows[offset:offset + 1000])
+                await db.commit()
+        except Exception:
+            for public_key, (rx, tx) in pending.items():
+                merged = self._pending.setdefault(public_key, [0, 0])
+                merged[0] += rx
+                merged[1] += tx
+            raise
+
+        if enforce_quotas:
+            await self.enforce_quotas(db)
+
+    async def enforce_quotas(self, db: AsyncSession):
+        """Disable peers over their monthly quota and bring back the ones whose month rolled over."""
+        from app.api.peers.models import PeerAccount
+        from app.api.peers.services import peer_service
+
+        period = month_start(datetime.utcnow())
+
+        result = await db.execute(
+            select(PeerAccount.peer_id).where(
+                PeerAccount.disabled_at.is_(None),
+                PeerAccount.monthly_quota_bytes.is_not(None),
+                PeerAccount.period_start == period,
+                PeerAccount.period_rx_bytes + PeerAccount.period_tx_bytes >= PeerAccount.monthly_quota_bytes))
+        over_quota = result.scalars().all()
+
+        result = await db.execute(
+            select(PeerAccount.peer_id).where(
+                PeerAccount.disabled_at.is_not(None), PeerAccount.period_start < period))
+        rolled_over = result.scalars().all()
+
+        if rolled_over:
+            await db.execute(
+                update(PeerAccount)
+                .where(PeerAccount.peer_id.in_(rolled_over))
+                .values(period_start=period, period_rx_bytes=0, period_tx_bytes=0))
+            await peer_service(db).set_peers_enabled(rolled_over, True, "Quota period reset")
+        if over_quota:
+            await peer_service(db).set_peers_enabled(over_quota, False, "Monthly quota exceeded")
+            logger.info(f"Disabled {len(over_quota)} peers over their monthly quota")
+
+
+accounting_engine = AccountingEngine()
+
+
+class AccountingLease:
+    """
+    Session-level Postgres advisory lock that elects the one worker allowed
+    to account traffic. Every worker samples the interface for its own
+    telemetry cache, but deltas are added to the database, so only the lease
+    holder may feed them in or the totals would be multiplied by the number
+    of workers. The lock lives on an unpooled connection, so it is released
+    when that connection closes and another worker takes over on a crash.
+    Workers without the lease retry at most every `retry_interval` seconds.
+    """
+
+    def __init__(self, key: int, retry_interval: float):
+        self.key = key
+        self.retry_interval = retry_interval
+        self._conn = None
+        self._next_attempt = 0.0
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None
+
+    async def acquire(self) -> bool:
+        """Keep or try to take the lease, True if this worker holds it afterwards."""
+        if self._conn is not None:
+            try:
+                await self._conn.execute(text("SELECT 1"))
+                await self._conn.commit()
+                return True
+            except Exception as e:
+                logger.warning(f'Lost the accounting lease connection: {e}')
+                await self.release()
+
+        if time.monotonic() < self._next_attempt:
+            return False
+        self._next_attempt = time.monotonic() + self.retry_interval
+
+        conn = await lease_db_engine.connect()
+        try:
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key})
+            await conn.commit()
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+
+        self._conn = conn
+        async for session in get_session():
+            await accounting_engine.load(session)
+        logger.info('This worker now accounts peer traffic')
+        return True
+
+    async def release(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+            await conn.commit()
+        except Exception:
+            pass  # Closing the unpooled connection below ends the backend and its lock
+        try:
+            await conn.close()
+        except Exception as e:
+            logger.warning(f'Error closing the accounting lease connection: {e}')
+
+
+accounting_lease = AccountingLease(settings.accounting_lock_key, settings.accounting_lease_retry)
+
+
+async def flush_accounting():
+    async for session in get_session():
+        # Quotas are enforced by the lease holder only, so peers are disabled once
+        await accounting_engine.flush(session, enforce_quotas=accounting_lease.held)
+
+
+async def start_accounting_flusher(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_accounting()
+        except Exception as e:
+            logger.error(f'Error flushing peer accounting: {e}')
@@ -0,0 +1,160 @@
+import asyncio
+import io
+import re
+import time
+import zipfile
+from collections import OrderedDict
+from typing import AsyncIterator, Iterable, Optional
+
+from app.core.config import settings
+
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+def render_peer_config(private_key: str, assigned_ip: str, server_public_key: str, server_ips: str) -> str:
+    """Client `.conf` for a peer, the same text `generate_peer_config` always produced."""
+    match = re.search(r"/(\d+)", server_ips)
+    peer_subnet = match.group(1) if match else "32"
+    return f"""
+[Interface]
+PrivateKey = {private_key}
+Address = {assigned_ip}/{peer_subnet}
+
+[Peer]
+PublicKey = {server_public_key}
+Endpoint = {settings.endpoint}
+AllowedIPs = {settings.allowed_ips}
+PersistentKeepalive = 30
+"""
+
+
+def render_qr(config: str, image: str) -> bytes:
+    """QR code of a config as PNG (pure pypng, no Pillow) or SVG."""
+    import qrcode
+    import qrcode.image.pure
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, border=2)
+    qr.add_data(config)
+    qr.make(fit=True)
+    factory = qrcode.image.pure.PyPNGImage if image == "png" else qrcode.image.svg.SvgPathImage
+    buffer = io.BytesIO()
+    qr.make_image(image_factory=factory).save(buffer)
+    return buffer.getvalue()
+
+
+class ConfigEntry:
+    __slots__ = ("expires_at", "user_id", "server_id", "peer_name", "config", "qr")
+
+    def __init__(self, expires_at: float, user_id: str, server_id: str, peer_name: str, config: str):
+        self.expires_at = expires_at
+        self.user_id = user_id
+        self.server_id = server_id
+        self.peer_name = peer_name
+        self.config = config
+        self.qr = {}
+
+
+class ConfigCache:
+    """
+    Bounded LRU of rendered client configs keyed by peer ID. QR images are
+    rendered on first request per format and kept with the config. Entries
+    are dropped when their peer or server changes, and expire after `ttl`
+    seconds so changes made by another worker are picked up eventually.
+    Rows read from a lagging replica are rendered but never cached, or an
+    old key could be cached again right after its invalidation.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, ConfigEntry]" = OrderedDict()
+
+    def get(self, peer_id: str) -> Optional[ConfigEntry]:
+        entry = self._entries.get(peer_id)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.expires_at:
+            del self._entries[peer_id]
+            return None
+        self._entries.move_to_end(peer_id)
+        return entry
+
+    def render(self, row) -> ConfigEntry:
+        """Render a config from a `peer_service.CONFIG_COLUMNS` row without caching it."""
+        return ConfigEntry(
+            time.monotonic() + self.ttl, row.user_id, row.server_id, row.peer_name,
+            render_peer_config(row.private_key, row.assigned_ip, row.server_public_key, row.server_ips))
+
+    def put(self, row) -> ConfigEntry:
+        """Render and cache a config, only for rows read from the primary."""
+        entry = self.render(row)
+        self._entries[row.id] = entry
+        self._entries.move_to_end(row.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_or_render(self, row, cache: bool = True) -> ConfigEntry:
+        return self.get(row.id) or (self.put(row) if cache else self.render(row))
+
+    async def qr(self, entry: ConfigEntry, image: str) -> bytes:
+        if image not in entry.qr:
+            entry.qr[image] = await asyncio.to_thread(render_qr, entry.config, image)
+        return entry.qr[image]
+
+    def invalidate(self, *peer_ids: str):
+        for peer_id in peer_ids:
+            self._entries.pop(peer_id, None)
+
+    def invalidate_server(self, server_id: str):
+        for peer_id in [peer_id for peer_id, entry in self._entries.items() if entry.server_id == server_id]:
+            del self._entries[peer_id]
+
+
+config_cache = ConfigCache(settings.config_cache_size, settings.config_cache_ttl)
+
+
+def config_filename(peer_name: Optional[str], peer_id: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", peer_name or "").strip("._") or peer_id
+    return f"{name}.conf"
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Unseekable sink for `ZipFile`; each finished member is drained and streamed out."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def stream_config_zip(rows: Iterable, cache: bool = True) -> AsyncIterator[bytes]:
+    """
+    Zip of one `.conf` per row, yielded member by member. ZipFile writes data
+    descriptors to an unseekable sink, so only one config is held at a time.
+    Pass `cache=False` for rows that came from the replica.
+    """
+    sink = _ChunkWriter()
+    used = set()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for row in rows:
+            filename = config_filename(row.peer_name, row.id)
+            if filename in used:
+                filename = f"{filename[:-5]}-{row.id[:8]}.conf"
+            used.add(filename)
+
+            archive.writestr(filename, config_cache.get_or_render(row, cache).config)
+            yield sink.drain()
+            await asyncio.sleep(0)
+    yield sink.drain()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from app.core.config import settings
+
+
+class Subscriber:
+    """One stream client. `peer_ids` maps the public keys it may see to their peer IDs."""
+
+    def __init__(self, peer_ids: Dict[str, str], queue_size: int):
+        self.peer_ids = peer_ids
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def offer(self, message: dict):
+        # A slow client loses its oldest update rather than holding the sampler up
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class PeerStatsBroadcaster:
+    """
+    Fans every telemetry sample out to all stream subscribers. Deltas are
+    computed once per sample, so each extra watcher only costs a dict filter.
+    """
+
+    def __init__(self, queue_size: int = 10):
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscriber] = set()
+
+    def subscribe(self, peer_ids: Dict[str, str]) -> Subscriber:
+        subscriber = Subscriber(peer_ids, self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    @staticmethod
+    def compute_deltas(previous: Dict[str, dict], current: Dict[str, dict], elapsed: Optional[float]) -> Dict[str, dict]:
+        now = time.time()
+        deltas = {}
+        for public_key, peer in current.items():
+            before = previous.get(public_key)
+            rx_rate = tx_rate = 0.0
+            if before and elapsed:
+                # Counters go backwards when the interface or the peer is reset
+                rx_rate = max(peer["rx"] - before["rx"], 0) / elapsed
+                tx_rate = max(peer["tx"] - before["tx"], 0) / elapsed
+
+            handshake = peer.get("latest_handshake")
+            handshake_age = now - handshake if isinstance(handshake, int) and handshake > 0 else None
+            endpoint_changed = before is not None and before.get("endpoint") != peer.get("endpoint")
+
+            if before and not rx_rate and not tx_rate and not endpoint_changed \
+                    and before.get("latest_handshake") == handshake:
+                continue
+
+            deltas[public_key] = {
+                "rx": peer["rx"],
+                "tx": peer["tx"],
+                "rx_rate": round(rx_rate, 1),
+                "tx_rate": round(tx_rate, 1),
+                "handshake_age": round(handshake_age, 1) if handshake_age is not None else None,
+                "endpoint": peer.get("endpoint"),
+                "endpoint_changed": endpoint_changed
+            }
+        return deltas
+
+    def publish(self, previous: Dict[str, dict], current: Dict[str, dict],
+                elapsed: Optional[float], sampled_at: datetime):
+        if not self.subscribers:
+            return
+
+        deltas = self.compute_deltas(previous, current, elapsed)
+        for subscriber in list(self.subscribers):
+            visible = {
+                subscriber.peer_ids[public_key]: delta
+                for public_key, delta in deltas.items() if public_key in subscriber.peer_ids
+            }
+            subscriber.offer({
+                "sampled_at": sampled_at.isoformat(),
+                "interval": round(elapsed, 3) if elapsed else None,
+                "peers": visible
+            })
+
+
+peer_stats_broadcaster = PeerStatsBroadcaster(settings.stream_queue_size)
@@ -0,0 +1,159 @@
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_session
+from app.logs.logging import logger
+
+RESOLUTIONS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    moment = moment.astimezone(timezone.utc).replace(tzinfo=None, second=0, microsecond=0)
+    if resolution in ("hour", "day"):
+        moment = moment.replace(minute=0)
+    if resolution == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+class UsageRecorder:
+    """
+    Turns telemetry samples into per-peer traffic history.
+
+    Each sample lands in a fixed-size ring buffer per peer (recent raw
+    samples, memory only) and its delta is added to pending minute, hour
+    and day buckets. Pending buckets are flushed periodically as chunked
+    multi-row upserts, so range queries read pre-aggregated rows only.
+    """
+
+    def __init__(self, ring_size: int):
+        self.ring_size = ring_size
+        self.samples: Dict[str, Deque[Tuple[datetime, int, int]]] = {}
+        self._pending: Dict[Tuple[str, str, datetime], List[int]] = {}
+
+    def record(self, peers: Dict[str, dict], deltas: Dict[str, Tuple[int, int]], sampled_at: datetime):
+        """Store the raw sample and add the reset-aware `deltas` from the accounting engine to the buckets."""
+        for public_key, peer in peers.items():
+            ring = self.samples.get(public_key)
+            if ring is None:
+                ring = self.samples[public_key] = deque(maxlen=self.ring_size)
+            ring.append((sampled_at, peer["rx"], peer["tx"]))
+
+        starts = {resolution: bucket_start(sampled_at, resolution) for resolution in RESOLUTIONS}
+        for public_key, (rx_delta, tx_delta) in deltas.items():
+            for resolution, start in starts.items():
+                bucket = self._pending.setdefault((public_key, resolution, start), [0, 0])
+                bucket[0] += rx_delta
+                bucket[1] += tx_delta
+
+        # Forget peers that left the interface
+        for public_key in set(self.samples) - set(peers):
+            self.samples.pop(public_key, None)
+
+    def recent(self, public_key: str, start: datetime, end: datetime) -> list:
+        return [
+            {"timestamp": timestamp, "rx": rx, "tx": tx}
+            for timestamp, rx, tx in self.samples.get(public_key, ())
+            if start <= timestamp <= end
+        ]
+
+    async def flush(self, db: AsyncSession):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+
+        try:
+            await self._write(db, pending)
+        except Exception:
+            # Keep the deltas for the next flush instead of losing them
+            for key, (rx, tx) in pending.items():
+                bucket = self._pending.setdefault(key, [0, 0])
+                bucket[0] += rx
+                bucket[1] += tx
+            raise
+
+    async def _write(self, db: AsyncSession, pending: Dict[Tuple[str, str, datetime], List[int]]):
+        from app.api.peers.models import PeerUsageBucket, WireGuardPeer
+
+        public_keys = {public_key for public_key, _, _ in pending}
+        result = await db.execute(
+            select(WireGuardPeer.public_key, WireGuardPeer.id).where(WireGuardPeer.public_key.in_(public_keys)))
+        peer_ids = dict(result.all())
+
+        rows = [
+            {"id": uuid.uuid4().hex, "peer_id": peer_ids[public_key], "resolution": resolution,
+             "bucket_start": start, "rx_bytes": rx, "tx_bytes": tx}
+            for (public_key, resolution, start), (rx, tx) in pending.items()
+            if public_key in peer_ids
+        ]
+        if not rows:
+            return
+
+        statement = insert(PeerUsageBucket)
+        statement = statement.on_conflict_do_update(
+            constraint="uq_peer_usage_bucket",
+            set_={
+                "rx_bytes": PeerUsageBucket.rx_bytes + statement.excluded.rx_bytes,
+                "tx_bytes": PeerUsageBucket.tx_bytes + statement.excluded.tx_bytes,
+            })
+        for offset in range(0, len(rows), 1000):
+            await db.execute(statement, rows[offset:offset + 1000])
+
+        # Minute buckets are only kept for a short window, hours and days stay
+        cutoff = datetime.utcnow() - timedelta(days=settings.usage_minute_retention_days)
+        await db.execute(delete(PeerUsageBucket).where(
+            PeerUsageBucket.resolution == "minute", PeerUsageBucket.bucket_start < cutoff))
+        await db.commit()
+
+
+usage_recorder = UsageRecorder(settings.usage_ring_size)
+
+
+async def flush_usage():
+    async for session in get_session():
+        await usage_recorder.flush(session)
+
+
+async def start_usage_flusher(interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await flush_usage()
+        except Exception as e:
+            logger.error(f'Error flushing peer usage: {e}')
+
+
+async def query_usage(db: AsyncSession, peer_id: str, start: datetime, end: datetime, step: str) -> list:
+    """Traffic per bucket between `start` and `end`, read from the pre-aggregated rows."""
+    from app.api.peers.models import PeerUsageBucket
+
+    result = await db.execute(
+        select(PeerUsageBucket.bucket_start, PeerUsageBucket.rx_bytes, PeerUsageBucket.tx_bytes)
+        .where(
+            PeerUsageBucket.peer_id == peer_id,
+            PeerUsageBucket.resolution == step,
+            PeerUsageBucket.bucket_start >= bucket_start(start, step),
+            PeerUsageBucket.bucket_start <= end.astimezone(timezone.utc).replace(tzinfo=None))
+        .order_by(PeerUsageBucket.bucket_start))
+    return [{"bucket_start": start, "rx": rx, "tx": tx} for start, rx, tx in result.all()]
+
+
+def default_step(start: datetime, end: datetime) -> str:
+    span = end - start
+    if span <= timedelta(hours=6):
+        return "minute"
+    if span <= timedelta(days=14):
+        return "hour"
+    return "day"
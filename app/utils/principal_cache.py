@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.core.config import settings
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of authenticated users keyed by token subject (username),
+    each entry expiring after `ttl` seconds. Entries are detached `User`
+    instances, so they are only read, never flushed.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, subject: str):
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[subject]
+            return None
+        self._entries.move_to_end(subject)
+        return user
+
+    def put(self, subject: str, user):
+        self._entries[subject] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *subjects: Optional[str]):
+        for subject in subjects:
+            if subject is not None:
+                self._entries.pop(subject, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+principal_cache = PrincipalCache(settings.principal_cache_size, settings.principal_cache_ttl)
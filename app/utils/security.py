@@ -1,3 +1,4 @@
+import uuid
 from datetime import datetime, timedelta
 from time import timezone
 from typing import Optional
@@ -32,7 +33,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -58,7 +59,7 @@ async def authenticate_user(request: Request, db: AsyncSession = Depends(get_ses
         if scheme.lower() != "bearer":
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication scheme")
 
-        if is_token_blacklisted(token):
+        if await is_token_blacklisted(token, db):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been blacklisted")
 
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -1,44 +1,133 @@
-from typing import Dict
+import hashlib
+import heapq
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timezone, UTC
 from jose import jwt
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
+from app.core.database import get_session
 from app.logs.logging import logger
 
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 
-token_blacklist: Dict[str, datetime] = {}
 
+def token_id(token: str, payload: Optional[dict] = None) -> str:
+    """The token's `jti`, or a digest of the token for tokens issued without one."""
+    if payload and payload.get("jti"):
+        return payload["jti"]
+    return hashlib.sha256(token.encode()).hexdigest()
 
-def add_token_to_blacklist(token: str):
+
+class RevocationStore:
+    """
+    Revoked token ids live in the `revoked_tokens` table so every worker sees
+    a logout. In front of it each process keeps:
+
+    - the ids it knows are revoked, with a min-heap on expiry so sweeping
+      only touches entries that actually expired
+    - a bounded negative cache of ids recently confirmed as not revoked,
+      so the hot check hits the database at most once per `negative_ttl`
+    """
+
+    def __init__(self, negative_ttl: float, negative_size: int):
+        self.negative_ttl = negative_ttl
+        self.negative_size = negative_size
+        self._revoked: Dict[str, datetime] = {}
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._not_revoked: "OrderedDict[str, float]" = OrderedDict()
+
+    def _remember(self, jti: str, expires_at: datetime):
+        if jti not in self._revoked:
+            heapq.heappush(self._expiry_heap, (expires_at, jti))
+        self._revoked[jti] = expires_at
+        self._not_revoked.pop(jti, None)
+
+    async def revoke(self, jti: str, expires_at: datetime, db: AsyncSession):
+        from app.api.users.models import RevokedToken
+
+        await db.execute(
+            insert(RevokedToken)
+            .values(jti=jti, expires_at=expires_at.replace(tzinfo=None))
+            .on_conflict_do_nothing(index_elements=[RevokedToken.jti]))
+        await db.commit()
+        self._remember(jti, expires_at)
+
+    async def is_revoked(self, jti: str, db: AsyncSession) -> bool:
+        from app.api.users.models import RevokedToken
+
+        now = datetime.now(timezone.utc)
+        expires_at = self._revoked.get(jti)
+        if expires_at is not None:
+            return now < expires_at
+
+        checked_until = self._not_revoked.get(jti)
+        if checked_until is not None and time.monotonic() < checked_until:
+            return False
+
+        result = await db.execute(
+            select(RevokedToken.expires_at).where(RevokedToken.jti == jti))
+        expires_at = result.scalar_one_or_none()
+        if expires_at is not None:
+            expires_at = expires_at.replace(tzinfo=UTC)
+            self._remember(jti, expires_at)
+            return now < expires_at
+
+        self._not_revoked[jti] = time.monotonic() + self.negative_ttl
+        self._not_revoked.move_to_end(jti)
+        while len(self._not_revoked) > self.negative_size:
+            self._not_revoked.popitem(last=False)
+        return False
+
+    async def sweep(self, db: AsyncSession) -> int:
+        """Drop expired entries; cost is proportional to what expired, not to what is stored."""
+        from app.api.users.models import RevokedToken
+
+        now = datetime.now(timezone.utc)
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            _, jti = heapq.heappop(self._expiry_heap)
+            self._revoked.pop(jti, None)
+            removed += 1
+
+        # Range delete on the indexed expiry column
+        await db.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at <= now.replace(tzinfo=None)))
+        await db.commit()
+        return removed
+
+
+revocation_store = RevocationStore(
+    settings.revocation_negative_ttl, settings.revocation_negative_cache_size)
+
+
+async def add_token_to_blacklist(token: str, db: AsyncSession):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         exp_timestamp = payload.get("exp")
         if exp_timestamp:
             expiration = datetime.fromtimestamp(exp_timestamp, tz=UTC)
-            token_blacklist[token] = expiration
-            logger.info(f"Token '{token}' added to blacklist. Expires at {expiration.strftime('%Y-%m-%d %H:%M:%S')}.")
+            jti = token_id(token, payload)
+            await revocation_store.revoke(jti, expiration, db)
+            logger.info(f"Token '{jti}' added to blacklist. Expires at {expiration.strftime('%Y-%m-%d %H:%M:%S')}.")
         else:
             logger.warning("Token does not contain an expiration field.")
     except jwt.ExpiredSignatureError:
         logger.warning("Token has expired.")
-    except jwt.InvalidTokenError:
+    except jwt.JWTError:
         logger.error("Invalid token.")
 
 
-def is_token_blacklisted(token: str) -> bool:
-    if token in token_blacklist:
-        if datetime.now(timezone.utc) < token_blacklist[token]:
-            return True
-        else:
-            del token_blacklist[token]
-    return False
+async def is_token_blacklisted(token: str, db: AsyncSession, payload: Optional[dict] = None) -> bool:
+    return await revocation_store.is_revoked(token_id(token, payload), db)
 
 
-def cleanup_expired_tokens():
-    now = datetime.now(timezone.utc)
-    tokens_to_remove = [token for token,
-                        expiry in token_blacklist.items() if now >= expiry]
-    for token in tokens_to_remove:
-        del token_blacklist[token]
-        logger.info(f"Token '{token}' removed from blacklist.")
+async def cleanup_expired_tokens():
+    async for session in get_session():
+        removed = await revocation_store.sweep(session)
+        if removed:
+            logger.info(f"{removed} expired tokens removed from blacklist.")
@@ -0,0 +1,400 @@
+import asyncio
+import base64
+import os
+import socket
+import struct
+from ipaddress import ip_address, ip_network
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.logs.logging import logger
+from app.utils.wg_telemetry import fetch_wg_dump
+
+
+class WGDriverError(RuntimeError):
+    """Raised when the interface rejects a peer operation."""
+
+
+class WGDriver:
+    """
+    Applies peer changes to a WireGuard interface.
+
+    `peers` passed to `set_peers` are `(public_key, allowed_ips)` tuples where
+    `allowed_ips` is a CIDR such as `10.8.0.2/32`. Every call is a batch so
+    callers touching many peers pay for a single round-trip.
+    """
+
+    async def dump(self, interface: str) -> Dict[str, dict]:
+        raise NotImplementedError
+
+    async def set_peers(self, interface: str, peers: List[Tuple[str, str]]):
+        raise NotImplementedError
+
+    async def remove_peers(self, interface: str, public_keys: List[str]):
+        raise NotImplementedError
+
+    async def save(self, interface: str):
+        """Persist the running interface state to its config file."""
+        from app.utils.wg_persist import write_interface_config
+
+        peers = await self.dump(interface)
+        await asyncio.to_thread(write_interface_config, interface, peers)
+
+
+async def run_command(*args: str) -> str:
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise WGDriverError(
+            f"{' '.join(args[:3])} failed: {stderr.decode().strip()}")
+    return stdout.decode()
+
+
+'''
+-----------------------------------------------------
+|            wg(8) command line driver              |
+-----------------------------------------------------
+'''
+
+
+class CLIDriver(WGDriver):
+    """Shells out to `wg`, batching every peer of a call into one `wg set`."""
+
+    async def dump(self, interface: str) -> Dict[str, dict]:
+        return await fetch_wg_dump(interface)
+
+    async def set_peers(self, interface: str, peers: List[Tuple[str, str]]):
+        if not peers:
+            return
+        args = ["wg", "set", interface]
+        for public_key, allowed_ips in peers:
+            args += ["peer", public_key, "allowed-ips", allowed_ips]
+        await run_command(*args)
+
+    async def remove_peers(self, interface: str, public_keys: List[str]):
+        if not public_keys:
+            return
+        args = ["wg", "set", interface]
+        for public_key in public_keys:
+            args += ["peer", public_key, "remove"]
+        await run_command(*args)
+
+
+'''
+-----------------------------------------------------
+|         Generic netlink (kernel) driver           |
+-----------------------------------------------------
+'''
+
+NETLINK_GENERIC = 16
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLA_F_NESTED = 0x8000
+NLA_TYPE_MASK = 0x3FFF
+
+WG_GENL_NAME = "wireguard"
+WG_GENL_VERSION = 1
+WG_CMD_GET_DEVICE = 0
+WG_CMD_SET_DEVICE = 1
+
+WGDEVICE_A_IFNAME = 2
+WGDEVICE_A_PEERS = 8
+
+WGPEER_A_PUBLIC_KEY = 1
+WGPEER_A_PRESHARED_KEY = 2
+WGPEER_A_FLAGS = 3
+WGPEER_A_ENDPOINT = 4
+WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL = 5
+WGPEER_A_LAST_HANDSHAKE_TIME = 6
+WGPEER_A_RX_BYTES = 7
+WGPEER_A_TX_BYTES = 8
+WGPEER_A_ALLOWEDIPS = 9
+WGPEER_F_REMOVE_ME = 1
+WGPEER_F_REPLACE_ALLOWEDIPS = 2
+
+WGALLOWEDIP_A_FAMILY = 1
+WGALLOWEDIP_A_IPADDR = 2
+WGALLOWEDIP_A_CIDR_MASK = 3
+
+NLMSG_HEADER = struct.Struct("=IHHII")
+GENL_HEADER = struct.Struct("=BBH")
+NLA_HEADER = struct.Struct("=HH")
+
+# Peers per SET_DEVICE message, keeps each message well below the socket buffer
+NETLINK_PEER_CHUNK = 128
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _nla(attr_type: int, payload: bytes) -> bytes:
+    length = NLA_HEADER.size + len(payload)
+    return NLA_HEADER.pack(length, attr_type) + payload + b"\0" * (_align(length) - length)
+
+
+def _nla_nested(attr_type: int, attrs: Iterable[bytes]) -> bytes:
+    return _nla(attr_type | NLA_F_NESTED, b"".join(attrs))
+
+
+def _parse_attrs(data: bytes) -> List[Tuple[int, bytes]]:
+    attrs = []
+    offset = 0
+    while offset + NLA_HEADER.size <= len(data):
+        length, attr_type = NLA_HEADER.unpack_from(data, offset)
+        if length < NLA_HEADER.size:
+            break
+        attrs.append((attr_type & NLA_TYPE_MASK,
+                      data[offset + NLA_HEADER.size:offset + length]))
+        offset += _align(length)
+    return attrs
+
+
+def _format_endpoint(data: bytes) -> str:
+    family = struct.unpack_from("=H", data)[0]
+    port = struct.unpack_from("!H", data, 2)[0]
+    if family == socket.AF_INET:
+        return f"{socket.inet_ntop(socket.AF_INET, data[4:8])}:{port}"
+    if family == socket.AF_INET6:
+        return f"[{socket.inet_ntop(socket.AF_INET6, data[8:24])}]:{port}"
+    return "(none)"
+
+
+def _allowed_ip_attr(cidr: str) -> bytes:
+    network = ip_network(cidr, strict=False)
+    family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+    return _nla_nested(0, [
+        _nla(WGALLOWEDIP_A_FAMILY, struct.pack("=H", family)),
+        _nla(WGALLOWEDIP_A_IPADDR, network.network_address.packed),
+        _nla(WGALLOWEDIP_A_CIDR_MASK, struct.pack("=B", network.prefixlen)),
+    ])
+
+
+class NetlinkDriver(WGDriver):
+    """
+    Talks to the `wireguard` generic netlink family directly, the same
+    interface wg(8) uses, so a batch of peer changes is one request/ack
+    exchange on a socket instead of a process fork per command.
+    """
+
+    def __init__(self):
+        self._family_id: Optional[int] = None
+        self._seq = 0
+
+    def _open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        sock.bind((0, 0))
+        return sock
+
+    def _next_seq(self) -> int:
+        self._seq = (self._seq + 1) & 0xFFFFFFFF
+        return self._seq
+
+    def _request(self, sock: socket.socket, family: int, cmd: int, flags: int, attrs: bytes) -> List[bytes]:
+        """Send one generic netlink message and collect the payloads of every reply."""
+        seq = self._next_seq()
+        body = GENL_HEADER.pack(cmd, WG_GENL_VERSION, 0) + attrs
+        sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body),
+                                    family, NLM_F_REQUEST | flags, seq, 0) + body)
+
+        replies = []
+        while True:
+            data = sock.recv(1 << 16)
+            offset = 0
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, msg_type, msg_flags, msg_seq, _ = NLMSG_HEADER.unpack_from(data, offset)
+                payload = data[offset + NLMSG_HEADER.size:offset + length]
+                offset += _align(length)
+
+                if msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from("=i", payload)[0]
+                    if error != 0:
+                        raise WGDriverError(
+                            f"netlink request failed: {os.strerror(-error)}")
+                    return replies
+                replies.append(payload[GENL_HEADER.size:])
+                if not msg_flags & NLM_F_MULTI and not flags & NLM_F_ACK:
+                    return replies
+
+    def _resolve_family(self, sock: socket.socket) -> int:
+        if self._family_id is None:
+            name = _nla(CTRL_ATTR_FAMILY_NAME, WG_GENL_NAME.encode() + b"\0")
+            for payload in self._request(sock, GENL_ID_CTRL, CTRL_CMD_GETFAMILY, 0, name):
+                for attr_type, value in _parse_attrs(payload):
+                    if attr_type == CTRL_ATTR_FAMILY_ID:
+                        self._family_id = struct.unpack_from("=H", value)[0]
+            if self._family_id is None:
+                raise WGDriverError("wireguard netlink family is not available")
+        return self._family_id
+
+    def _set_device(self, interface: str, peer_attrs: List[bytes]):
+        ifname = _nla(WGDEVICE_A_IFNAME, interface.encode() + b"\0")
+        with self._open() as sock:
+            family = self._resolve_family(sock)
+            for start in range(0, len(peer_attrs), NETLINK_PEER_CHUNK):
+                chunk = peer_attrs[start:start + NETLINK_PEER_CHUNK]
+                attrs = ifname + _nla_nested(WGDEVICE_A_PEERS, chunk)
+                self._request(sock, family, WG_CMD_SET_DEVICE, NLM_F_ACK, attrs)
+
+    def _get_device(self, interface: str) -> Dict[str, dict]:
+        ifname = _nla(WGDEVICE_A_IFNAME, interface.encode() + b"\0")
+        with self._open() as sock:
+            family = self._resolve_family(sock)
+            replies = self._request(sock, family, WG_CMD_GET_DEVICE, NLM_F_DUMP, ifname)
+
+        peers: Dict[str, dict] = {}
+        for payload in replies:
+            for attr_type, value in _parse_attrs(payload):
+                if attr_type != WGDEVICE_A_PEERS:
+                    continue
+                for _, peer_data in _parse_attrs(value):
+                    self._merge_peer(peers, _parse_attrs(peer_data))
+
+        for peer in peers.values():
+            peer["allowed_ips"] = ",".join(peer["allowed_ips"]) or "(none)"
+        return peers
+
+    @staticmethod
+    def _merge_peer(peers: Dict[str, dict], attrs: List[Tuple[int, bytes]]):
+        # Large peers are split across dump messages, the follow-up parts
+        # repeat the public key and carry the remaining allowed ips
+        values = dict(attrs)
+        public_key = base64.b64encode(values[WGPEER_A_PUBLIC_KEY]).decode()
+        peer = peers.setdefault(public_key, {
+            "rx": 0,
+            "tx": 0,
+            "latest_handshake": 0,
+            "endpoint": "(none)",
+            "allowed_ips": [],
+            "preshared_key": None,
+            "persistent_keepalive": None
+        })
+        if WGPEER_A_RX_BYTES in values:
+            peer["rx"] = struct.unpack_from("=Q", values[WGPEER_A_RX_BYTES])[0]
+        if WGPEER_A_TX_BYTES in values:
+            peer["tx"] = struct.unpack_from("=Q", values[WGPEER_A_TX_BYTES])[0]
+        if WGPEER_A_LAST_HANDSHAKE_TIME in values:
+            peer["latest_handshake"] = struct.unpack_from(
+                "=q", values[WGPEER_A_LAST_HANDSHAKE_TIME])[0]
+        if WGPEER_A_ENDPOINT in values:
+            peer["endpoint"] = _format_endpoint(values[WGPEER_A_ENDPOINT])
+        # The kernel reports an all-zero key and a zero interval when they are unset
+        if any(values.get(WGPEER_A_PRESHARED_KEY, b"")):
+            peer["preshared_key"] = base64.b64encode(values[WGPEER_A_PRESHARED_KEY]).decode()
+        if WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL in values:
+            peer["persistent_keepalive"] = struct.unpack_from(
+                "=H", values[WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL])[0] or None
+        if WGPEER_A_ALLOWEDIPS in values:
+            for _, allowed_ip in _parse_attrs(values[WGPEER_A_ALLOWEDIPS]):
+                allowed = dict(_parse_attrs(allowed_ip))
+                address = ip_address(allowed[WGALLOWEDIP_A_IPADDR])
+                cidr = struct.unpack_from("=B", allowed[WGALLOWEDIP_A_CIDR_MASK])[0]
+                peer["allowed_ips"].append(f"{address}/{cidr}")
+
+    async def dump(self, interface: str) -> Dict[str, dict]:
+        return await asyncio.to_thread(self._get_device, interface)
+
+    async def set_peers(self, interface: str, peers: List[Tuple[str, str]]):
+        if not peers:
+            return
+        peer_attrs = [
+            _nla_nested(0, [
+                _nla(WGPEER_A_PUBLIC_KEY, base64.b64decode(public_key)),
+                _nla(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_REPLACE_ALLOWEDIPS)),
+                _nla_nested(WGPEER_A_ALLOWEDIPS, [
+                    _allowed_ip_attr(cidr.strip()) for cidr in allowed_ips.split(",")
+                ]),
+            ])
+            for public_key, allowed_ips in peers
+        ]
+        await asyncio.to_thread(self._set_device, interface, peer_attrs)
+
+    async def remove_peers(self, interface: str, public_keys: List[str]):
+        if not public_keys:
+            return
+        peer_attrs = [
+            _nla_nested(0, [
+                _nla(WGPEER_A_PUBLIC_KEY, base64.b64decode(public_key)),
+                _nla(WGPEER_A_FLAGS, struct.pack("=I", WGPEER_F_REMOVE_ME)),
+            ])
+            for public_key in public_keys
+        ]
+        await asyncio.to_thread(self._set_device, interface, peer_attrs)
+
+
+'''
+-----------------------------------------------------
+|         In-process driver for tests/dev           |
+-----------------------------------------------------
+'''
+
+
+class FakeDriver(WGDriver):
+    """Keeps interface state in memory, no kernel module or `wg` binary needed."""
+
+    def __init__(self):
+        self.interfaces: Dict[str, Dict[str, dict]] = {}
+        self.saves: Dict[str, int] = {}
+
+    async def dump(self, interface: str) -> Dict[str, dict]:
+        peers = self.interfaces.get(interface, {})
+        return {public_key: dict(peer) for public_key, peer in peers.items()}
+
+    async def set_peers(self, interface: str, peers: List[Tuple[str, str]]):
+        interface_peers = self.interfaces.setdefault(interface, {})
+        for public_key, allowed_ips in peers:
+            peer = interface_peers.setdefault(public_key, {
+                "rx": 0,
+                "tx": 0,
+                "latest_handshake": 0,
+                "endpoint": "(none)",
+                "preshared_key": None,
+                "persistent_keepalive": None
+            })
+            peer["allowed_ips"] = allowed_ips
+
+    async def remove_peers(self, interface: str, public_keys: List[str]):
+        interface_peers = self.interfaces.setdefault(interface, {})
+        for public_key in public_keys:
+            interface_peers.pop(public_key, None)
+
+    async def save(self, interface: str):
+        self.saves[interface] = self.saves.get(interface, 0) + 1
+
+
+WG_DRIVERS = {
+    "cli": CLIDriver,
+    "netlink": NetlinkDriver,
+    "fake": FakeDriver,
+}
+
+_driver: Optional[WGDriver] = None
+
+
+def get_wg_driver() -> WGDriver:
+    """Return the process wide driver selected by `settings.wg_driver`."""
+    global _driver
+    if _driver is None:
+        driver_class = WG_DRIVERS.get(settings.wg_driver)
+        if driver_class is None:
+            raise ValueError(f"Unknown WireGuard driver '{settings.wg_driver}'")
+        _driver = driver_class()
+        logger.info(f"WireGuard driver: {settings.wg_driver}")
+    return _driver
@@ -0,0 +1,103 @@
+import base64
+import os
+import queue
+import threading
+from typing import List, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+
+from app.core.config import settings
+from app.logs.logging import logger
+
+
+'''
+-----------------------------------------------------
+|      WireGuard compatible Curve25519 key pairs    |
+-----------------------------------------------------
+'''
+
+
+def public_key_from_private(private_key: str) -> str:
+    """Equivalent of `wg pubkey` for a base64 private key."""
+    raw = base64.b64decode(private_key)
+    if len(raw) != 32:
+        raise ValueError("WireGuard keys are 32 bytes")
+
+    public = X25519PrivateKey.from_private_bytes(raw).public_key().public_bytes_raw()
+    return base64.b64encode(public).decode()
+
+
+def generate_private_key() -> str:
+    """Equivalent of `wg genkey`: 32 random bytes clamped for Curve25519."""
+    raw = bytearray(os.urandom(32))
+    raw[0] &= 248
+    raw[31] &= 127
+    raw[31] |= 64
+    return base64.b64encode(bytes(raw)).decode()
+
+
+def generate_key_pair() -> Tuple[str, str]:
+    """Generates a WireGuard key pair (private key & public key)"""
+    private_key = generate_private_key()
+    return private_key, public_key_from_private(private_key)
+
+
+def generate_preshared_key() -> str:
+    """Equivalent of `wg genpsk`."""
+    return base64.b64encode(os.urandom(32)).decode()
+
+
+'''
+-----------------------------------------------------
+|            Pre-generated key pair pool            |
+-----------------------------------------------------
+'''
+
+
+class KeyPool:
+    """
+    Keeps a few key pairs ready so peer creation never waits on key
+    generation. A daemon thread tops the pool up whenever it drains
+    below half; an empty pool falls back to generating inline.
+    """
+
+    def __init__(self, size: int = 32):
+        self.size = size
+        self._pairs: "queue.Queue[Tuple[str, str]]" = queue.Queue(maxsize=size)
+        self._refill = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="wg-key-pool", daemon=True)
+            self._thread.start()
+            self._refill.set()
+
+    def _run(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            try:
+                while not self._pairs.full():
+                    self._pairs.put_nowait(generate_key_pair())
+            except queue.Full:
+                pass
+            except Exception as e:
+                logger.error(f"Error refilling WireGuard key pool: {e}")
+
+    def get(self) -> Tuple[str, str]:
+        self.start()
+        try:
+            pair = self._pairs.get_nowait()
+        except queue.Empty:
+            pair = generate_key_pair()
+        if self._pairs.qsize() < self.size // 2:
+            self._refill.set()
+        return pair
+
+    def get_many(self, count: int) -> List[Tuple[str, str]]:
+        return [self.get() for _ in range(count)]
+
+
+key_pool = KeyPool(settings.key_pool_size)
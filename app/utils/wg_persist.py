@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.logs.logging import logger
+
+
+def interface_config_path(interface: str) -> str:
+    return os.path.join(settings.wg_config_dir, f"{interface}.conf")
+
+
+def render_interface_config(interface_section: str, peers: Dict[str, dict]) -> str:
+    """Render a config in the same shape `wg-quick save` writes."""
+    blocks = [interface_section.rstrip() + "\n"]
+    for public_key, peer in peers.items():
+        lines = ["[Peer]", f"PublicKey = {public_key}"]
+        allowed_ips = peer.get("allowed_ips")
+        if allowed_ips and allowed_ips != "(none)":
+            lines.append(f"AllowedIPs = {allowed_ips}")
+        endpoint = peer.get("endpoint")
+        if endpoint and endpoint not in ("(none)", "Unknown"):
+            lines.append(f"Endpoint = {endpoint}")
+        if peer.get("preshared_key"):
+            lines.append(f"PresharedKey = {peer['preshared_key']}")
+        if peer.get("persistent_keepalive"):
+            lines.append(f"PersistentKeepalive = {peer['persistent_keepalive']}")
+        blocks.append("\n".join(lines) + "\n")
+    return "\n".join(blocks)
+
+
+def read_interface_section(path: str) -> Optional[str]:
+    """Everything in the current config before the first [Peer] block, None if there is no config."""
+    section = []
+    try:
+        with open(path) as conf:
+            for line in conf:
+                if line.strip().lower() == "[peer]":
+                    break
+                section.append(line)
+    except FileNotFoundError:
+        return None
+    return "".join(section)
+
+
+def write_interface_config(interface: str, peers: Dict[str, dict]):
+    """Rewrite the interface config atomically: temp file in the same directory, then rename."""
+    path = interface_config_path(interface)
+    interface_section = read_interface_section(path)
+    if interface_section is None:
+        # Without the [Interface] block (private key, address) there is nothing wg-quick could load
+        logger.warning(f"No WireGuard config at {path}, not saving {len(peers)} peers")
+        return
+    content = render_interface_config(interface_section, peers)
+
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{interface}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as tmp:
+            tmp.write(content)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ConfigSaveScheduler:
+    """
+    Coalesces config saves per interface. The first mutation opens a short
+    window, every mutation inside it rides along, and the window closes with
+    a single config write.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def schedule(self, interface: str):
+        if interface not in self._pending:
+            self._pending[interface] = asyncio.create_task(self._save_later(interface))
+
+    async def _save_later(self, interface: str):
+        await asyncio.sleep(self.delay)
+        self._pending.pop(interface, None)
+        await self._save(interface)
+
+    async def _save(self, interface: str):
+        from app.utils.wg_driver import get_wg_driver
+
+        lock = self._locks.setdefault(interface, asyncio.Lock())
+        async with lock:
+            try:
+                await get_wg_driver().save(interface)
+            except Exception as e:
+                logger.error(f"Error saving WireGuard config for {interface}: {e}")
+
+    async def flush(self, interface: Optional[str] = None):
+        """Write pending saves now instead of waiting for their window to close."""
+        interfaces = [interface] if interface else list(self._pending)
+        for name in interfaces:
+            task = self._pending.pop(name, None)
+            if task is None:
+                continue
+            task.cancel()
+            await self._save(name)
+
+
+config_writer = ConfigSaveScheduler(settings.wg_save_delay)
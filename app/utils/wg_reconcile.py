@@ -0,0 +1,62 @@
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.logs.logging import logger
+from app.utils.wg_driver import get_wg_driver
+from app.utils.wg_persist import config_writer
+
+
+def _normalize_allowed_ips(allowed_ips: Optional[str]) -> str:
+    if not allowed_ips or allowed_ips == "(none)":
+        return ""
+    return ",".join(sorted(ip.strip() for ip in allowed_ips.split(",")))
+
+
+async def reconcile_interfaces(db: AsyncSession, dry_run: bool = False) -> list:
+    """
+    Converge every interface on the peers stored in the database. Each
+    interface is read with one dump and only the delta is applied: missing
+    peers and wrong allowed-ips in one `set_peers`, orphans in one `remove_peers`.
+    """
+    from app.api.peers.models import PeerAccount, WireGuardPeer
+    from app.api.wg_server.models import WGServerConfig
+
+    driver = get_wg_driver()
+    servers = await db.execute(select(WGServerConfig.id, WGServerConfig.interface_name))
+    report = []
+
+    for server_id, interface_name in servers.all():
+        rows = await db.execute(
+            select(WireGuardPeer.public_key, WireGuardPeer.assigned_ip)
+            .outerjoin(PeerAccount, PeerAccount.peer_id == WireGuardPeer.id)
+            # Peers disabled by their quota stay in the database but off the interface
+            .where(WireGuardPeer.server_id == server_id, PeerAccount.disabled_at.is_(None)))
+        desired = {public_key: f"{assigned_ip}/32" for public_key, assigned_ip in rows.all()}
+        live = await driver.dump(interface_name)
+
+        missing = [key for key in desired if key not in live]
+        mismatched = [
+            key for key in desired
+            if key in live and _normalize_allowed_ips(live[key].get("allowed_ips")) != desired[key]
+        ]
+        orphans = [key for key in live if key not in desired]
+
+        if not dry_run:
+            await driver.set_peers(interface_name, [(key, desired[key]) for key in missing + mismatched])
+            await driver.remove_peers(interface_name, orphans)
+            if missing or mismatched or orphans:
+                config_writer.schedule(interface_name)
+
+        summary = {
+            "interface": interface_name,
+            "added": len(missing),
+            "updated": len(mismatched),
+            "removed": len(orphans),
+            "dry_run": dry_run
+        }
+        logger.info(f"WireGuard reconcile {summary}")
+        report.append(summary)
+
+    return report
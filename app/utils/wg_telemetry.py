@@ -0,0 +1,150 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException
+
+from app.logs.logging import logger
+from app.utils.peer_accounting import accounting_engine, accounting_lease
+from app.utils.peer_stream import peer_stats_broadcaster
+from app.utils.peer_usage import usage_recorder
+
+
+def empty_transfer_data() -> dict:
+    """Transfer data reported for a peer the interface does not know about."""
+    return {
+        "rx": 0,
+        "tx": 0,
+        "latest_handshake": "Never",
+        "endpoint": "Unknown"
+    }
+
+
+EMPTY_TRANSFER_DATA = empty_transfer_data()
+
+
+def parse_wg_dump(output: str) -> Dict[str, dict]:
+    """Parse `wg show <iface> dump` output into a map indexed by peer public key."""
+    peers = {}
+
+    # The first line describes the interface itself, every following line is a peer:
+    # public-key, preshared-key, endpoint, allowed-ips, latest-handshake, rx, tx, keepalive
+    for line in output.splitlines()[1:]:
+        parts = line.split("\t")
+        if len(parts) < 8:
+            continue
+
+        public_key, preshared_key, endpoint, allowed_ips, handshake, rx, tx, keepalive = parts[:8]
+        peers[public_key] = {
+            "rx": int(rx) if rx.isdigit() else 0,
+            "tx": int(tx) if tx.isdigit() else 0,
+            "latest_handshake": int(handshake) if handshake.isdigit() else "Never",
+            "endpoint": endpoint,
+            "allowed_ips": allowed_ips,
+            "preshared_key": preshared_key if preshared_key != "(none)" else None,
+            "persistent_keepalive": int(keepalive) if keepalive.isdigit() else None
+        }
+
+    return peers
+
+
+async def fetch_wg_dump(interface: str) -> Dict[str, dict]:
+    """Run a single `wg show <iface> dump` and return the parsed snapshot."""
+    process = await asyncio.create_subprocess_exec(
+        "wg", "show", interface, "dump",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode != 0:
+        logger.error(f"wg show {interface} dump failed: {stderr.decode().strip()}")
+        raise HTTPException(
+            status_code=500, detail="Error fetching transfer data")
+
+    return parse_wg_dump(stdout.decode())
+
+
+class TelemetryCache:
+    """Latest interface snapshot kept in memory by the background collector."""
+
+    def __init__(self):
+        self.peers: Dict[str, dict] = {}
+        self.views: Dict[str, dict] = {}
+        self.sampled_at: Optional[datetime] = None
+        self._sampled_monotonic: Optional[float] = None
+
+    def update(self, peers: Dict[str, dict]):
+        self.peers = peers
+        # Response-ready transfer data, built once per sample instead of once per listed peer
+        self.views = {
+            public_key: {
+                "rx": peer["rx"],
+                "tx": peer["tx"],
+                "latest_handshake": peer["latest_handshake"],
+                "endpoint": peer["endpoint"]
+            }
+            for public_key, peer in peers.items()
+        }
+        self.sampled_at = datetime.now(timezone.utc)
+        self._sampled_monotonic = time.monotonic()
+
+    def sample_age(self) -> Optional[float]:
+        """Seconds since the last successful sample, None if nothing was sampled yet."""
+        if self._sampled_monotonic is None:
+            return None
+        return round(time.monotonic() - self._sampled_monotonic, 3)
+
+    def view(self, public_key: str) -> dict:
+        """Shared transfer data of a peer from the latest sample. Callers must not mutate it."""
+        return self.views.get(public_key) or EMPTY_TRANSFER_DATA
+
+    def sample_info(self) -> dict:
+        return {"sampled_at": self.sampled_at, "sample_age": self.sample_age()}
+
+    def get(self, public_key: str) -> dict:
+        """Transfer data for a peer with the staleness of the sample it came from."""
+        return {**self.view(public_key), **self.sample_info()}
+
+    def online_public_keys(self, window: int) -> Set[str]:
+        """Peers whose latest handshake is at most `window` seconds old."""
+        cutoff = time.time() - window
+        return {
+            public_key for public_key, peer in self.peers.items()
+            if isinstance(peer.get("latest_handshake"), int)
+            and peer["latest_handshake"] > 0 and peer["latest_handshake"] >= cutoff
+        }
+
+
+telemetry_cache = TelemetryCache()
+
+
+async def refresh_telemetry(interface: str) -> Dict[str, dict]:
+    """Take one interface sample and publish it to the cache."""
+    from app.utils.wg_driver import get_wg_driver
+
+    peers = await get_wg_driver().dump(interface)
+    previous, elapsed = telemetry_cache.peers, telemetry_cache.sample_age()
+    telemetry_cache.update(peers)
+    peer_stats_broadcaster.publish(previous, peers, elapsed, telemetry_cache.sampled_at)
+
+    # Every worker keeps its raw samples, only the elected one turns them into stored traffic
+    try:
+        accounting = await accounting_lease.acquire()
+    except Exception as e:
+        logger.error(f'Could not check the accounting lease: {e}')
+        accounting = False
+    deltas = accounting_engine.process(peers) if accounting else {}
+    usage_recorder.record(peers, deltas, telemetry_cache.sampled_at)
+    return peers
+
+
+async def start_telemetry_collector(interface: str, interval: int):
+    """Poll the interface forever so request handlers never have to."""
+    while True:
+        try:
+            await refresh_telemetry(interface)
+        except Exception as e:
+            logger.error(f'Error during WireGuard telemetry sampling: {e}')
+        await asyncio.sleep(interval)
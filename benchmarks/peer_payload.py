@@ -0,0 +1,133 @@
+"""
+Encode time of a peer listing payload, before and after the ORJSON switch.
+
+    python benchmarks/peer_payload.py [--peers 10000] [--rounds 20]
+
+"before" rebuilds every peer field by field from an ORM-like object, copies
+its transfer data and encodes with the stdlib, the way the default
+`JSONResponse` did (through `jsonable_encoder` when FastAPI is installed).
+"after" merges the row mapping with the shared per-sample transfer view and
+encodes with orjson, which is what the peer listing now does.
+"""
+import argparse
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import orjson
+
+try:
+    from fastapi.encoders import jsonable_encoder
+except ImportError:
+    jsonable_encoder = None
+
+COLUMNS = ("id", "user_id", "server_id", "peer_name", "public_key", "private_key", "assigned_ip",
+           "created_at", "created_by", "updated_at", "updated_by")
+
+
+def make_rows(count: int) -> list:
+    now = datetime.utcnow()
+    rows = []
+    for index in range(count):
+        rows.append({
+            "id": uuid.uuid4().hex,
+            "user_id": uuid.uuid4().hex,
+            "server_id": uuid.uuid4().hex,
+            "peer_name": f"peer-{index}",
+            "public_key": f"{index:043d}=",
+            "private_key": f"{index:043d}=",
+            "assigned_ip": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+            "created_at": now,
+            "created_by": "admin",
+            "updated_at": now,
+            "updated_by": "admin",
+        })
+    return rows
+
+
+def make_telemetry(rows: list) -> dict:
+    return {
+        row["public_key"]: {"rx": 123456789, "tx": 987654321, "latest_handshake": 1700000000,
+                            "endpoint": "203.0.113.7:51820", "allowed_ips": f"{row['assigned_ip']}/32"}
+        for row in rows
+    }
+
+
+def encode_before(peers: list, telemetry: dict, sampled_at: datetime) -> bytes:
+    items = []
+    for peer in peers:
+        transfer_data = dict(telemetry.get(peer.public_key) or {})
+        transfer_data["sampled_at"] = sampled_at
+        transfer_data["sample_age"] = 1.234
+        items.append({
+            "private_key": peer.private_key,
+            "user_id": peer.user_id,
+            "server_id": peer.server_id,
+            "created_at": peer.created_at,
+            "created_by": peer.created_by,
+            "peer_name": peer.peer_name,
+            "public_key": peer.public_key,
+            "assigned_ip": peer.assigned_ip,
+            "id": peer.id,
+            "updated_at": peer.updated_at,
+            "updated_by": peer.updated_by,
+            "rx": transfer_data.get("rx", 0),
+            "tx": transfer_data.get("tx", 0),
+            "latest_handshake": transfer_data.get("latest_handshake", "Never"),
+            "endpoint": transfer_data.get("endpoint", "Unknown"),
+            "sampled_at": transfer_data.get("sampled_at"),
+            "sample_age": transfer_data.get("sample_age")
+        })
+    payload = {"items": items, "next_cursor": None}
+    if jsonable_encoder is not None:
+        return json.dumps(jsonable_encoder(payload)).encode()
+    return json.dumps(payload, default=datetime.isoformat).encode()
+
+
+def encode_after(rows: list, views: dict, sampled_at: datetime) -> bytes:
+    sample = {"sampled_at": sampled_at, "sample_age": 1.234}
+    items = [{**row, **views[row["public_key"]], **sample} for row in rows]
+    return orjson.dumps({"items": items, "next_cursor": None})
+
+
+def timed(function, rounds: int) -> list:
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.peers)
+    telemetry = make_telemetry(rows)
+    sampled_at = datetime.now(timezone.utc)
+
+    peers = [SimpleNamespace(**row) for row in rows]
+    # Built once per telemetry sample by `TelemetryCache.update`
+    views = {key: {field: peer[field] for field in ("rx", "tx", "latest_handshake", "endpoint")}
+             for key, peer in telemetry.items()}
+
+    before = timed(lambda: encode_before(peers, telemetry, sampled_at), args.rounds)
+    after = timed(lambda: encode_after(rows, views, sampled_at), args.rounds)
+
+    encoder = "jsonable_encoder + json" if jsonable_encoder is not None else "json"
+    print(f"{args.peers} peers, {args.rounds} rounds, median / p95 in ms")
+    for label, samples in ((f"before ({encoder})", before), ("after (orjson)", after)):
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        print(f"  {label:<32} {statistics.median(samples):8.2f} {p95:8.2f}")
+    print(f"  speedup {statistics.median(before) / statistics.median(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,16 @@ from app.api.wg_server.routers import router as wg_router
 from app.api.peers.routers import router as peer_router
 from app.api.users.routers import router as user_router
 from app.api.roles.routers import router as role_router
+from app.api.system.routers import router as system_router
+from app.api.audit.routers import router as audit_router
 import asyncio
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
 
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.exc import (DataError, IntegrityError, InterfaceError,
@@ -19,7 +23,7 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 
 # route import
 from app.core.config import settings
-from app.core.database import Base, get_session, master_db_engine
+from app.core.database import Base, ReadYourWritesMiddleware, get_session, master_db_engine
 from app.logs.logging import logger
 # import expection handlers
 from app.utils.exception_handler import (authentication_error_handler,
@@ -37,17 +41,26 @@ from app.utils.exception_handler import (authentication_error_handler,
                                          validation_exception_handler,
                                          value_error_handler)
 
+from app.utils.audit import audit_writer, prepare_audit_table, start_audit_maintenance
+from app.utils.authz import role_cache
 from app.utils.token_blacklist import cleanup_expired_tokens
+from app.utils.peer_accounting import accounting_lease, flush_accounting, start_accounting_flusher
+from app.utils.peer_usage import flush_usage, start_usage_flusher
+from app.utils.wg_keys import key_pool
+from app.utils.wg_persist import config_writer
+from app.utils.wg_reconcile import reconcile_interfaces
+from app.utils.wg_telemetry import refresh_telemetry, start_telemetry_collector
 
 # Determine if running in production
 ENV = settings.environment
 
 # Disable documentation if in production
 if ENV == "production":
-    app = FastAPI(docs_url=None, redoc_url=None)
+    app = FastAPI(docs_url=None, redoc_url=None, default_response_class=ORJSONResponse)
 else:
     app = FastAPI(title=settings.app_name, version="0.1.0",
-                  swagger_ui_parameters={"persistAuthorization": True})
+                  swagger_ui_parameters={"persistAuthorization": True},
+                  default_response_class=ORJSONResponse)
 
 origins = [
     "*"
@@ -69,6 +82,8 @@ app.add_exception_handler(ValueError, value_error_handler)
 app.add_exception_handler(TypeError, type_error_handler)
 app.add_exception_handler(Exception, global_exception_handler)
 
+app.add_middleware(ReadYourWritesMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # Allows all origins
@@ -84,7 +99,7 @@ async def start_periodic_cleanup():
         try:
             logger.info(
                 f'[*] FastAPI startup: Cleaning expired Tokens {datetime.now()}')
-            cleanup_expired_tokens()
+            await cleanup_expired_tokens()
         except Exception as e:
             logger.error(f'Error during token cleanup: {e}')
 
@@ -95,21 +110,72 @@ async def lifespan(app: FastAPI):
     from app.utils.ip_pool import populate_ip_pool
     async with master_db_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await prepare_audit_table(conn)
         logger.info('[*] FastAPI startup: Database connected')
 
     # await create_default_roles()
     await create_default_user()
+    await role_cache.ensure_loaded()
+    started = time.perf_counter()
     async for session in get_session():
-        print(settings.allowed_ips)
         await populate_ip_pool(session, str(settings.allowed_ips))
+    logger.info(
+        f'[*] FastAPI startup: IP pool {settings.allowed_ips} ready in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    # Bring the live interface back in line with the database after a restart
+    try:
+        async for session in get_session():
+            await reconcile_interfaces(session)
+        logger.info('[*] FastAPI startup: WireGuard interfaces reconciled')
+    except Exception as e:
+        logger.error(f'WireGuard reconcile on startup failed: {e}')
+
+
+    # Take a first sample so the peer listings are populated straight away
+    # (this also elects the accounting worker, which loads the persisted counters)
+    try:
+        await refresh_telemetry(settings.interface_name)
+    except Exception as e:
+        logger.error(f'Initial WireGuard telemetry sample failed: {e}')
 
+    key_pool.start()
+    logger.info('[*] FastAPI startup: Key pool thread started')
 
     loop = asyncio.get_event_loop()
     loop.create_task(start_periodic_cleanup())
     logger.info('[*] FastAPI startup: Token thread started')
+    telemetry_task = loop.create_task(start_telemetry_collector(
+        settings.interface_name, settings.telemetry_interval))
+    logger.info('[*] FastAPI startup: Telemetry collector started')
+    usage_task = loop.create_task(start_usage_flusher(settings.usage_flush_interval))
+    accounting_task = loop.create_task(start_accounting_flusher(settings.usage_flush_interval))
+    audit_task = loop.create_task(audit_writer.run())
+    logger.info('[*] FastAPI startup: Audit writer started')
+    loop.create_task(start_audit_maintenance(settings.audit_maintenance_interval))
 
     yield
 
+    telemetry_task.cancel()
+    logger.info('[*] FastAPI shutdown: Telemetry collector stopping')
+    usage_task.cancel()
+    try:
+        await flush_usage()
+    except Exception as e:
+        logger.error(f'Error flushing peer usage on shutdown: {e}')
+    accounting_task.cancel()
+    try:
+        await flush_accounting()
+    except Exception as e:
+        logger.error(f'Error flushing peer accounting on shutdown: {e}')
+    await accounting_lease.release()
+    # Accounting may have disabled peers above, so the audit queue is drained last
+    audit_task.cancel()
+    # Let a batch in flight finish (or spool) before the final flush
+    await asyncio.gather(audit_task, return_exceptions=True)
+    await audit_writer.flush()
+    logger.info('[*] FastAPI shutdown: Audit log flushed')
+    await config_writer.flush()
+    logger.info('[*] FastAPI shutdown: WireGuard config flushed')
     loop.stop()
     logger.info('[*] FastAPI shutdown: Token thread stopping')
     logger.info('[*] FastAPI shutdown: Database disconnected')
@@ -123,6 +189,8 @@ app.include_router(peer_router, tags=["Peers"], prefix="/api/peers")
 app.include_router(wg_router, tags=["WireGuard"], prefix="/api/wg_server")
 
 app.include_router(role_router, tags=["Role"], prefix="/api/roles")
+app.include_router(system_router, tags=["System"], prefix="/api/system")
+app.include_router(audit_router, tags=["Audit"], prefix="/api/audit")
 
 
 if __name__ == "__main__":
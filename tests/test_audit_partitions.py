@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.audit.schemas import AuditLogQuery
+from app.api.audit.services import audit_service
+from app.api.users.models import AuditLog
+from app.utils import audit
+from app.utils.audit import add_months, audit_partition_name, drop_expired_audit_partitions, ensure_audit_partitions
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeConnection:
+    """Records the SQL it is given; the partition listing answers with `partitions`."""
+
+    def __init__(self, partitions=()):
+        self.partitions = [(name,) for name in partitions]
+        self.statements = []
+
+    async def execute(self, statement):
+        self.statements.append(str(statement))
+        return FakeResult(self.partitions)
+
+
+@pytest.mark.parametrize("moment, months, expected", [
+    (datetime(2026, 1, 31, 23, 59), 1, datetime(2026, 2, 1)),
+    (datetime(2026, 11, 15), 2, datetime(2027, 1, 1)),
+    (datetime(2026, 1, 15), -1, datetime(2025, 12, 1)),
+    (datetime(2026, 3, 1), -14, datetime(2025, 1, 1)),
+])
+def test_add_months_lands_on_the_first_of_the_month(moment, months, expected):
+    assert add_months(moment, months) == expected
+
+
+def test_partitions_cover_every_month_through_the_end():
+    conn = FakeConnection()
+    asyncio.run(ensure_audit_partitions(conn, datetime(2026, 11, 20), datetime(2027, 1, 5)))
+
+    assert audit_partition_name(datetime(2026, 11, 1)) == "audit_logs_2026_11"
+    assert conn.statements == [
+        "CREATE TABLE IF NOT EXISTS audit_logs_2026_11 PARTITION OF audit_logs "
+        "FOR VALUES FROM ('2026-11-01') TO ('2026-12-01')",
+        "CREATE TABLE IF NOT EXISTS audit_logs_2026_12 PARTITION OF audit_logs "
+        "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')",
+        "CREATE TABLE IF NOT EXISTS audit_logs_2027_01 PARTITION OF audit_logs "
+        "FOR VALUES FROM ('2027-01-01') TO ('2027-02-01')",
+    ]
+
+
+def test_only_months_entirely_past_retention_are_dropped(monkeypatch):
+    class FixedDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return cls(2026, 10, 18, 12, 0)
+
+    monkeypatch.setattr(audit, "datetime", FixedDatetime)
+    conn = FakeConnection(["audit_logs_2026_03", "audit_logs_2026_04", "audit_logs_2026_05",
+                           "audit_logs_default", "audit_logs_2026_10"])
+
+    dropped = asyncio.run(drop_expired_audit_partitions(conn, retention_months=6))
+
+    # The cutoff is 2026-04-01, April itself still holds rows inside the window
+    assert dropped == ["audit_logs_2026_03"]
+    assert conn.statements[-1] == "DROP TABLE IF EXISTS audit_logs_2026_03"
+
+
+def targets(result):
+    return [item["target"] for item in result["items"]]
+
+
+def test_audit_log_listing_pages_newest_first_and_filters(sqlite_db, admin):
+    start = datetime(2026, 10, 1)
+
+    async def scenario():
+        async with sqlite_db(AuditLog) as db:
+            db.add_all([AuditLog(id=f"event-{i}", timestamp=start + timedelta(hours=i), admin_username="admin",
+                                 action="Added peer" if i % 2 else "Removed peer", target=f"peer-{i}")
+                        for i in range(5)])
+            await db.commit()
+            service = audit_service(db)
+            first = await service.list_audit_logs(admin, AuditLogQuery(limit=2))
+            second = await service.list_audit_logs(admin, AuditLogQuery(limit=2, cursor=first["next_cursor"]))
+            added = await service.list_audit_logs(admin, AuditLogQuery(action="Added peer"))
+            ranged = await service.list_audit_logs(
+                admin, AuditLogQuery(since=start + timedelta(hours=1), until=start + timedelta(hours=3)))
+            return first, second, added, ranged
+
+    first, second, added, ranged = asyncio.run(scenario())
+
+    assert targets(first) == ["peer-4", "peer-3"]
+    assert targets(second) == ["peer-2", "peer-1"]
+    assert targets(added) == ["peer-3", "peer-1"]
+    assert targets(ranged) == ["peer-2", "peer-1"]
+    assert added["next_cursor"] is None
+
+
+def test_audit_log_listing_rejects_an_empty_range(admin):
+    moment = datetime(2026, 10, 1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(audit_service(None).list_audit_logs(admin, AuditLogQuery(since=moment, until=moment)))
+    assert error.value.status_code == 400
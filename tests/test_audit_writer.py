@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils import audit
+from app.utils.audit import AuditWriter
+
+
+class FakeInsert:
+    """Stands in for the PostgreSQL INSERT and keeps the rows it was given."""
+
+    def __init__(self, table):
+        self.events = []
+
+    def values(self, events):
+        self.events = list(events)
+        return self
+
+    def on_conflict_do_nothing(self):
+        return self
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """The audit writer's sessions: `written` collects inserted events, `down` makes every write fail."""
+    state = SimpleNamespace(written=[], down=False)
+
+    class Session:
+        async def execute(self, statement):
+            if state.down:
+                raise ConnectionError("database unavailable")
+            self.pending = statement.events
+
+        async def commit(self):
+            state.written.extend(self.pending)
+
+    async def get_session():
+        yield Session()
+
+    monkeypatch.setattr(audit, "insert", FakeInsert)
+    monkeypatch.setattr(audit, "get_session", get_session)
+    return state
+
+
+@pytest.fixture
+def writer(tmp_path):
+    return AuditWriter(queue_size=2, batch_size=10, flush_interval=0.01, spool_path=str(tmp_path / "audit.spool"))
+
+
+def spooled(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as spool:
+        return [json.loads(line)["target"] for line in spool]
+
+
+def written(database):
+    return sorted(event["target"] for event in database.written)
+
+
+def test_full_queue_overflows_without_blocking(writer, database):
+    writer.record_many("admin", "Added peer", ["a", "b", "c"])
+
+    assert writer.stats()["queued"] == 2
+    assert writer.stats()["overflow"] == 1
+
+    asyncio.run(writer.flush())
+
+    # The overflow is spooled, then replayed by the write of the queued events
+    assert written(database) == ["a", "b", "c"]
+    assert writer.stats() == {"queued": 0, "queue_size": 2, "overflow": 0, "spool_pending": False}
+
+
+def test_outage_spools_events_and_the_next_write_replays_them(writer, database):
+    database.down = True
+    writer.record_many("admin", "Added peer", ["a", "b"])
+    asyncio.run(writer.flush())
+
+    assert database.written == []
+    assert spooled(writer.spool_path) == ["a", "b"]
+
+    database.down = False
+    writer.record("admin", "Removed peer", "c")
+    asyncio.run(writer.flush())
+
+    assert written(database) == ["a", "b", "c"]
+    assert not os.path.exists(writer.spool_path)
+
+
+def test_writer_task_survives_a_failed_batch(writer, database, monkeypatch):
+    real_write = writer._write
+    calls = []
+
+    async def flaky_write(events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise RuntimeError("unexpected")
+        await real_write(events)
+
+    monkeypatch.setattr(writer, "_write", flaky_write)
+
+    async def scenario():
+        task = asyncio.create_task(writer.run())
+        writer.record("admin", "Added peer", "a")
+        await asyncio.sleep(0.05)
+        writer.record("admin", "Added peer", "b")
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert len(calls) == 2
+    # The failed batch went to the spool and came back with the next successful write
+    assert written(database) == ["a", "b"]
+
+
+def test_cancelled_batch_is_spooled(writer, database):
+    writer.flush_interval = 60
+
+    async def scenario():
+        task = asyncio.create_task(writer.run())
+        writer.record("admin", "Added peer", "a")
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+    assert database.written == []
+    assert spooled(writer.spool_path) == ["a"]
+
+
+def test_spools_of_exited_workers_are_adopted(writer, database):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    root, ext = os.path.splitext(writer.spool_base)
+    orphan = AuditWriter(2, 10, 0.01, writer.spool_base)
+    orphan._spool([{"id": "orphan-1", "admin_username": "admin", "action": "Added peer", "target": "old",
+                    "timestamp": datetime(2026, 1, 1)}])
+    os.replace(orphan.spool_path, f"{root}.{exited.pid}{ext}")
+
+    writer.record("admin", "Added peer", "new")
+    asyncio.run(writer.flush())
+
+    assert written(database) == ["new", "old"]
+    assert os.listdir(os.path.dirname(writer.spool_base)) == []
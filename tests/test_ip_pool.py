@@ -0,0 +1,73 @@
+import pytest
+from fastapi import HTTPException
+
+from app.utils import ip_pool
+from app.utils.ip_pool import IPAllocator, invalidate_allocator
+
+
+def test_skips_network_gateway_and_broadcast():
+    allocator = IPAllocator("10.8.0.0/29")
+    assigned = [allocator.allocate() for _ in range(5)]
+    assert assigned == ["10.8.0.2", "10.8.0.3", "10.8.0.4", "10.8.0.5", "10.8.0.6"]
+    with pytest.raises(HTTPException):
+        allocator.allocate()
+
+
+def test_subnet_is_normalised():
+    allocator = IPAllocator("10.8.0.1/24")
+    assert str(allocator.network) == "10.8.0.0/24"
+    assert allocator.allocate() == "10.8.0.2"
+
+
+def test_specific_ip_and_conflicts():
+    allocator = IPAllocator("10.8.0.0/24")
+    assert allocator.allocate("10.8.0.50") == "10.8.0.50"
+    for taken in ("10.8.0.50", "10.8.0.1", "10.8.0.255", "10.9.0.1"):
+        with pytest.raises(HTTPException):
+            allocator.allocate(taken)
+
+
+def test_release_reuses_lowest_free_address():
+    allocator = IPAllocator("10.8.0.0/24")
+    for _ in range(10):
+        allocator.allocate()
+    allocator.release("10.8.0.4")
+    allocator.release("10.8.0.7")
+    assert allocator.allocate() == "10.8.0.4"
+    assert allocator.allocate() == "10.8.0.7"
+    assert allocator.allocate() == "10.8.0.12"
+
+
+def test_scan_wraps_to_addresses_freed_below_the_hint():
+    allocator = IPAllocator("10.8.0.0/29")
+    for _ in range(5):
+        allocator.allocate()
+    allocator._hint = allocator.last + 1
+    allocator._clear(allocator._index("10.8.0.3"))
+    assert allocator.allocate() == "10.8.0.3"
+
+
+def test_bitmap_round_trips_through_bytes():
+    allocator = IPAllocator("10.8.0.0/16")
+    assert len(allocator.bitmap) == 8192
+    allocator.mark_assigned(["10.8.0.2", "10.8.1.0", "10.8.255.255"])
+
+    restored = IPAllocator("10.8.0.0/16", bytes(allocator.bitmap), version=7)
+    assert restored.version == 7
+    assert restored.is_assigned(restored._index("10.8.0.2"))
+    assert restored.is_assigned(restored._index("10.8.1.0"))
+    # Broadcast is outside the allocatable range and is never marked
+    assert not restored.is_assigned(restored._index("10.8.255.255"))
+    assert restored.allocate() == "10.8.0.3"
+
+
+def test_invalidate_forces_a_reload(monkeypatch):
+    allocator = IPAllocator("10.8.0.0/24", version=12345)
+    monkeypatch.setattr(ip_pool, "_allocator", allocator)
+    invalidate_allocator()
+    assert allocator.version == -1
+
+
+def test_invalidate_without_allocator_is_a_no_op(monkeypatch):
+    monkeypatch.setattr(ip_pool, "_allocator", None)
+    invalidate_allocator()
@@ -0,0 +1,40 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.pagination import decode_cursor, encode_cursor, page, parse_fields, pick_fields
+
+
+def test_cursor_round_trip_is_url_safe():
+    created_at = datetime(2024, 5, 17, 12, 30, 1, 123456)
+    cursor = encode_cursor(created_at, "abc123")
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor) == (created_at, "abc123")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", encode_cursor(datetime(2024, 1, 1), "x")[:-3]])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_page_uses_the_look_ahead_row():
+    rows = [SimpleNamespace(created_at=datetime(2024, 1, day), id=str(day)) for day in range(1, 5)]
+    result = page([{"id": row.id} for row in rows], rows, 3)
+    assert [item["id"] for item in result["items"]] == ["1", "2", "3"]
+    assert decode_cursor(result["next_cursor"]) == (datetime(2024, 1, 3), "3")
+
+    last = page([{"id": "1"}], rows[:1], 3)
+    assert last == {"items": [{"id": "1"}], "next_cursor": None}
+
+
+def test_fields_are_validated_and_picked():
+    assert parse_fields(None, {"id"}) is None
+    fields = parse_fields("id, username", {"id", "username", "role"})
+    assert fields == {"id", "username"}
+    assert pick_fields({"id": 1, "username": "a", "role": "x"}, fields) == {"id": 1, "username": "a"}
+    with pytest.raises(HTTPException):
+        parse_fields("id,password", {"id", "username"})
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.utils import password_utils
+from app.utils.password_utils import (get_password_hash_async, login_slot, password_hash_stats,
+                                      verify_password_async)
+
+
+def test_hashing_runs_in_the_pool_and_is_counted():
+    before = password_hash_stats()
+
+    async def scenario():
+        hashed = await get_password_hash_async("correct horse")
+        return await asyncio.gather(
+            verify_password_async("correct horse", hashed),
+            verify_password_async("wrong horse", hashed))
+
+    assert asyncio.run(scenario()) == [True, False]
+
+    after = password_hash_stats()
+    assert after["completed"] - before["completed"] == 3
+    assert (after["queue_depth"], after["running"]) == (0, 0)
+    assert after["max_queue_depth"] >= 1
+
+
+def test_login_slot_answers_429_when_every_slot_stays_busy(monkeypatch):
+    monkeypatch.setattr(settings, "login_queue_timeout", 0.05)
+    before = password_hash_stats()["rejected_logins"]
+
+    async def scenario():
+        monkeypatch.setattr(password_utils, "_login_slots", asyncio.Semaphore(1))
+        async with login_slot():
+            with pytest.raises(HTTPException) as rejected:
+                async with login_slot():
+                    pass
+        # Released on exit, the next login gets through
+        async with login_slot():
+            pass
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 429
+    assert password_hash_stats()["rejected_logins"] - before == 1
@@ -0,0 +1,114 @@
+import asyncio
+
+from app.utils import peer_accounting
+from app.utils.peer_accounting import COUNTER_MAX, AccountingEngine, AccountingLease, counter_delta
+
+
+def test_counter_delta_growth():
+    assert counter_delta(100, 250) == 150
+    assert counter_delta(5, 5) == 0
+
+
+def test_counter_delta_reset_counts_from_zero():
+    # Interface restart: the counter starts over, everything it shows is new traffic
+    assert counter_delta(10_000, 300) == 300
+
+
+def test_counter_delta_wrap_near_the_top():
+    assert counter_delta(COUNTER_MAX - 9, 5) == 15
+    assert counter_delta(COUNTER_MAX, 0) == 1
+
+
+def sample(**counters):
+    return {public_key: {"rx": rx, "tx": tx} for public_key, (rx, tx) in counters.items()}
+
+
+def test_first_sample_is_a_baseline_and_later_keys_start_at_zero():
+    engine = AccountingEngine()
+    assert engine.process(sample(a=(1000, 2000))) == {}
+    assert engine.process(sample(a=(1500, 2000), b=(10, 20))) == {"a": (500, 0), "b": (10, 20)}
+    assert engine._pending == {"a": [500, 0], "b": [10, 20]}
+
+
+def test_reset_between_samples_is_not_negative():
+    engine = AccountingEngine()
+    engine.process(sample(a=(1000, 1000)))
+    assert engine.process(sample(a=(40, 1100))) == {"a": (40, 100)}
+
+
+def test_load_makes_the_next_sample_a_baseline_again():
+    engine = AccountingEngine()
+    engine.process(sample(a=(0, 0)))
+    engine._first_sample = True  # what `load` leaves behind
+    engine._last = {"a": (100, 100)}
+    assert engine.process(sample(a=(150, 100), c=(7, 7))) == {"a": (50, 0)}
+
+
+class FakeLeaseConnection:
+    def __init__(self, granted: bool):
+        self.granted = granted
+        self.statements = []
+        self.closed = False
+
+    async def scalar(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self.granted
+
+    async def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+
+    async def commit(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeLeaseEngine:
+    def __init__(self, granted: bool):
+        self.granted = granted
+        self.connections = []
+
+    async def connect(self):
+        self.connections.append(FakeLeaseConnection(self.granted))
+        return self.connections[-1]
+
+
+def test_lease_retries_are_throttled_for_non_holders(monkeypatch):
+    engine = FakeLeaseEngine(granted=False)
+    monkeypatch.setattr(peer_accounting, "lease_db_engine", engine)
+    lease = AccountingLease(key=1, retry_interval=60)
+
+    assert asyncio.run(lease.acquire()) is False
+    assert asyncio.run(lease.acquire()) is False
+    assert len(engine.connections) == 1
+    assert engine.connections[0].closed
+    assert not lease.held
+
+
+def test_lease_release_unlocks_before_closing(monkeypatch):
+    engine = FakeLeaseEngine(granted=True)
+    monkeypatch.setattr(peer_accounting, "lease_db_engine", engine)
+    loaded = []
+
+    async def fake_sessions():
+        yield "session"
+
+    async def fake_load(session):
+        loaded.append(session)
+
+    monkeypatch.setattr(peer_accounting, "get_session", fake_sessions)
+    monkeypatch.setattr(peer_accounting.accounting_engine, "load", fake_load)
+    lease = AccountingLease(key=1, retry_interval=60)
+
+    async def scenario():
+        assert await lease.acquire() is True
+        assert await lease.acquire() is True  # kept, only a liveness check
+        await lease.release()
+
+    asyncio.run(scenario())
+    conn = engine.connections[0]
+    assert len(engine.connections) == 1
+    assert loaded == ["session"]
+    assert any("pg_advisory_unlock" in statement for statement in conn.statements)
+    assert conn.closed and not lease.held
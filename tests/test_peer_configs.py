@@ -0,0 +1,153 @@
+import asyncio
+import io
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.peers import services as peer_services
+from app.api.peers.models import WireGuardPeer
+from app.api.peers.services import peer_service
+from app.api.wg_server.models import WGServerConfig
+from app.utils import peer_configs
+from app.utils.peer_configs import ConfigCache, config_filename, render_peer_config, stream_config_zip
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(peer_configs, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def row(peer_id, peer_name=None, server_id="server-1", ip="10.8.0.2"):
+    return SimpleNamespace(id=peer_id, user_id="user-1", server_id=server_id, peer_name=peer_name or peer_id,
+                           private_key=f"{peer_id}-private", assigned_ip=ip,
+                           server_public_key="server-public", server_ips="10.8.0.1/24")
+
+
+def test_config_uses_the_prefix_of_the_server_address():
+    config = render_peer_config("client-private", "10.8.0.7", "server-public", "10.8.0.1/24,fd00::1/64")
+
+    assert "Address = 10.8.0.7/24" in config
+    assert "PublicKey = server-public" in config
+    assert "Address = 10.8.0.7/32" in render_peer_config("k", "10.8.0.7", "s", "10.8.0.1")
+
+
+def test_cache_is_a_bounded_lru_with_a_ttl(clock):
+    cache = ConfigCache(maxsize=2, ttl=60)
+    cache.put(row("a"))
+    cache.put(row("b"))
+    cache.get("a")
+    cache.put(row("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a").config == render_peer_config("a-private", "10.8.0.2", "server-public", "10.8.0.1/24")
+
+    clock.now += 60
+    assert cache.get("a") is None
+
+
+def test_replica_rows_are_rendered_but_not_cached():
+    cache = ConfigCache(maxsize=10, ttl=60)
+
+    entry = cache.get_or_render(row("a"), cache=False)
+
+    assert entry.peer_name == "a"
+    assert cache.get("a") is None
+    assert cache.get_or_render(row("a")) is cache.get("a")
+
+
+def test_invalidation_by_peer_and_by_server():
+    cache = ConfigCache(maxsize=10, ttl=60)
+    for peer_id, server_id in [("a", "server-1"), ("b", "server-1"), ("c", "server-2")]:
+        cache.put(row(peer_id, server_id=server_id))
+
+    cache.invalidate("c", "missing")
+    assert cache.get("c") is None
+
+    cache.invalidate_server("server-1")
+    assert cache.get("a") is None and cache.get("b") is None
+
+
+def test_qr_images_are_rendered_once_per_format():
+    cache = ConfigCache(maxsize=10, ttl=60)
+    entry = cache.put(row("a"))
+
+    async def scenario():
+        first = await cache.qr(entry, "png")
+        return first, await cache.qr(entry, "png"), await cache.qr(entry, "svg")
+
+    png, again, svg = asyncio.run(scenario())
+
+    assert png.startswith(b"\x89PNG") and again is png
+    assert b"<svg" in svg
+    assert set(entry.qr) == {"png", "svg"}
+
+
+@pytest.mark.parametrize("peer_name, expected", [
+    ("laptop", "laptop.conf"),
+    ("Bob's phone / work", "Bob_s_phone_work.conf"),
+    ("../..", "peer-1.conf"),
+    (None, "peer-1.conf"),
+])
+def test_config_filenames_are_safe(peer_name, expected):
+    assert config_filename(peer_name, "peer-1") == expected
+
+
+def test_zip_export_is_streamed_and_valid(monkeypatch):
+    cache = ConfigCache(maxsize=10, ttl=60)
+    monkeypatch.setattr(peer_configs, "config_cache", cache)
+    rows = [row("a1b2c3d4e5", "phone", ip="10.8.0.2"), row("f6a7b8c9d0", "phone", ip="10.8.0.3"),
+            row("0123456789", "laptop", ip="10.8.0.4")]
+
+    async def scenario():
+        return [chunk async for chunk in stream_config_zip(rows, cache=False)]
+
+    chunks = asyncio.run(scenario())
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+    # One chunk per member plus the central directory
+    assert len(chunks) == 4
+    assert archive.namelist() == ["phone.conf", "phone-f6a7b8c9.conf", "laptop.conf"]
+    assert "Address = 10.8.0.3/24" in archive.read("phone-f6a7b8c9.conf").decode()
+    assert cache.get("a1b2c3d4e5") is None
+
+
+def test_peer_service_caches_configs_and_checks_ownership(sqlite_db, admin, monkeypatch):
+    cache = ConfigCache(maxsize=10, ttl=60)
+    monkeypatch.setattr(peer_services, "config_cache", cache)
+    owner = SimpleNamespace(id="user-1", username="alice", role_id="role-user")
+    stranger = SimpleNamespace(id="user-2", username="bob", role_id="role-user")
+
+    async def scenario():
+        async with sqlite_db(WGServerConfig, WireGuardPeer) as db:
+            db.add(WGServerConfig(id="server-1", server_name="test", interface_name="wg-test",
+                                  server_ips="10.8.0.1/24", allowed_ips="10.8.0.0/24", listen_port=51820,
+                                  private_key="server-private", public_key="server-public"))
+            db.add(WireGuardPeer(id="peer-1", user_id="user-1", peer_name="laptop", public_key="peer-public",
+                                 private_key="peer-private", assigned_ip="10.8.0.2", server_id="server-1"))
+            await db.commit()
+
+            service = peer_service(db)
+            config = await service.generate_peer_config("peer-1", owner)
+            cached = cache.get("peer-1")
+            with pytest.raises(HTTPException) as denied:
+                await service.generate_peer_config("peer-1", stranger)
+            as_admin = await service.generate_peer_config("peer-1", admin)
+            return config, cached, denied.value, as_admin
+
+    config, cached, denied, as_admin = asyncio.run(scenario())
+
+    assert "PrivateKey = peer-private" in config
+    assert cached is not None and cached.config == config == as_admin
+    assert denied.status_code == 403
@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select
+
+from app.api.peers.models import PeerAccount, PeerUsageBucket, WireGuardIPAllocation, WireGuardPeer
+from app.api.peers.services import peer_service
+from app.api.roles.models import Role
+from app.api.users.models import User
+from app.api.wg_server.models import WGServerConfig
+from app.utils import ip_pool
+
+MODELS = (Role, WGServerConfig, User, WireGuardPeer, WireGuardIPAllocation, PeerAccount, PeerUsageBucket)
+
+
+async def seed(db):
+    db.add(WGServerConfig(id="server-1", server_name="test", interface_name="wg-test",
+                          server_ips="10.8.0.1/24", allowed_ips="10.8.0.0/24", listen_port=51820,
+                          private_key="server-private", public_key="server-public"))
+    db.add_all([User(id="user-1", username="alice", role_id="role-user", password="x"),
+                User(id="user-2", username="bob", role_id="role-user", password="x")])
+    await db.commit()
+
+
+def bulk(*items):
+    return SimpleNamespace(peers=[SimpleNamespace(user_id=user_id, peer_name=name, ip=ip)
+                                  for user_id, name, ip in items])
+
+
+def test_bulk_add_creates_rows_addresses_and_interface_peers(sqlite_db, fake_driver, admin):
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            await seed(db)
+            result = await peer_service(db).add_peers_bulk(bulk(
+                ("user-1", "laptop", None),
+                ("user-2", "phone", "10.8.0.50"),
+                ("missing", "ghost", None),
+                ("user-1", "clash", "10.8.0.50"),
+            ), admin)
+            rows = (await db.execute(select(WireGuardPeer.peer_name, WireGuardPeer.assigned_ip))).all()
+            return result, dict(rows)
+
+    result, rows = asyncio.run(scenario())
+
+    assert (result["created"], result["failed"]) == (2, 2)
+    statuses = {item["peer_name"]: item["status"] for item in result["results"]}
+    assert statuses == {"laptop": "created", "phone": "created", "ghost": "failed", "clash": "failed"}
+    # Specific addresses are served before automatic ones
+    assert rows == {"laptop": "10.8.0.2", "phone": "10.8.0.50"}
+    interface = fake_driver.interfaces["wg-test"]
+    assert sorted(peer["allowed_ips"] for peer in interface.values()) == ["10.8.0.2/32", "10.8.0.50/32"]
+
+
+def test_failed_commit_reverts_the_interface_and_the_allocator(sqlite_db, fake_driver, admin):
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            await seed(db)
+            await ip_pool.populate_ip_pool(db, "10.8.0.0/24")
+
+            async def failing_commit():
+                raise RuntimeError("database went away")
+
+            real_commit, db.commit = db.commit, failing_commit
+            with pytest.raises(RuntimeError):
+                await peer_service(db).add_peers_bulk(bulk(("user-1", "laptop", None)), admin)
+            db.commit = real_commit
+            return await db.scalar(select(func.count(WireGuardPeer.id)))
+
+    assert asyncio.run(scenario()) == 0
+    assert fake_driver.interfaces["wg-test"] == {}
+    # The next allocation reloads the bitmap instead of trusting the rolled back one
+    assert ip_pool._allocator.version == -1
+
+
+def test_failed_driver_call_rolls_back_the_rows(sqlite_db, fake_driver, admin):
+    async def failing_set_peers(interface, peers):
+        raise RuntimeError("netlink refused")
+
+    fake_driver.set_peers = failing_set_peers
+
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            await seed(db)
+            with pytest.raises(RuntimeError):
+                await peer_service(db).add_peers_bulk(bulk(("user-1", "laptop", None)), admin)
+            return await db.scalar(select(func.count(WireGuardPeer.id)))
+
+    assert asyncio.run(scenario()) == 0
+    assert ip_pool._allocator.version == -1
+
+
+async def provision(db, admin, *names):
+    await seed(db)
+    await peer_service(db).add_peers_bulk(bulk(*[("user-1", name, None) for name in names]), admin)
+    rows = await db.execute(select(WireGuardPeer.peer_name, WireGuardPeer.id))
+    return dict(rows.all())
+
+
+def usage_row(peer_id):
+    return PeerUsageBucket(peer_id=peer_id, resolution="hour", bucket_start=datetime(2026, 1, 1), rx_bytes=1, tx_bytes=1)
+
+
+def test_bulk_remove_frees_addresses_and_drops_usage_history(sqlite_db, fake_driver, admin):
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            ids = await provision(db, admin, "laptop", "phone")
+            db.add_all([usage_row(ids["laptop"]), usage_row(ids["phone"])])
+            await db.commit()
+
+            result = await peer_service(db).remove_peers_bulk(
+                SimpleNamespace(peer_ids=[ids["laptop"], "missing"], user_id=None), admin)
+            usage = (await db.execute(select(PeerUsageBucket.peer_id))).scalars().all()
+            [reused] = await ip_pool.allocate_ips(db, [None])
+            return ids, result, usage, reused
+
+    ids, result, usage, reused = asyncio.run(scenario())
+
+    assert result["peer_ids"] == [ids["laptop"]]
+    assert result["not_found"] == ["missing"]
+    assert usage == [ids["phone"]]
+    assert reused == "10.8.0.2"
+    assert [peer["allowed_ips"] for peer in fake_driver.interfaces["wg-test"].values()] == ["10.8.0.3/32"]
+
+
+def test_failed_commit_puts_torn_down_peers_back(sqlite_db, fake_driver, admin):
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            ids = await provision(db, admin, "laptop", "phone")
+
+            async def failing_commit():
+                raise RuntimeError("database went away")
+
+            real_commit, db.commit = db.commit, failing_commit
+            with pytest.raises(RuntimeError):
+                await peer_service(db).remove_peers_bulk(
+                    SimpleNamespace(peer_ids=list(ids.values()), user_id=None), admin)
+            db.commit = real_commit
+            return await db.scalar(select(func.count(WireGuardPeer.id)))
+
+    assert asyncio.run(scenario()) == 2
+    interface = fake_driver.interfaces["wg-test"]
+    assert sorted(peer["allowed_ips"] for peer in interface.values()) == ["10.8.0.2/32", "10.8.0.3/32"]
+    assert ip_pool._allocator.version == -1
+
+
+def test_peers_from_an_older_subnet_can_still_be_removed(sqlite_db, fake_driver, admin):
+    async def scenario():
+        async with sqlite_db(*MODELS) as db:
+            await seed(db)
+            await ip_pool.populate_ip_pool(db, "10.8.0.0/24")
+            legacy = WireGuardPeer(user_id="user-1", peer_name="old", public_key="old-public",
+                                   private_key="old-private", assigned_ip="192.168.7.9", server_id="server-1")
+            db.add(legacy)
+            await db.commit()
+
+            await peer_service(db).remove_peers_bulk(SimpleNamespace(peer_ids=[legacy.id], user_id=None), admin)
+            remaining = await db.scalar(select(func.count(WireGuardPeer.id)))
+            return remaining, await ip_pool.allocate_ips(db, [None])
+
+    remaining, allocated = asyncio.run(scenario())
+    assert remaining == 0
+    # The pool itself is untouched by the foreign address
+    assert allocated == ["10.8.0.2"]
@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from app.utils.peer_stream import PeerStatsBroadcaster
+
+
+def sample(rx, tx, handshake=0, endpoint="203.0.113.7:51820"):
+    return {"rx": rx, "tx": tx, "latest_handshake": handshake, "endpoint": endpoint}
+
+
+def drain(subscriber):
+    messages = []
+    while not subscriber.queue.empty():
+        messages.append(subscriber.queue.get_nowait())
+    return messages
+
+
+def test_deltas_carry_rates_and_skip_idle_peers():
+    previous = {"busy": sample(1000, 500, 100), "idle": sample(10, 10, 100),
+                "reset": sample(5000, 5000, 100), "moved": sample(0, 0, 100)}
+    current = {"busy": sample(3000, 1500, 100), "idle": sample(10, 10, 100),
+               "reset": sample(100, 100, 100), "moved": sample(0, 0, 100, endpoint="198.51.100.1:4000"),
+               "new": sample(0, 0)}
+
+    deltas = PeerStatsBroadcaster.compute_deltas(previous, current, elapsed=2.0)
+
+    assert (deltas["busy"]["rx_rate"], deltas["busy"]["tx_rate"]) == (1000.0, 500.0)
+    assert "idle" not in deltas
+    # A counter reset is not reported as negative traffic, and with nothing else changed the peer is skipped
+    assert "reset" not in deltas
+    assert deltas["moved"]["endpoint_changed"] is True
+    assert deltas["new"]["handshake_age"] is None and deltas["new"]["rx_rate"] == 0.0
+
+
+def test_publish_shows_each_subscriber_only_its_peers():
+    broadcaster = PeerStatsBroadcaster(queue_size=10)
+    alice = broadcaster.subscribe({"key-a": "peer-a"})
+    admin = broadcaster.subscribe({"key-a": "peer-a", "key-b": "peer-b"})
+
+    broadcaster.publish({}, {"key-a": sample(1, 1), "key-b": sample(2, 2)}, None, datetime(2026, 1, 1))
+
+    [to_alice] = drain(alice)
+    [to_admin] = drain(admin)
+    assert set(to_alice["peers"]) == {"peer-a"}
+    assert set(to_admin["peers"]) == {"peer-a", "peer-b"}
+    assert to_alice["sampled_at"] == "2026-01-01T00:00:00"
+    assert to_alice["interval"] is None
+
+
+def test_slow_subscriber_keeps_the_latest_samples():
+    broadcaster = PeerStatsBroadcaster(queue_size=2)
+    subscriber = broadcaster.subscribe({"key-a": "peer-a"})
+
+    for second in range(1, 4):
+        broadcaster.publish({}, {"key-a": sample(second, second)}, 1.0, datetime(2026, 1, 1, 0, 0, second))
+
+    assert [message["peers"]["peer-a"]["rx"] for message in drain(subscriber)] == [2, 3]
+
+
+def test_unsubscribed_clients_receive_nothing():
+    broadcaster = PeerStatsBroadcaster(queue_size=2)
+    subscriber = broadcaster.subscribe({"key-a": "peer-a"})
+    broadcaster.unsubscribe(subscriber)
+
+    broadcaster.publish({}, {"key-a": sample(1, 1)}, 1.0, datetime(2026, 1, 1))
+
+    assert drain(subscriber) == []
+    assert broadcaster.subscribers == set()
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.api.peers.models import PeerUsageBucket
+from app.utils.peer_usage import UsageRecorder, bucket_start, default_step, query_usage
+
+
+def at(hour, minute, second=0):
+    return datetime(2026, 3, 14, hour, minute, second, tzinfo=timezone.utc)
+
+
+def peers(**counters):
+    return {public_key: {"rx": rx, "tx": tx} for public_key, (rx, tx) in counters.items()}
+
+
+class FailingSession:
+    async def execute(self, *args, **kwargs):
+        raise ConnectionError("database unavailable")
+
+
+def test_bucket_start_truncates_to_the_resolution_in_utc():
+    moment = datetime(2026, 3, 14, 15, 47, 31, tzinfo=timezone(timedelta(hours=2)))
+
+    assert bucket_start(moment, "minute") == datetime(2026, 3, 14, 13, 47)
+    assert bucket_start(moment, "hour") == datetime(2026, 3, 14, 13, 0)
+    assert bucket_start(moment, "day") == datetime(2026, 3, 14)
+
+
+def test_deltas_roll_up_into_minute_hour_and_day_buckets():
+    recorder = UsageRecorder(ring_size=10)
+    recorder.record(peers(a=(100, 10)), {"a": (100, 10)}, at(9, 0, 5))
+    recorder.record(peers(a=(150, 20)), {"a": (50, 10)}, at(9, 0, 35))
+    recorder.record(peers(a=(160, 25)), {"a": (10, 5)}, at(9, 1, 5))
+
+    assert recorder._pending[("a", "minute", datetime(2026, 3, 14, 9, 0))] == [150, 20]
+    assert recorder._pending[("a", "minute", datetime(2026, 3, 14, 9, 1))] == [10, 5]
+    assert recorder._pending[("a", "hour", datetime(2026, 3, 14, 9, 0))] == [160, 25]
+    assert recorder._pending[("a", "day", datetime(2026, 3, 14))] == [160, 25]
+
+
+def test_ring_buffer_is_bounded_and_forgets_departed_peers():
+    recorder = UsageRecorder(ring_size=2)
+    for second in range(3):
+        recorder.record(peers(a=(second, second), b=(0, 0)), {}, at(9, 0, second))
+    recorder.record(peers(a=(3, 3)), {}, at(9, 0, 3))
+
+    assert [sample["rx"] for sample in recorder.recent("a", at(9, 0), at(9, 1))] == [2, 3]
+    assert recorder.recent("a", at(9, 0, 3), at(9, 0, 3)) == [{"timestamp": at(9, 0, 3), "rx": 3, "tx": 3}]
+    assert "b" not in recorder.samples
+
+
+def test_failed_flush_keeps_the_deltas_for_the_next_one():
+    recorder = UsageRecorder(ring_size=2)
+    recorder.record(peers(a=(100, 10)), {"a": (100, 10)}, at(9, 0))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(recorder.flush(FailingSession()))
+    recorder.record(peers(a=(150, 20)), {"a": (50, 10)}, at(9, 0, 30))
+
+    assert recorder._pending[("a", "minute", datetime(2026, 3, 14, 9, 0))] == [150, 20]
+
+
+def test_query_usage_reads_the_requested_resolution(sqlite_db):
+    async def scenario():
+        async with sqlite_db(PeerUsageBucket) as db:
+            db.add_all([
+                PeerUsageBucket(peer_id="peer-a", resolution="hour", bucket_start=datetime(2026, 3, 14, hour),
+                                rx_bytes=hour, tx_bytes=0)
+                for hour in range(8, 12)
+            ] + [PeerUsageBucket(peer_id="peer-a", resolution="day", bucket_start=datetime(2026, 3, 14),
+                                 rx_bytes=99, tx_bytes=0),
+                 PeerUsageBucket(peer_id="peer-b", resolution="hour", bucket_start=datetime(2026, 3, 14, 9),
+                                 rx_bytes=1, tx_bytes=0)])
+            await db.commit()
+            # The start is widened to its bucket, so the 09:00 bucket counts for 09:30
+            return await query_usage(db, "peer-a", at(9, 30), at(10, 0), "hour")
+
+    rows = asyncio.run(scenario())
+
+    assert [(row["bucket_start"].hour, row["rx"]) for row in rows] == [(9, 9), (10, 10)]
+
+
+@pytest.mark.parametrize("span, step", [
+    (timedelta(hours=6), "minute"),
+    (timedelta(hours=7), "hour"),
+    (timedelta(days=14), "hour"),
+    (timedelta(days=15), "day"),
+])
+def test_default_step_follows_the_range(span, step):
+    assert default_step(at(0, 0), at(0, 0) + span) == step
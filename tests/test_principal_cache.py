@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete
+
+from app.api.roles.models import Role
+from app.api.users.models import RevokedToken, User
+from app.utils import httpbearer, principal_cache as principal_cache_module
+from app.utils.principal_cache import PrincipalCache
+from app.utils.security import create_access_token
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(principal_cache_module, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PrincipalCache(maxsize=2, ttl=60)
+    cache.put("alice", "A")
+    cache.put("bob", "B")
+    assert cache.get("alice") == "A"
+
+    cache.put("carol", "C")
+
+    assert cache.get("bob") is None
+    assert (cache.get("alice"), cache.get("carol")) == ("A", "C")
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put("alice", "A")
+
+    clock.now += 59
+    assert cache.get("alice") == "A"
+    clock.now += 1
+    assert cache.get("alice") is None
+
+
+def test_invalidate_skips_missing_subjects():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    cache.put("alice", "A")
+    cache.put("bob", "B")
+
+    cache.invalidate(None, "alice", "nobody")
+
+    assert cache.get("alice") is None
+    assert cache.get("bob") == "B"
+
+
+def test_resolve_user_serves_repeat_tokens_from_the_cache(sqlite_db, monkeypatch):
+    cache = PrincipalCache(maxsize=10, ttl=60)
+    monkeypatch.setattr(httpbearer, "principal_cache", cache)
+    token = create_access_token({"username": "alice"})
+
+    async def scenario():
+        async with sqlite_db(Role, User, RevokedToken) as db:
+            db.add(User(id="user-1", username="alice", role_id="role-user", password="x"))
+            await db.commit()
+
+            first = await httpbearer.resolve_user(token, db)
+            # Gone from the database, still answered from memory
+            await db.execute(delete(User))
+            await db.commit()
+            second = await httpbearer.resolve_user(token, db)
+
+            cache.invalidate("alice")
+            with pytest.raises(HTTPException) as missing:
+                await httpbearer.resolve_user(token, db)
+            return first, second, missing.value
+
+    first, second, missing = asyncio.run(scenario())
+
+    assert first is second
+    assert first.username == "alice"
+    assert missing.status_code == 401
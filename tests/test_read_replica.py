@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+from starlette.requests import Request
+
+from app.core import database
+from app.core.database import (LAST_WRITE_COOKIE, LAST_WRITE_HEADER, ReadYourWritesMiddleware, ReplicaRouter,
+                               get_read_session, last_write_at)
+
+
+class FakeReplica:
+    """An engine whose connections answer the lag query with `lag`, or fail when it is an exception."""
+
+    def __init__(self, lag):
+        self.lag = lag
+        self.checks = 0
+
+    def connect(self):
+        replica = self
+
+        class Connection:
+            async def __aenter__(self):
+                replica.checks += 1
+                if isinstance(replica.lag, Exception):
+                    raise replica.lag
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def scalar(self, statement):
+                return replica.lag
+
+        return Connection()
+
+
+def request(headers=None, method="GET"):
+    raw = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": method, "headers": raw, "path": "/", "query_string": b""})
+
+
+def router(lag, **overrides):
+    options = {"max_lag": 1.0, "check_interval": 60, "pin_window": 5.0, **overrides}
+    return ReplicaRouter(FakeReplica(lag) if lag is not None else None, **options)
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({LAST_WRITE_HEADER: "1700000000.5"}, 1700000000.5),
+    ({"cookie": f"{LAST_WRITE_COOKIE}=1700000001.25"}, 1700000001.25),
+    ({LAST_WRITE_HEADER: "soon"}, None),
+    ({}, None),
+])
+def test_last_write_is_read_from_the_header_or_the_cookie(headers, expected):
+    assert last_write_at(request(headers)) == expected
+
+
+def test_recent_writers_read_from_the_primary():
+    replica_router = router(lag=0.0)
+
+    assert asyncio.run(replica_router.use_replica(time.time() - 1)) is False
+    assert replica_router.pinned_reads == 1
+    assert asyncio.run(replica_router.use_replica(time.time() - 10)) is True
+    assert asyncio.run(replica_router.use_replica(None)) is True
+
+
+def test_lagging_or_unreachable_replica_is_skipped():
+    assert asyncio.run(router(lag=3.0).use_replica(None)) is False
+    assert asyncio.run(router(lag=ConnectionError("replica down")).use_replica(None)) is False
+    assert asyncio.run(router(lag=None).use_replica(None)) is False
+
+
+def test_replica_lag_is_measured_once_per_interval():
+    replica_router = router(lag=0.2)
+
+    async def scenario():
+        return [await replica_router.replica_lag() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [0.2, 0.2, 0.2]
+    assert replica_router.engine.checks == 1
+
+
+def test_read_session_is_the_primary_without_a_replica(monkeypatch):
+    monkeypatch.setattr(database, "read_router", router(lag=None))
+    primary = object()
+
+    async def scenario():
+        sessions = get_read_session(request(), primary)
+        return await sessions.__anext__()
+
+    assert asyncio.run(scenario()) is primary
+
+
+def run_middleware(method):
+    messages = []
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "headers": [], "path": "/"}
+    asyncio.run(ReadYourWritesMiddleware(app)(scope, None, send))
+    return dict(messages[0]["headers"])
+
+
+def test_writes_are_stamped_with_a_cookie_and_a_header(monkeypatch):
+    monkeypatch.setattr(database, "read_router", router(lag=0.0))
+    before = time.time()
+
+    headers = run_middleware("POST")
+
+    stamp = float(headers[LAST_WRITE_HEADER.encode()])
+    assert before <= stamp <= time.time() + 0.001
+    cookie = headers[b"set-cookie"].decode()
+    assert cookie.startswith(f"{LAST_WRITE_COOKIE}={headers[LAST_WRITE_HEADER.encode()].decode()};")
+    assert "Max-Age=6" in cookie and "HttpOnly" in cookie
+
+    # The stamped value is what the next request is routed on
+    assert last_write_at(request({"cookie": cookie.split(";")[0]})) == stamp
+
+
+def test_reads_and_replica_less_deployments_are_not_stamped(monkeypatch):
+    monkeypatch.setattr(database, "read_router", router(lag=0.0))
+    assert LAST_WRITE_HEADER.encode() not in run_middleware("GET")
+
+    monkeypatch.setattr(database, "read_router", router(lag=None))
+    assert LAST_WRITE_HEADER.encode() not in run_middleware("DELETE")
@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.roles.models import Role
+from app.utils import authz
+from app.utils.authz import RoleCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(authz, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Points `get_session` in the role cache at a test session and counts the loads."""
+    state = SimpleNamespace(db=None, opened=0, fail=False)
+
+    async def get_session():
+        state.opened += 1
+        if state.fail:
+            raise ConnectionError("database unavailable")
+        yield state.db
+
+    monkeypatch.setattr(authz, "get_session", get_session)
+    return state
+
+
+def test_roles_are_reloaded_only_once_the_ttl_expires(sqlite_db, sessions, clock):
+    cache = RoleCache(ttl=30)
+
+    async def scenario():
+        async with sqlite_db(Role) as db:
+            sessions.db = db
+            db.add(Role(id="role-admin", role="admin"))
+            await db.commit()
+
+            await cache.ensure_loaded()
+            db.add(Role(id="role-user", role="user"))
+            await db.commit()
+
+            clock.now += 29
+            await cache.ensure_loaded()
+            before_expiry = dict(cache.roles)
+
+            clock.now += 1
+            await cache.ensure_loaded()
+            return before_expiry
+
+    before_expiry = asyncio.run(scenario())
+
+    assert before_expiry == {"role-admin": "admin"}
+    assert cache.roles == {"role-admin": "admin", "role-user": "user"}
+    assert sessions.opened == 2
+
+
+def test_failed_refresh_keeps_the_previous_roles(sessions, clock):
+    cache = RoleCache(ttl=30)
+    cache.roles = {"role-admin": "admin"}
+    cache.loaded = True
+    cache._loaded_at = clock.now
+    sessions.fail = True
+
+    clock.now += 31
+    asyncio.run(cache.ensure_loaded())
+    assert cache.roles == {"role-admin": "admin"}
+
+    # The failure counts as a refresh, so the database is not retried on every check
+    asyncio.run(cache.ensure_loaded())
+    assert sessions.opened == 1
+
+
+def test_first_load_failure_is_raised(sessions):
+    sessions.fail = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(RoleCache(ttl=30).ensure_loaded())
+
+
+def test_require_admin_answers_from_the_cache(admin, sessions):
+    user = SimpleNamespace(id="user-1", username="alice", role_id="role-user")
+
+    asyncio.run(authz.require_admin(admin))
+    with pytest.raises(HTTPException) as denied:
+        asyncio.run(authz.require_admin(user))
+
+    assert denied.value.status_code == 403
+    assert asyncio.run(authz.has_admin_role(user)) is False
+    assert sessions.opened == 0
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from app.api.users.models import RevokedToken
+from app.utils import token_blacklist
+from app.utils.security import create_access_token, decode_token
+from app.utils.token_blacklist import RevocationStore, token_id
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def revoked_row(jti, expires_at):
+    return RevokedToken(jti=jti, expires_at=expires_at.replace(tzinfo=None))
+
+
+def test_token_id_prefers_the_jti():
+    token = create_access_token({"username": "alice"})
+    payload = decode_token(token)
+
+    assert token_id(token, payload) == payload["jti"]
+    assert len(token_id(token)) == 64
+
+
+def test_not_revoked_answers_are_cached_for_the_negative_ttl(sqlite_db, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_blacklist, "time", SimpleNamespace(monotonic=clock))
+    store = RevocationStore(negative_ttl=5, negative_size=10)
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+
+    async def scenario():
+        async with sqlite_db(RevokedToken) as db:
+            first = await store.is_revoked("jti-1", db)
+            # Revoked by another worker, this one trusts its cache until the TTL passes
+            db.add(revoked_row("jti-1", expires_at))
+            await db.commit()
+            cached = await store.is_revoked("jti-1", db)
+            clock.now += 5
+            return first, cached, await store.is_revoked("jti-1", db)
+
+    assert asyncio.run(scenario()) == (False, False, True)
+
+
+def test_negative_cache_is_bounded(sqlite_db):
+    store = RevocationStore(negative_ttl=60, negative_size=2)
+
+    async def scenario():
+        async with sqlite_db(RevokedToken) as db:
+            for jti in ("a", "b", "c"):
+                await store.is_revoked(jti, db)
+
+    asyncio.run(scenario())
+    assert list(store._not_revoked) == ["b", "c"]
+
+
+def test_expired_revocations_no_longer_count(sqlite_db):
+    store = RevocationStore(negative_ttl=60, negative_size=10)
+
+    async def scenario():
+        async with sqlite_db(RevokedToken) as db:
+            db.add(revoked_row("old", datetime.now(timezone.utc) - timedelta(minutes=1)))
+            await db.commit()
+            return await store.is_revoked("old", db)
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_sweep_drops_only_expired_entries(sqlite_db):
+    store = RevocationStore(negative_ttl=60, negative_size=10)
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        async with sqlite_db(RevokedToken) as db:
+            db.add_all([revoked_row("expired", now - timedelta(minutes=1)),
+                        revoked_row("live", now + timedelta(hours=1))])
+            await db.commit()
+            for jti in ("expired", "live"):
+                await store.is_revoked(jti, db)
+
+            removed = await store.sweep(db)
+            stored = (await db.execute(select(RevokedToken.jti))).scalars().all()
+            return removed, stored
+
+    removed, stored = asyncio.run(scenario())
+
+    assert removed == 1
+    assert stored == ["live"]
+    assert list(store._revoked) == ["live"]
+    assert [jti for _, jti in store._expiry_heap] == ["live"]
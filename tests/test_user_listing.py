@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.api.peers.models import WireGuardPeer
+from app.api.roles.models import Role
+from app.api.users.models import User
+from app.api.users.schemas import UserListQuery
+from app.api.users.services import user_service
+
+
+async def seed(db):
+    db.add_all([Role(id="role-admin", role="admin"), Role(id="role-user", role="user")])
+    start = datetime(2026, 1, 1)
+    for i, (name, peers) in enumerate([("alice", 2), ("bob", 0), ("carol", 1)]):
+        db.add(User(id=f"user-{name}", username=name, role_id="role-user", password="x",
+                    created_at=start + timedelta(minutes=i)))
+        db.add_all([WireGuardPeer(user_id=f"user-{name}", peer_name=f"{name}-{n}", public_key=f"{name}-{n}",
+                                  private_key=f"{name}-{n}-private", assigned_ip=f"10.8.{i}.{n + 2}")
+                    for n in range(peers)])
+    await db.commit()
+
+
+def count_statements(db):
+    statements = []
+    event.listen(db.bind.sync_engine, "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_listing_counts_peers_in_a_single_query(sqlite_db, admin):
+    async def scenario():
+        async with sqlite_db(Role, User, WireGuardPeer) as db:
+            await seed(db)
+            statements = count_statements(db)
+            result = await user_service(db).get_all_users(admin, UserListQuery())
+            return result, statements
+
+    result, statements = asyncio.run(scenario())
+
+    assert len(statements) == 1
+    assert [(item["username"], item["role"], item["peer_count"]) for item in result["items"]] == [
+        ("alice", "user", 2), ("bob", "user", 0), ("carol", "user", 1)]
+    assert result["next_cursor"] is None
+
+
+def test_listing_filters_and_pages(sqlite_db, admin):
+    async def scenario():
+        async with sqlite_db(Role, User, WireGuardPeer) as db:
+            await seed(db)
+            service = user_service(db)
+            first = await service.get_all_users(admin, UserListQuery(limit=2, fields="username,peer_count"))
+            second = await service.get_all_users(admin, UserListQuery(limit=2, cursor=first["next_cursor"]))
+            filtered = await service.get_all_users(admin, UserListQuery(username="ca"))
+            return first, second, filtered
+
+    first, second, filtered = asyncio.run(scenario())
+
+    assert first["items"] == [{"username": "alice", "peer_count": 2}, {"username": "bob", "peer_count": 0}]
+    assert [item["username"] for item in second["items"]] == ["carol"]
+    assert [item["username"] for item in filtered["items"]] == ["carol"]
+
+
+def test_user_detail_counts_instead_of_loading_peers(sqlite_db, admin):
+    async def scenario():
+        async with sqlite_db(Role, User, WireGuardPeer) as db:
+            await seed(db)
+            statements = count_statements(db)
+            return await user_service(db).get_user_by_id("user-alice", admin), statements
+
+    user, statements = asyncio.run(scenario())
+
+    assert user.peer_count == 2
+    assert user.role.role == "user"
+    assert len(statements) == 2
+    assert "count(" in statements[1].lower()
@@ -0,0 +1,204 @@
+import asyncio
+import base64
+import socket
+import struct
+
+import pytest
+
+from app.utils.wg_driver import (
+    NETLINK_PEER_CHUNK, NLA_HEADER, NLM_F_MULTI, NLMSG_DONE, NLMSG_ERROR, NLMSG_HEADER,
+    WGALLOWEDIP_A_CIDR_MASK, WGALLOWEDIP_A_FAMILY, WGALLOWEDIP_A_IPADDR, WGDEVICE_A_IFNAME,
+    WGDEVICE_A_PEERS, WGPEER_A_ALLOWEDIPS, WGPEER_A_ENDPOINT, WGPEER_A_FLAGS,
+    WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL, WGPEER_A_PRESHARED_KEY, WGPEER_A_PUBLIC_KEY,
+    WGPEER_A_RX_BYTES, WGPEER_A_TX_BYTES, WGPEER_F_REPLACE_ALLOWEDIPS, FakeDriver, GENL_HEADER,
+    NetlinkDriver, WGDriverError, _allowed_ip_attr, _format_endpoint, _nla, _nla_nested, _parse_attrs)
+
+
+def key(seed: int) -> str:
+    return base64.b64encode(bytes([seed]) * 32).decode()
+
+
+'''
+-----------------------------------------------------
+|                Attribute encoding                 |
+-----------------------------------------------------
+'''
+
+
+def test_nla_pads_to_four_bytes():
+    attr = _nla(7, b"abcde")
+    length, attr_type = NLA_HEADER.unpack_from(attr)
+    assert (length, attr_type) == (NLA_HEADER.size + 5, 7)
+    assert len(attr) == 12
+    assert attr.endswith(b"\0\0\0")
+
+
+def test_parse_attrs_round_trips_nested_attributes():
+    nested = _nla_nested(WGDEVICE_A_PEERS, [_nla(1, b"x"), _nla(2, b"yz")])
+    [(attr_type, payload)] = _parse_attrs(nested)
+    assert attr_type == WGDEVICE_A_PEERS  # the NESTED flag is masked off
+    assert _parse_attrs(payload) == [(1, b"x"), (2, b"yz")]
+
+
+def test_allowed_ip_attr_encodes_family_address_and_mask():
+    [(_, payload)] = _parse_attrs(_allowed_ip_attr("10.8.0.7/32"))
+    values = dict(_parse_attrs(payload))
+    assert struct.unpack("=H", values[WGALLOWEDIP_A_FAMILY])[0] == socket.AF_INET
+    assert values[WGALLOWEDIP_A_IPADDR] == bytes([10, 8, 0, 7])
+    assert struct.unpack("=B", values[WGALLOWEDIP_A_CIDR_MASK])[0] == 32
+
+
+def test_format_endpoint_ipv4_and_ipv6():
+    ipv4 = struct.pack("=H", socket.AF_INET) + struct.pack("!H", 51820) + socket.inet_aton("192.0.2.1")
+    assert _format_endpoint(ipv4 + b"\0" * 8) == "192.0.2.1:51820"
+
+    ipv6 = (struct.pack("=H", socket.AF_INET6) + struct.pack("!H", 443) + b"\0" * 4
+            + socket.inet_pton(socket.AF_INET6, "2001:db8::1") + b"\0" * 4)
+    assert _format_endpoint(ipv6) == "[2001:db8::1]:443"
+
+
+'''
+-----------------------------------------------------
+|          Request/reply and SET chunking           |
+-----------------------------------------------------
+'''
+
+
+class FakeSocket:
+    """Returns canned datagrams from `recv`, with the sequence number of the last `send`."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        seq = NLMSG_HEADER.unpack_from(self.sent[-1])[3]
+        return b"".join(build(seq) for build in self.replies.pop(0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def message(msg_type, flags=0, payload=b""):
+    def build(seq):
+        length = NLMSG_HEADER.size + len(payload)
+        return NLMSG_HEADER.pack(length, msg_type, flags, seq, 0) + payload + b"\0" * (-length % 4)
+    return build
+
+
+def test_request_collects_multipart_replies_until_done():
+    body = GENL_HEADER.pack(0, 1, 0)
+    sock = FakeSocket([
+        [message(0x20, NLM_F_MULTI, body + b"one!")],
+        [message(0x20, NLM_F_MULTI, body + b"two!"), message(NLMSG_DONE)],
+    ])
+    replies = NetlinkDriver()._request(sock, 0x20, 0, 0x300, b"")
+    assert replies == [b"one!", b"two!"]
+
+
+def test_request_raises_on_netlink_error():
+    sock = FakeSocket([[message(NLMSG_ERROR, 0, struct.pack("=i", -1))]])
+    with pytest.raises(WGDriverError):
+        NetlinkDriver()._request(sock, 0x20, 1, 0x04, b"")
+
+
+def test_set_peers_is_split_into_chunks():
+    driver = NetlinkDriver()
+    sent = []
+    driver._open = lambda: FakeSocket([])
+    driver._resolve_family = lambda sock: 0x20
+    driver._request = lambda sock, family, cmd, flags, attrs: sent.append(attrs) or []
+
+    count = NETLINK_PEER_CHUNK * 2 + 5
+    asyncio.run(driver.set_peers("wg0", [(key(i % 256), f"10.8.{i // 250}.{i % 250}/32") for i in range(count)]))
+
+    assert len(sent) == 3
+    sizes = []
+    for attrs in sent:
+        values = dict(_parse_attrs(attrs))
+        assert values[WGDEVICE_A_IFNAME] == b"wg0\0"
+        peers = _parse_attrs(values[WGDEVICE_A_PEERS])
+        sizes.append(len(peers))
+        peer = dict(_parse_attrs(peers[0][1]))
+        assert struct.unpack("=I", peer[WGPEER_A_FLAGS])[0] == WGPEER_F_REPLACE_ALLOWEDIPS
+    assert sizes == [NETLINK_PEER_CHUNK, NETLINK_PEER_CHUNK, 5]
+
+
+'''
+-----------------------------------------------------
+|                 Dump merging                      |
+-----------------------------------------------------
+'''
+
+
+def peer_attrs(public_key: str, *allowed_ips: str, **extra):
+    attrs = [_nla(WGPEER_A_PUBLIC_KEY, base64.b64decode(public_key))]
+    for attr_type, value in extra.values():
+        attrs.append(_nla(attr_type, value))
+    if allowed_ips:
+        attrs.append(_nla_nested(WGPEER_A_ALLOWEDIPS, [_allowed_ip_attr(cidr) for cidr in allowed_ips]))
+    return _parse_attrs(b"".join(attrs))
+
+
+def test_merge_peer_joins_allowed_ips_split_across_messages():
+    peers = {}
+    NetlinkDriver._merge_peer(peers, peer_attrs(
+        key(1), "10.8.0.2/32",
+        rx=(WGPEER_A_RX_BYTES, struct.pack("=Q", 100)), tx=(WGPEER_A_TX_BYTES, struct.pack("=Q", 200))))
+    NetlinkDriver._merge_peer(peers, peer_attrs(key(1), "fd00::2/128"))
+
+    peer = peers[key(1)]
+    assert peer["allowed_ips"] == ["10.8.0.2/32", "fd00::2/128"]
+    assert (peer["rx"], peer["tx"]) == (100, 200)
+    assert peer["endpoint"] == "(none)"
+
+
+def test_merge_peer_reads_preshared_key_and_keepalive():
+    peers = {}
+    NetlinkDriver._merge_peer(peers, peer_attrs(
+        key(1), psk=(WGPEER_A_PRESHARED_KEY, bytes([9]) * 32),
+        keepalive=(WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL, struct.pack("=H", 25))))
+    NetlinkDriver._merge_peer(peers, peer_attrs(
+        key(2), psk=(WGPEER_A_PRESHARED_KEY, bytes(32)),
+        keepalive=(WGPEER_A_PERSISTENT_KEEPALIVE_INTERVAL, struct.pack("=H", 0)),
+        endpoint=(WGPEER_A_ENDPOINT, struct.pack("=H", socket.AF_INET) + struct.pack("!H", 1)
+                  + socket.inet_aton("192.0.2.9") + b"\0" * 8)))
+
+    assert peers[key(1)]["preshared_key"] == key(9)
+    assert peers[key(1)]["persistent_keepalive"] == 25
+    assert peers[key(2)]["preshared_key"] is None
+    assert peers[key(2)]["persistent_keepalive"] is None
+    assert peers[key(2)]["endpoint"] == "192.0.2.9:1"
+
+
+'''
+-----------------------------------------------------
+|                   FakeDriver                      |
+-----------------------------------------------------
+'''
+
+
+def test_fake_driver_set_dump_remove_and_save():
+    driver = FakeDriver()
+
+    async def scenario():
+        await driver.set_peers("wg0", [(key(1), "10.8.0.2/32"), (key(2), "10.8.0.3/32")])
+        await driver.set_peers("wg0", [(key(1), "10.8.0.4/32")])
+        await driver.remove_peers("wg0", [key(2), key(3)])
+        await driver.save("wg0")
+        return await driver.dump("wg0")
+
+    peers = asyncio.run(scenario())
+    assert list(peers) == [key(1)]
+    assert peers[key(1)]["allowed_ips"] == "10.8.0.4/32"
+    assert driver.saves == {"wg0": 1}
+
+    # The dump is a copy, callers cannot change the interface through it
+    peers[key(1)]["rx"] = 5
+    assert asyncio.run(driver.dump("wg0"))[key(1)]["rx"] == 0
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+from app.api.peers.models import PeerAccount, WireGuardPeer
+from app.api.wg_server.models import WGServerConfig
+from app.utils.wg_reconcile import _normalize_allowed_ips, reconcile_interfaces
+
+
+def peer(name, ip):
+    return WireGuardPeer(id=name, user_id="user-1", peer_name=name, public_key=f"{name}-public",
+                         private_key=f"{name}-private", assigned_ip=ip, server_id="server-1")
+
+
+async def seed(db, driver):
+    db.add(WGServerConfig(id="server-1", server_name="test", interface_name="wg-test",
+                          server_ips="10.8.0.1/24", allowed_ips="10.8.0.0/24", listen_port=51820,
+                          private_key="server-private", public_key="server-public"))
+    db.add_all([peer("synced", "10.8.0.2"), peer("drifted", "10.8.0.3"),
+                peer("missing", "10.8.0.4"), peer("disabled", "10.8.0.5")])
+    db.add(PeerAccount(peer_id="disabled", period_start=datetime(2026, 1, 1), disabled_at=datetime(2026, 1, 2)))
+    await db.commit()
+
+    await driver.set_peers("wg-test", [
+        ("synced-public", "10.8.0.2/32"),
+        ("drifted-public", "10.8.0.99/32"),
+        ("disabled-public", "10.8.0.5/32"),
+        ("stranger-public", "10.8.0.77/32"),
+    ])
+
+
+def allowed_ips(driver):
+    return {key: peer["allowed_ips"] for key, peer in driver.interfaces["wg-test"].items()}
+
+
+def test_normalize_allowed_ips():
+    assert _normalize_allowed_ips(None) == ""
+    assert _normalize_allowed_ips("(none)") == ""
+    assert _normalize_allowed_ips("10.8.0.3/32, 10.8.0.2/32") == "10.8.0.2/32,10.8.0.3/32"
+
+
+def test_dry_run_reports_the_delta_without_applying_it(sqlite_db, fake_driver):
+    async def scenario():
+        async with sqlite_db(WGServerConfig, WireGuardPeer, PeerAccount) as db:
+            await seed(db, fake_driver)
+            before = allowed_ips(fake_driver)
+            return before, await reconcile_interfaces(db, dry_run=True)
+
+    before, report = asyncio.run(scenario())
+
+    assert report == [{"interface": "wg-test", "added": 1, "updated": 1, "removed": 2, "dry_run": True}]
+    assert allowed_ips(fake_driver) == before
+
+
+def test_reconcile_converges_the_interface_on_the_database(sqlite_db, fake_driver):
+    async def scenario():
+        async with sqlite_db(WGServerConfig, WireGuardPeer, PeerAccount) as db:
+            await seed(db, fake_driver)
+            first = await reconcile_interfaces(db)
+            second = await reconcile_interfaces(db)
+            return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert first[0]["added"] == 1 and first[0]["updated"] == 1 and first[0]["removed"] == 2
+    # Quota-disabled peers are kept off the interface like orphans
+    assert allowed_ips(fake_driver) == {
+        "synced-public": "10.8.0.2/32",
+        "drifted-public": "10.8.0.3/32",
+        "missing-public": "10.8.0.4/32",
+    }
+    assert (second[0]["added"], second[0]["updated"], second[0]["removed"]) == (0, 0, 0)
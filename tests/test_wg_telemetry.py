@@ -0,0 +1,75 @@
+import time
+
+from app.utils.wg_telemetry import EMPTY_TRANSFER_DATA, TelemetryCache, parse_wg_dump
+
+DUMP = "\n".join([
+    "cHJpdmF0ZQ==\tcHVibGlj\t51820\toff",
+    "peerA=\t(none)\t192.0.2.1:4000\t10.8.0.2/32\t1700000000\t1024\t2048\toff",
+    "peerB=\tcHNr\t(none)\t10.8.0.3/32,fd00::3/128\t0\t0\t0\t25",
+    "truncated\tline",
+])
+
+
+def test_parse_wg_dump_skips_interface_and_short_lines():
+    assert set(parse_wg_dump(DUMP)) == {"peerA=", "peerB="}
+
+
+def test_parse_wg_dump_fields():
+    peers = parse_wg_dump(DUMP)
+    assert peers["peerA="] == {
+        "rx": 1024,
+        "tx": 2048,
+        "latest_handshake": 1700000000,
+        "endpoint": "192.0.2.1:4000",
+        "allowed_ips": "10.8.0.2/32",
+        "preshared_key": None,
+        "persistent_keepalive": None,
+    }
+    assert peers["peerB="]["allowed_ips"] == "10.8.0.3/32,fd00::3/128"
+    assert peers["peerB="]["preshared_key"] == "cHNr"
+    assert peers["peerB="]["persistent_keepalive"] == 25
+    assert peers["peerB="]["latest_handshake"] == 0
+
+
+def test_parse_wg_dump_empty_interface():
+    assert parse_wg_dump("cHJpdmF0ZQ==\tcHVibGlj\t51820\toff\n") == {}
+    assert parse_wg_dump("") == {}
+
+
+'''
+-----------------------------------------------------
+|                 Telemetry cache                   |
+-----------------------------------------------------
+'''
+
+
+def test_cache_starts_empty():
+    cache = TelemetryCache()
+    assert cache.sample_age() is None
+    assert cache.view("peerA=") is EMPTY_TRANSFER_DATA
+    assert cache.get("peerA=") == {**EMPTY_TRANSFER_DATA, "sampled_at": None, "sample_age": None}
+
+
+def test_cache_serves_the_latest_sample():
+    cache = TelemetryCache()
+    cache.update(parse_wg_dump(DUMP))
+
+    assert cache.view("peerA=") == {
+        "rx": 1024, "tx": 2048, "latest_handshake": 1700000000, "endpoint": "192.0.2.1:4000"}
+    # Keys stay out of the response view
+    assert "preshared_key" not in cache.view("peerB=")
+    assert cache.get("peerA=")["sampled_at"] == cache.sampled_at
+    assert 0 <= cache.sample_age() < 5
+    assert cache.view("unknown=") is EMPTY_TRANSFER_DATA
+
+
+def test_online_public_keys_uses_the_handshake_window():
+    now = int(time.time())
+    cache = TelemetryCache()
+    cache.update({
+        "recent=": {"rx": 0, "tx": 0, "latest_handshake": now - 10, "endpoint": "(none)"},
+        "stale=": {"rx": 0, "tx": 0, "latest_handshake": now - 1000, "endpoint": "(none)"},
+        "never=": {"rx": 0, "tx": 0, "latest_handshake": 0, "endpoint": "(none)"},
+        "unparsed=": {"rx": 0, "tx": 0, "latest_handshake": "Never", "endpoint": "(none)"},
+    })
+    assert cache.online_public_keys(180) == {"recent="}